@@ -0,0 +1,232 @@
+import math
+import multiprocessing
+import os
+import numpy as np
+from . import Simulation
+from . import Checkpoint
+from .BatchSimulator import CONTROLLER_PARAMS
+from .Profile import default_profile, sample_profile
+
+# Gain search for FOCController over the reference/load scenario of
+# Simulate.py. The cost of a run is
+#   w_itae   * integral of t * |rpm_ref - rpm_act| dt
+#   w_peak   * max(0, max|Iq| - Imax)
+#   w_ripple * integral of (Te - running mean of Te)^2 dt   (BLDC by default)
+# The running mean is an exponential average over ripple_tau, carried from
+# chunk to chunk, so the chunk size does not change the ripple term.
+# Every term only grows as the run advances, so the cost after any chunk is
+# a lower bound of the final one. Each candidate runs chunk by chunk
+# (Checkpoint.run_segment) and stops as soon as its partial cost exceeds
+# the best complete cost found so far, shared by all worker processes.
+# Non-finite states, |Iq| above diverge_current or a speed error above
+# diverge_error (the rotor running away, usually backwards, which a working
+# loop never does) end the run as diverged (cost inf).
+#
+# The search is a (1 + lambda) evolution strategy in log-gain space: each
+# generation samples a population around the best gains, evaluates it in
+# parallel and widens the step after an improvement, narrows it otherwise.
+#
+#   tuner = Autotuner('BLDC')
+#   result = tuner.run(generations=10, population=8)
+#   result['gains'], result['cost']
+
+TUNABLE = ('Kps', 'Kis', 'KpId', 'KiId', 'KpIq', 'KiIq')
+
+
+def cost_weights(motor_type):
+    return {'itae': 1.0, 'peak': 10.0, 'ripple': 1.0 if motor_type == 'BLDC' else 0.0}
+
+
+class CostAccumulator:
+    # Running cost of one run, fed one history chunk at a time
+
+    def __init__(self, Imax, weights, diverge_current, diverge_error, ripple_tau=0.01):
+        self.Imax = Imax
+        self.weights = weights
+        self.diverge_current = diverge_current
+        self.diverge_error = diverge_error
+        self.itae = 0.0
+        self.peak_Iq = 0.0
+        self.ripple = 0.0
+        self.ripple_tau = ripple_tau
+        self.Te_mean = None
+        self.diverged = False
+
+    def add(self, history, Ts):
+        time = history['time']
+        rpm_act = history['rpm_act']
+        Iq = history['Iq']
+        Te = history['Te']
+        if not (np.all(np.isfinite(rpm_act)) and np.all(np.isfinite(Iq)) and np.all(np.isfinite(Te))):
+            self.diverged = True
+            return
+        error = np.abs(history['rpm_ref'] - rpm_act)
+        self.peak_Iq = max(self.peak_Iq, float(np.max(np.abs(Iq))))
+        if self.peak_Iq > self.diverge_current or np.max(error) > self.diverge_error:
+            self.diverged = True
+            return
+
+        self.itae += float(np.sum(time * error)) * Ts
+        if self.weights['ripple']:
+            # Sample by sample, so the result does not depend on the chunking
+            alpha = 1.0 - math.exp(-Ts / self.ripple_tau)
+            mean = float(Te[0]) if self.Te_mean is None else self.Te_mean
+            ripple = self.ripple
+            for x in Te.tolist():
+                ripple += (x - mean) ** 2 * Ts
+                mean += alpha * (x - mean)
+            self.Te_mean = mean
+            self.ripple = ripple
+
+    @property
+    def cost(self):
+        if self.diverged:
+            return math.inf
+        w = self.weights
+        return (w['itae'] * self.itae + w['peak'] * max(0.0, self.peak_Iq - self.Imax)
+                + w['ripple'] * self.ripple)
+
+
+def evaluate(motor_type, gains, Ts=1e-4, t_end=1.0, profile=None, motor_params=None,
+             controller_params=None, weights=None, chunk=0.02, threshold=None,
+             diverge_factor=10.0, diverge_speed=1.5, engine='auto'):
+    # Cost of one gain set; threshold is a float or a callable returning the
+    # current abort threshold. Returns a dict with cost, status ('done',
+    # 'aborted' or 'diverged'), the cost terms and the simulated time.
+    profile = default_profile if profile is None else profile
+    weights = cost_weights(motor_type) if weights is None else weights
+    params = dict(controller_params or {})
+    params.update(gains)
+
+    motor = Simulation.make_motor(motor_type, Ts, motor_params)
+    controller = Simulation.make_controller(Ts, params)
+    num_steps = int(t_end / Ts)
+    step = max(1, int(round(chunk / Ts)))
+
+    rpm_max = float(np.max(np.abs(sample_profile(profile, Ts, num_steps)[0])))
+    # Diverged at diverge_factor * Imax or a speed error of diverge_speed * max|rpm_ref|
+    acc = CostAccumulator(controller.Imax, weights, diverge_factor * controller.Imax,
+                          diverge_speed * rpm_max)
+
+    status = 'done'
+    start = 0
+    while start < num_steps:
+        stop = min(start + step, num_steps)
+        history = Checkpoint.run_segment(motor, controller, profile, stop * Ts, start, engine, stop)
+        acc.add(history, Ts)
+        start = stop
+        if acc.diverged:
+            status = 'diverged'
+            break
+        limit = threshold() if callable(threshold) else threshold
+        if start < num_steps and limit is not None and acc.cost > limit:
+            status = 'aborted'
+            break
+
+    return {'gains': dict(gains), 'cost': acc.cost, 'status': status, 'itae': acc.itae,
+            'peak_Iq': acc.peak_Iq, 'ripple': acc.ripple, 'simulated': start * Ts}
+
+
+# Per-worker state, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(best, config):
+    _worker['best'] = best
+    _worker['config'] = config
+
+
+def _evaluate(gains):
+    best = _worker['best']
+    result = evaluate(gains=gains, threshold=lambda: best.value, **_worker['config'])
+    if result['status'] == 'done':
+        with best.get_lock():
+            if result['cost'] < best.value:
+                best.value = result['cost']
+    return result
+
+
+class Autotuner:
+    def __init__(self, motor_type='BLAC', Ts=1e-4, t_end=1.0, profile=None, gains=TUNABLE,
+                 initial=None, bounds=None, motor_params=None, controller_params=None,
+                 weights=None, chunk=0.02, diverge_factor=10.0, diverge_speed=1.5, engine='auto',
+                 processes=None, seed=None):
+        for name in gains:
+            if name not in CONTROLLER_PARAMS:
+                raise ValueError(f"Unknown controller parameter '{name}'")
+        self.motor_type = motor_type
+        self.gains = tuple(gains)
+        self.processes = processes or os.cpu_count() or 1
+        self.rng = np.random.default_rng(seed)
+
+        defaults = Simulation.make_controller(Ts, controller_params)
+        self.initial = {name: float((initial or {}).get(name, getattr(defaults, name))) for name in self.gains}
+        # Search range per gain, by default two decades either side
+        bounds = bounds or {}
+        self.bounds = {name: bounds.get(name, (self.initial[name] / 100.0, self.initial[name] * 100.0))
+                       for name in self.gains}
+
+        self.config = {
+            'motor_type': motor_type, 'Ts': Ts, 't_end': t_end, 'profile': profile,
+            'motor_params': motor_params, 'controller_params': controller_params,
+            'weights': cost_weights(motor_type) if weights is None else weights,
+            'chunk': chunk, 'diverge_factor': diverge_factor, 'diverge_speed': diverge_speed,
+            'engine': engine,
+        }
+
+    def sample(self, center, sigma, n):
+        # n gain sets, log-normal around center and clipped to the bounds
+        log_center = np.log([center[name] for name in self.gains])
+        lo = np.log([self.bounds[name][0] for name in self.gains])
+        hi = np.log([self.bounds[name][1] for name in self.gains])
+        logs = np.clip(log_center + sigma * self.rng.standard_normal((n, len(self.gains))), lo, hi)
+        return [dict(zip(self.gains, np.exp(row).tolist())) for row in logs]
+
+    def run(self, generations=10, population=8, sigma=0.3, verbose=False):
+        # Returns the best gains and cost plus every evaluation made
+        best = multiprocessing.Value('d', math.inf)
+        initargs = (best, self.config)
+        _init_worker(*initargs)
+        first = _evaluate(dict(self.initial))
+        if first['status'] != 'done':
+            raise ValueError("The initial gains diverge")
+        best_result = first
+        evaluations = [first]
+
+        pool = None
+        if self.processes > 1:
+            pool = multiprocessing.Pool(self.processes, _init_worker, initargs)
+        try:
+            for generation in range(generations):
+                candidates = self.sample(best_result['gains'], sigma, population)
+                results = pool.map(_evaluate, candidates) if pool else [_evaluate(c) for c in candidates]
+                evaluations.extend(results)
+
+                done = [r for r in results if r['status'] == 'done']
+                winner = min(done, key=lambda r: r['cost']) if done else None
+                if winner is not None and winner['cost'] < best_result['cost']:
+                    best_result = winner
+                    sigma *= 1.5
+                else:
+                    sigma *= 0.6
+
+                if verbose:
+                    counts = {s: sum(r['status'] == s for r in results) for s in ('done', 'aborted', 'diverged')}
+                    print(f"Generation {generation + 1}: best cost {best_result['cost']:.6g}, "
+                          f"sigma {sigma:.3g}, {counts}")
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            _worker.clear()
+
+        full = self.config['t_end']
+        simulated = sum(r['simulated'] for r in evaluations)
+        return {
+            'gains': best_result['gains'], 'cost': best_result['cost'], 'best': best_result,
+            'evaluations': evaluations,
+            'aborted': sum(r['status'] == 'aborted' for r in evaluations),
+            'diverged': sum(r['status'] == 'diverged' for r in evaluations),
+            # Simulated time as a fraction of running every candidate to t_end
+            'work_fraction': simulated / (full * len(evaluations)),
+        }
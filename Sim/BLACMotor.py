@@ -1,8 +1,9 @@
 import math
-import Transforms
+from . import Transforms
+from . import Integrators
 
 class BLACMotor:
-    def __init__(self, Ts):
+    def __init__(self, Ts, integrator='euler'):
         self.Ts = Ts
         self.Npp = 21.0
         self.Rs = 4.485
@@ -19,14 +20,42 @@ class BLACMotor:
         self.theta = 0.0
         self.theta_e = 0.0
 
+        # 'euler' is the step below; see Integrators for the others
+        self.integrator = Integrators.check_integrator(integrator)
+        self.rtol = 1e-6
+        self.atol = 1e-6
+        self.h_adapt = Ts
+        # rk45 gives up (RuntimeError) below this step size
+        self.h_min = Ts * 1e-8
+        self.evaluations = 0
+        # Speed grid (rad/s electrical) of the 'zoh_table' discretization cache
+        self.We_step = 1.0
+        self.zoh_cache = None
+
+    def back_emf_dq(self, theta_e, We, cos_t=None, sin_t=None):
+        return 0.0, We * self.Lambda_m
+
+    def rl_discretization(self, We, h):
+        return Integrators.rl_discretization(self, We, h)
+
+    def advance(self, Va, Vb, Vc, Tload, dt):
+        # Integrates over an arbitrary dt with the selected integrator
+        return Integrators.advance(self, Va, Vb, Vc, Tload, dt)
+
     def physics_step(self, Va, Vb, Vc, Tload, Ia, Ib, Ic):
+        if self.integrator != 'euler':
+            # Integrated from the motor's own dq state, Ia/Ib/Ic are not needed
+            return Integrators.physics_step(self, Va, Vb, Vc, Tload)
+
         We = self.Npp * self.Wr
         self.theta_e = self.Npp * self.theta
         self.theta_e = self.theta_e % (2 * math.pi)
+        cos_t = math.cos(self.theta_e)
+        sin_t = math.sin(self.theta_e)
 
-        Vd_ref, Vq_ref = Transforms.abc_to_dq(Va, Vb, Vc, self.theta_e)
+        Vd_ref, Vq_ref = Transforms.abc_to_dq_cs(Va, Vb, Vc, cos_t, sin_t)
         
-        Id_meas, Iq_meas = Transforms.abc_to_dq(Ia, Ib, Ic, self.theta_e)
+        Id_meas, Iq_meas = Transforms.abc_to_dq_cs(Ia, Ib, Ic, cos_t, sin_t)
 
         ed = 0.0
         eq = We * self.Lambda_m
@@ -1,9 +1,12 @@
 import math
-import Transforms
+from . import Transforms
+from . import Integrators
 
 class BLDCMotor:
-    def __init__(self, Ts):
+    def __init__(self, Ts, emf_table=None, integrator='euler'):
         self.Ts = Ts
+        # Optional BackEMF.BackEMFTable; None keeps the analytic trapezoid
+        self.emf_table = emf_table
         self.Npp = 21.0
         self.Rs = 4.485
         self.Ld = 0.0548
@@ -19,6 +22,18 @@ class BLDCMotor:
         self.theta = 0.0
         self.theta_e = 0.0
 
+        # 'euler' is the step below; see Integrators for the others
+        self.integrator = Integrators.check_integrator(integrator)
+        self.rtol = 1e-6
+        self.atol = 1e-6
+        self.h_adapt = Ts
+        # rk45 gives up (RuntimeError) below this step size
+        self.h_min = Ts * 1e-8
+        self.evaluations = 0
+        # Speed grid (rad/s electrical) of the 'zoh_table' discretization cache
+        self.We_step = 1.0
+        self.zoh_cache = None
+
     def _trapezoidal_shape(self, theta):
         t = theta % (2 * math.pi)
         pi = math.pi
@@ -34,20 +49,44 @@ class BLDCMotor:
         else:
             return -1.0 + (t - 11*pi/6) * (6/pi) # -1 to 0
 
+    def back_emf_dq(self, theta_e, We, cos_t=None, sin_t=None):
+        E_mag = We * self.Lambda_m
+
+        if self.emf_table is not None:
+            ed_pu, eq_pu = self.emf_table.dq(theta_e)
+            return E_mag * ed_pu, E_mag * eq_pu
+
+        if cos_t is None:
+            cos_t = math.cos(theta_e)
+            sin_t = math.sin(theta_e)
+
+        ea = -E_mag * self._trapezoidal_shape(theta_e)
+        eb = -E_mag * self._trapezoidal_shape(theta_e - 2*math.pi/3)
+        ec = -E_mag * self._trapezoidal_shape(theta_e + 2*math.pi/3)
+
+        return Transforms.abc_to_dq_cs(ea, eb, ec, cos_t, sin_t)
+
+    def rl_discretization(self, We, h):
+        return Integrators.rl_discretization(self, We, h)
+
+    def advance(self, Va, Vb, Vc, Tload, dt):
+        # Integrates over an arbitrary dt with the selected integrator
+        return Integrators.advance(self, Va, Vb, Vc, Tload, dt)
+
     def physics_step(self, Va, Vb, Vc, Tload, Ia, Ib, Ic):
+        if self.integrator != 'euler':
+            # Integrated from the motor's own dq state, Ia/Ib/Ic are not needed
+            return Integrators.physics_step(self, Va, Vb, Vc, Tload)
+
         We = self.Npp * self.Wr
         self.theta_e = self.Npp * self.theta
         self.theta_e = self.theta_e % (2 * math.pi)
+        cos_t = math.cos(self.theta_e)
+        sin_t = math.sin(self.theta_e)
 
-        E_mag = We * self.Lambda_m
-        
-        ea = -E_mag * self._trapezoidal_shape(self.theta_e)
-        eb = -E_mag * self._trapezoidal_shape(self.theta_e - 2*math.pi/3)
-        ec = -E_mag * self._trapezoidal_shape(self.theta_e + 2*math.pi/3)
-        
-        ed, eq = Transforms.abc_to_dq(ea, eb, ec, self.theta_e)
-        Vd_ref, Vq_ref = Transforms.abc_to_dq(Va, Vb, Vc, self.theta_e)
-        Id_meas, Iq_meas = Transforms.abc_to_dq(Ia, Ib, Ic, self.theta_e)
+        ed, eq = self.back_emf_dq(self.theta_e, We, cos_t, sin_t)
+        Vd_ref, Vq_ref = Transforms.abc_to_dq_cs(Va, Vb, Vc, cos_t, sin_t)
+        Id_meas, Iq_meas = Transforms.abc_to_dq_cs(Ia, Ib, Ic, cos_t, sin_t)
 
         dId = (1.0/self.Ld) * (Vd_ref - self.Rs*Id_meas + We*self.Lq*Iq_meas - ed)
         dIq = (1.0/self.Lq) * (Vq_ref - self.Rs*Iq_meas - We*self.Ld*Id_meas - eq)
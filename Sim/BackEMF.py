@@ -0,0 +1,131 @@
+import math
+import numpy as np
+from . import Transforms
+
+def trapezoidal_shape(theta):
+    # Vectorized BLDCMotor._trapezoidal_shape
+    t = np.mod(theta, 2 * math.pi)
+    pi = math.pi
+
+    return np.select(
+        [t < pi/6, t < 5*pi/6, t < 7*pi/6, t < 11*pi/6],
+        [t * (6/pi), 1.0, 1.0 - (t - 5*pi/6) * (6/pi), -1.0],
+        -1.0 + (t - 11*pi/6) * (6/pi)
+    )
+
+def sinusoidal_shape(theta):
+    return np.sin(theta)
+
+class BackEMFTable:
+    # Lookup tables of a per-phase back-EMF shape and of its dq projection,
+    # indexed by electrical angle and linearly interpolated.
+    #
+    # The shape follows BLDCMotor: ea = -We * Lambda_m * shape(theta_e), with
+    # phases b and c shifted by -/+ 2*pi/3. ed and eq are per unit of
+    # We * Lambda_m, so a sinusoidal shape gives ed = 0 and eq = 1.
+
+    def __init__(self, shape_fn, size=1200):
+        if size < 3:
+            raise ValueError("size must be at least 3")
+
+        self.size = size
+        self.step = 2 * math.pi / size
+        self.inv_step = size / (2 * math.pi)
+
+        # One extra point closes the period so index i+1 is always valid
+        self.theta = np.arange(size + 1) * self.step
+
+        shape = np.asarray(shape_fn(self.theta), dtype=float)
+        ea = -shape
+        eb = -np.asarray(shape_fn(self.theta - 2*math.pi/3), dtype=float)
+        ec = -np.asarray(shape_fn(self.theta + 2*math.pi/3), dtype=float)
+        ed, eq = Transforms.abc_to_dq(ea, eb, ec, self.theta)
+
+        # Force exact periodicity of the closing point
+        for table in (shape, ed, eq):
+            table[-1] = table[0]
+
+        self.shape_table = shape
+        self.ed_table = ed
+        self.eq_table = eq
+
+        # Python lists are faster than NumPy indexing for the scalar path
+        self._shape_list = shape.tolist()
+        self._ed_list = ed.tolist()
+        self._eq_list = eq.tolist()
+
+    @classmethod
+    def trapezoidal(cls, size=1200):
+        # size is a multiple of 12 so every corner sits on a table point
+        if size % 12 != 0:
+            raise ValueError("size must be a multiple of 12")
+        return cls(trapezoidal_shape, size)
+
+    @classmethod
+    def sinusoidal(cls, size=1200):
+        return cls(sinusoidal_shape, size)
+
+    @classmethod
+    def from_fourier(cls, sin_coeffs, cos_coeffs=None, size=1200):
+        # shape(theta) = sum_n sin_coeffs[n-1]*sin(n*theta) + cos_coeffs[n-1]*cos(n*theta)
+        sin_coeffs = np.asarray(sin_coeffs, dtype=float)
+        cos_coeffs = np.zeros_like(sin_coeffs) if cos_coeffs is None else np.asarray(cos_coeffs, dtype=float)
+        if sin_coeffs.shape != cos_coeffs.shape:
+            raise ValueError("sin_coeffs and cos_coeffs must have the same length")
+        harmonics = np.arange(1, len(sin_coeffs) + 1)
+
+        def shape_fn(theta):
+            angles = np.multiply.outer(theta, harmonics)
+            return np.sin(angles) @ sin_coeffs + np.cos(angles) @ cos_coeffs
+
+        return cls(shape_fn, size)
+
+    @classmethod
+    def from_samples(cls, theta, values, scale=1.0, size=1200):
+        # Samples of one electrical period, e.g. a measured phase back-EMF.
+        # shape = values / scale; use scale = -Lambda_m for a measured EMF
+        # constant in V/(rad/s) with the sign convention above.
+        theta = np.asarray(theta, dtype=float)
+        values = np.asarray(values, dtype=float) / scale
+        if theta.shape != values.shape or theta.ndim != 1:
+            raise ValueError("theta and values must be 1-D arrays of the same length")
+
+        def shape_fn(angle):
+            return np.interp(np.mod(angle, 2 * math.pi), theta, values, period=2 * math.pi)
+
+        return cls(shape_fn, size)
+
+    @classmethod
+    def from_csv(cls, path, theta_col=0, value_col=1, scale=1.0, degrees=False,
+                 delimiter=',', skip_header=1, size=1200):
+        data = np.genfromtxt(path, delimiter=delimiter, skip_header=skip_header)
+        theta = data[:, theta_col]
+        if degrees:
+            theta = np.radians(theta)
+        return cls.from_samples(theta, data[:, value_col], scale, size)
+
+    def _locate(self, theta):
+        x = (theta % (2 * math.pi)) * self.inv_step
+        i = int(x)
+        if i >= self.size:
+            i = self.size - 1
+        return i, x - i
+
+    def shape(self, theta):
+        i, frac = self._locate(theta)
+        table = self._shape_list
+        return table[i] + frac * (table[i + 1] - table[i])
+
+    def dq(self, theta):
+        # (ed, eq) per unit of We * Lambda_m
+        i, frac = self._locate(theta)
+        ed = self._ed_list
+        eq = self._eq_list
+        return ed[i] + frac * (ed[i + 1] - ed[i]), eq[i] + frac * (eq[i + 1] - eq[i])
+
+    def shape_array(self, theta):
+        return np.interp(np.mod(theta, 2 * math.pi), self.theta, self.shape_table)
+
+    def dq_array(self, theta):
+        t = np.mod(theta, 2 * math.pi)
+        return np.interp(t, self.theta, self.ed_table), np.interp(t, self.theta, self.eq_table)
@@ -0,0 +1,260 @@
+import math
+import numpy as np
+from . import Transforms
+from .BackEMF import trapezoidal_shape
+from .BLACMotor import BLACMotor
+from .BLDCMotor import BLDCMotor
+from .FOCController import FOCController
+from .Profile import default_profile
+from .SimulationResult import SimulationResult
+
+MOTOR_PARAMS = ('Npp', 'Rs', 'Ld', 'Lq', 'Lambda_m', 'Bn', 'J', 'Tc')
+CONTROLLER_PARAMS = ('Imax', 'Kps', 'Kis', 'KpId', 'KiId', 'KpIq', 'KiIq')
+
+MOTOR_STATES = ('Id', 'Iq', 'Wr', 'theta', 'theta_e')
+CONTROLLER_STATES = ('Ui_s', 'Ui_Id', 'Ui_Iq')
+
+
+class BatchSimulator:
+    # Advances N independent motor + FOC controller + inverter chains in
+    # lockstep. Every parameter may be a scalar or an array of length N.
+
+    def __init__(self, Ts, N, motor_type='BLAC', motor_params=None,
+                 controller_params=None, profile=None, emf_table=None, sensors=None):
+        self.Ts = Ts
+        self.N = N
+        # Optional BackEMF.BackEMFTable for the BLDC members
+        self.emf_table = emf_table
+        # Optional SensorModel.BatchSensorModel; None measures ideally
+        self.sensors = sensors
+        if sensors is not None and sensors.N != N:
+            raise ValueError("sensors must model one channel set per batch member")
+        self.profile = profile if profile is not None else default_profile
+
+        if isinstance(motor_type, str):
+            motor_type = [motor_type] * N
+        if len(motor_type) != N:
+            raise ValueError("motor_type must have one entry per batch member")
+        for name in motor_type:
+            if name not in ('BLAC', 'BLDC'):
+                raise ValueError("Invalid motor type")
+        self.motor_type = list(motor_type)
+        self.is_bldc = np.array([name == 'BLDC' for name in self.motor_type])
+
+        # Defaults come from the scalar classes so both paths share one source
+        motor_defaults = BLACMotor(Ts)
+        controller_defaults = FOCController(Ts)
+
+        motor_params = dict(motor_params or {})
+        controller_params = dict(controller_params or {})
+        for name in motor_params:
+            if name not in MOTOR_PARAMS:
+                raise ValueError(f"Unknown motor parameter '{name}'")
+        for name in controller_params:
+            if name not in CONTROLLER_PARAMS:
+                raise ValueError(f"Unknown controller parameter '{name}'")
+
+        for name in MOTOR_PARAMS:
+            value = motor_params.get(name, getattr(motor_defaults, name))
+            setattr(self, name, self._per_instance(value))
+        for name in CONTROLLER_PARAMS:
+            value = controller_params.get(name, getattr(controller_defaults, name))
+            setattr(self, name, self._per_instance(value))
+
+        for name in MOTOR_STATES + CONTROLLER_STATES:
+            setattr(self, name, np.zeros(N))
+
+        # Scratch buffers reused by the frame transforms on every step
+        self._cs = (np.empty(N), np.empty(N))
+        self._abc = (np.empty(N), np.empty(N), np.empty(N))
+        self._Vabc = (np.empty(N), np.empty(N), np.empty(N))
+        self._dq = (np.empty(N), np.empty(N))
+        self._Vdq = (np.empty(N), np.empty(N))
+        self._edq = (np.empty(N), np.empty(N))
+        self._work = (np.empty(N), np.empty(N))
+
+    def _per_instance(self, value):
+        return np.array(np.broadcast_to(np.asarray(value, dtype=float), (self.N,)))
+
+    @classmethod
+    def from_objects(cls, motors, controllers, profile=None, emf_table=None):
+        if len(motors) != len(controllers):
+            raise ValueError("motors and controllers must have the same length")
+
+        Ts = motors[0].Ts
+        for obj in list(motors) + list(controllers):
+            if obj.Ts != Ts:
+                raise ValueError("All batch members must share the same Ts")
+        for controller in controllers:
+            if controller.Ts_speed != Ts:
+                raise ValueError("BatchSimulator runs the speed loop every step")
+
+        motor_type = []
+        for motor in motors:
+            if motor.integrator != 'euler':
+                raise ValueError("BatchSimulator only implements the 'euler' integrator")
+            if isinstance(motor, BLDCMotor):
+                motor_type.append('BLDC')
+            elif isinstance(motor, BLACMotor):
+                motor_type.append('BLAC')
+            else:
+                raise ValueError("Invalid motor type")
+
+        motor_params = {name: [getattr(m, name) for m in motors] for name in MOTOR_PARAMS}
+        controller_params = {name: [getattr(c, name) for c in controllers] for name in CONTROLLER_PARAMS}
+
+        batch = cls(Ts, len(motors), motor_type, motor_params, controller_params, profile, emf_table)
+        for name in MOTOR_STATES:
+            setattr(batch, name, np.array([getattr(m, name) for m in motors], dtype=float))
+        for name in CONTROLLER_STATES:
+            setattr(batch, name, np.array([getattr(c, name) for c in controllers], dtype=float))
+
+        return batch
+
+    def scatter(self, motors, controllers):
+        # Writes the batch state back into the scalar objects
+        for i, motor in enumerate(motors):
+            for name in MOTOR_STATES:
+                setattr(motor, name, float(getattr(self, name)[i]))
+        for i, controller in enumerate(controllers):
+            for name in CONTROLLER_STATES:
+                setattr(controller, name, float(getattr(self, name)[i]))
+
+    def step(self, RPMref, Tload, Vbus):
+        Ts = self.Ts
+        work = self._work
+
+        # ---------------------------------------------------------
+        # 1. SENSORING STEP
+        # ---------------------------------------------------------
+        cos_e, sin_e = Transforms.cos_sin(self.theta_e, out=self._cs)
+        Ia, Ib, Ic = Transforms.dq_to_abc_cs(self.Id, self.Iq, cos_e, sin_e, out=self._abc, work=work)
+        if self.sensors is None:
+            Ia_meas, Ib_meas, Ic_meas = Ia, Ib, Ic
+            Wr_meas = self.Wr
+        else:
+            # The controller sees the readings, the motor keeps the true currents
+            Ia_meas, Ib_meas, Ic_meas, theta_meas, Wr_meas = self.sensors.sample(self, Ia, Ib, Ic)
+            cos_e, sin_e = Transforms.cos_sin(theta_meas)
+
+        # ---------------------------------------------------------
+        # 2. CONTROLLER STEP
+        # ---------------------------------------------------------
+        Id, Iq = Transforms.abc_to_dq_cs(Ia_meas, Ib_meas, Ic_meas, cos_e, sin_e, out=self._dq, work=work)
+
+        error_speed = (RPMref * 2 * math.pi / 60.0) - Wr_meas
+        Up_s = self.Kps * error_speed
+        self.Ui_s = self.Ui_s + (self.Kis * Ts * error_speed)
+        Iq_ref = Up_s + self.Ui_s
+
+        err_Iq = Iq_ref - Iq
+        Up_Iq = self.KpIq * err_Iq
+        self.Ui_Iq = self.Ui_Iq + (self.KiIq * Ts * err_Iq)
+        Vq_ref = Up_Iq + self.Ui_Iq
+
+        err_Id = 0.0 - Id
+        Up_Id = self.KpId * err_Id
+        self.Ui_Id = self.Ui_Id + (self.KiId * Ts * err_Id)
+        Vd_ref = Up_Id + self.Ui_Id
+
+        Va, Vb, Vc = Transforms.dq_to_abc_cs(Vd_ref, Vq_ref, cos_e, sin_e, out=self._Vabc, work=work)
+
+        # ---------------------------------------------------------
+        # 3. INVERTER STEP
+        # ---------------------------------------------------------
+        limit = np.asarray(Vbus, dtype=float) / 2.0
+        for V in (Va, Vb, Vc):
+            np.minimum(limit, V, out=V)
+            np.maximum(-limit, V, out=V)
+
+        # ---------------------------------------------------------
+        # 4. MOTOR PHYSICS STEP
+        # ---------------------------------------------------------
+        We = self.Npp * self.Wr
+        theta_e = np.mod(self.Npp * self.theta, 2 * math.pi)
+        self.theta_e = theta_e
+        cos_e, sin_e = Transforms.cos_sin(theta_e, out=self._cs)
+
+        ed = np.zeros(self.N)
+        eq = We * self.Lambda_m
+        if self.is_bldc.any():
+            E_mag = We * self.Lambda_m
+            if self.emf_table is None:
+                # All three phases in one call
+                shapes = trapezoidal_shape(np.stack((theta_e, theta_e - 2*math.pi/3, theta_e + 2*math.pi/3)))
+                shapes *= -E_mag
+                ed_bldc, eq_bldc = Transforms.abc_to_dq_cs(shapes[0], shapes[1], shapes[2], cos_e, sin_e,
+                                                           out=self._edq, work=work)
+            else:
+                ed_bldc, eq_bldc = self.emf_table.dq_array(theta_e)
+                ed_bldc *= E_mag
+                eq_bldc *= E_mag
+            ed = np.where(self.is_bldc, ed_bldc, ed)
+            eq = np.where(self.is_bldc, eq_bldc, eq)
+
+        Vd, Vq = Transforms.abc_to_dq_cs(Va, Vb, Vc, cos_e, sin_e, out=self._Vdq, work=work)
+        Id_meas, Iq_meas = Transforms.abc_to_dq_cs(Ia, Ib, Ic, cos_e, sin_e, out=self._dq, work=work)
+
+        dId = (1.0/self.Ld) * (Vd - self.Rs*Id_meas + We*self.Lq*Iq_meas - ed)
+        dIq = (1.0/self.Lq) * (Vq - self.Rs*Iq_meas - We*self.Ld*Id_meas - eq)
+
+        Id_next = Id_meas + Ts * dId
+        Iq_next = Iq_meas + Ts * dIq
+
+        high_speed = np.abs(We) > 1e-3
+        We_safe = np.where(high_speed, We, 1.0)
+        Te = np.where(
+            high_speed,
+            1.5 * self.Npp * (ed * Id_next + eq * Iq_next) / We_safe +
+            1.5 * self.Npp * (self.Ld - self.Lq) * Id_next * Iq_next,
+            1.5 * self.Npp * self.Lambda_m * Iq_next
+        )
+
+        Tc_dir = np.sign(self.Wr) * self.Tc
+
+        accel = (Te - Tload - (self.Bn * self.Wr) - Tc_dir) / self.J
+        self.Wr = self.Wr + accel * Ts
+
+        self.theta = np.mod(self.theta + self.Wr * Ts, 2*math.pi)
+
+        self.Id = Id_next
+        self.Iq = Iq_next
+
+        return Te
+
+    def run(self, t_end, verbose=False):
+        # A SimulationResult with members=N: history[key][i] is batch member i
+        num_steps = int(t_end / self.Ts)
+        N = self.N
+        history = SimulationResult(self.Ts, num_steps, 0, self.Npp, members=N)
+
+        if verbose:
+            print(f"Starting batched simulation of {N} motors...")
+
+        # Profiles that can be sampled are evaluated for the whole run up front;
+        # anything else is called every step and its values kept as rows
+        profile = self.profile
+        sampled = hasattr(profile, 'sample')
+        if sampled:
+            samples = profile.sample(self.Ts, num_steps)
+        else:
+            samples = tuple(np.zeros((num_steps, N)) for _ in range(3))
+
+        for k in range(num_steps):
+            if sampled:
+                RPMref, Tload, V_bus = samples[0][k], samples[1][k], samples[2][k]
+            else:
+                RPMref, Tload, V_bus = profile(k * self.Ts)
+                for row, value in zip(samples, (RPMref, Tload, V_bus)):
+                    row[k] = value
+
+            Te = self.step(RPMref, Tload, V_bus)
+
+            history.record_members(k, self.Wr, self.Iq, self.Id, Te, self.theta)
+
+        history.set_inputs(*(np.broadcast_to(x if x.ndim == 2 else x[:, None], (num_steps, N)) for x in samples))
+        return history
+
+    def split(self, history):
+        # One single-run SimulationResult per batch member
+        return [history.member(i) for i in range(self.N)]
@@ -0,0 +1,236 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+import numpy as np
+from . import Transforms
+from .BLACMotor import BLACMotor
+from .BLDCMotor import BLDCMotor
+from .FOCController import FOCController
+from .Inverter import Inverter
+from .BatchSimulator import BatchSimulator
+from . import FastKernel
+from . import Simulation
+
+# Throughput of the hot-path pieces on their own and of the full loop, in
+# steps per second. Every benchmark is a setup function returning
+# (run, steps): run() performs `steps` steps and is timed best-of-repeat
+# after one untimed warm-up call (which also triggers Numba compilation).
+#
+#   python -m Sim.Benchmark --output baseline.json
+#   python -m Sim.Benchmark --baseline baseline.json --threshold 0.1
+
+
+def _inputs(n, seed=0):
+    # Representative operating points: currents of a few amps, any angle
+    rng = np.random.default_rng(seed)
+    Ia, Ib = rng.uniform(-8.0, 8.0, (2, n))
+    theta = rng.uniform(0.0, 2*math.pi, n)
+    return Ia.tolist(), Ib.tolist(), (-(Ia + Ib)).tolist(), theta.tolist()
+
+
+def _bench_abc_to_dq(n):
+    Ia, Ib, Ic, theta = _inputs(n)
+
+    def run():
+        for k in range(n):
+            Transforms.abc_to_dq(Ia[k], Ib[k], Ic[k], theta[k])
+    return run, n
+
+
+def _bench_dq_to_abc(n):
+    Id, Iq, _, theta = _inputs(n)
+
+    def run():
+        for k in range(n):
+            Transforms.dq_to_abc(Id[k], Iq[k], theta[k])
+    return run, n
+
+
+def _bench_trapezoidal_shape(n):
+    motor = BLDCMotor(1e-4)
+    _, _, _, theta = _inputs(n)
+
+    def run():
+        for k in range(n):
+            motor._trapezoidal_shape(theta[k])
+    return run, n
+
+
+def _bench_physics_step(motor_type, n):
+    def run():
+        motor = BLACMotor(1e-4) if motor_type == 'BLAC' else BLDCMotor(1e-4)
+        # Fixed voltages with the motor's own phase currents fed back: the
+        # rotor swings into the voltage vector and settles around it, so both
+        # torque branches (|We| above and below 1e-3) are hit. The feedback
+        # transform is timed too, as Sensors.measure is in the real loop
+        for k in range(n):
+            Ia, Ib, Ic = Transforms.dq_to_abc(motor.Id, motor.Iq, (motor.Npp * motor.theta) % (2 * math.pi))
+            motor.physics_step(0.0, -30.0, 30.0, 0.0, Ia, Ib, Ic)
+    return run, n
+
+
+def _bench_control_step(n):
+    Ia, Ib, Ic, theta = _inputs(n)
+
+    def run():
+        controller = FOCController(1e-4)
+        for k in range(n):
+            controller.control_step(40.0, 4.0, Ia[k], Ib[k], Ic[k], theta[k], 311.0)
+    return run, n
+
+
+def _bench_inverter_step(n):
+    # Half of the references exceed Vbus/2 and get clamped
+    rng = np.random.default_rng(0)
+    Va, Vb, Vc = rng.uniform(-311.0, 311.0, (3, n)).tolist()
+    inverter = Inverter()
+
+    def run():
+        for k in range(n):
+            inverter.step(Va[k], Vb[k], Vc[k], 311.0)
+    return run, n
+
+
+def _bench_run_simulation(motor_type, t_end, engine):
+    steps = int(t_end / 1e-4)
+
+    def run():
+        Simulation.run_simulation(motor_type, 1e-4, t_end, engine=engine)
+    return run, steps
+
+
+def _bench_batch(motor_type, N, t_end):
+    steps = int(t_end / 1e-4)
+
+    def run():
+        batch = BatchSimulator(1e-4, N, motor_type)
+        batch.run(t_end)
+    # Throughput counts motor-steps, so batches compare against scalar runs
+    return run, steps * N
+
+
+def benchmarks(quick=False):
+    # name -> setup; quick shortens every scenario ~10x for smoke runs
+    n = 2000 if quick else 20000
+    scale = 0.1 if quick else 1.0
+    suite = {
+        'transforms.abc_to_dq': lambda: _bench_abc_to_dq(n),
+        'transforms.dq_to_abc': lambda: _bench_dq_to_abc(n),
+        'bldc.trapezoidal_shape': lambda: _bench_trapezoidal_shape(n),
+        'blac.physics_step': lambda: _bench_physics_step('BLAC', n),
+        'bldc.physics_step': lambda: _bench_physics_step('BLDC', n),
+        'controller.control_step': lambda: _bench_control_step(n),
+        'inverter.step': lambda: _bench_inverter_step(n),
+    }
+    for motor_type in ('BLAC', 'BLDC'):
+        for t_end in (0.1 * scale, 1.0 * scale):
+            suite[f'run_simulation.{motor_type}.objects.{t_end:g}s'] = (
+                lambda m=motor_type, t=t_end: _bench_run_simulation(m, t, 'objects'))
+            suite[f'run_simulation.{motor_type}.dq.{t_end:g}s'] = (
+                lambda m=motor_type, t=t_end: _bench_run_simulation(m, t, 'dq'))
+            if FastKernel.HAVE_NUMBA:
+                suite[f'run_simulation.{motor_type}.fast.{t_end:g}s'] = (
+                    lambda m=motor_type, t=t_end: _bench_run_simulation(m, t, 'fast'))
+        for N in (1, 64, 1024):
+            suite[f'batch.{motor_type}.N{N}'] = (
+                lambda m=motor_type, N=N: _bench_batch(m, N, 0.1 * scale))
+    return suite
+
+
+def machine_info():
+    info = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'numba': None,
+    }
+    if FastKernel.HAVE_NUMBA:
+        import numba
+        info['numba'] = numba.__version__
+    return info
+
+
+def run_benchmarks(names=None, repeat=3, quick=False, verbose=False):
+    # Returns {'machine': ..., 'results': {name: {...}}}; names filters by substring
+    suite = benchmarks(quick)
+    results = {}
+    for name, setup in suite.items():
+        if names and not any(pattern in name for pattern in names):
+            continue
+        run, steps = setup()
+        run()
+        best = math.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        results[name] = {'steps': steps, 'seconds': best, 'steps_per_s': steps / best}
+        if verbose:
+            print(f"{name:40s} {steps / best:14,.0f} steps/s")
+
+    return {
+        'machine': machine_info(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'quick': quick,
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=0.1):
+    # Benchmarks whose throughput dropped by more than threshold (a fraction)
+    # relative to baseline, as (name, baseline steps/s, current steps/s, change)
+    regressions = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['steps_per_s']
+        after = result['steps_per_s']
+        change = after / before - 1.0
+        if change < -threshold:
+            regressions.append((name, before, after, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulator throughput benchmarks")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="allowed throughput drop before flagging a regression (default 0.1)")
+    parser.add_argument('--filter', action='append', help="only run benchmarks containing this text")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--quick', action='store_true', help="shorter scenarios for smoke runs")
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(args.filter, args.repeat, args.quick, verbose=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('machine') != current['machine']:
+            print("Warning: baseline was recorded on a different machine")
+        regressions = compare(current, baseline, args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before:,.0f} -> {after:,.0f} steps/s ({100 * change:+.1f}%)")
+        if regressions:
+            return 1
+        print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import copy
+import multiprocessing
+import os
+from .Inverter import Inverter
+from .Sensors import Sensors
+from .BatchSimulator import MOTOR_STATES, CONTROLLER_STATES
+from .Profile import default_profile
+from .SimulationResult import SimulationResult
+from . import FastKernel
+from . import Simulation
+
+# Snapshot, restore and fork of a running simulation. A Snapshot holds
+# copies of the motor and controller (their state is a handful of floats)
+# plus the step index, which is also the profile position since profiles
+# are evaluated at t = k * Ts. Resuming from a snapshot gives bit-for-bit
+# the same samples as the uninterrupted run.
+#
+#   snap, prefix = run_prefix('BLAC', 0.2)
+#   histories = fork(snap, [Profile(...), ...], t_end=1.0, prefix=prefix)
+
+
+class Snapshot:
+    def __init__(self, motor, controller, step):
+        self.motor = copy.copy(motor)
+        self.controller = copy.copy(controller)
+        self.step = step
+
+    @property
+    def time(self):
+        return self.step * self.motor.Ts
+
+    def state(self):
+        # The dynamic state as a flat dict
+        state = {name: getattr(self.motor, name) for name in MOTOR_STATES}
+        state.update({name: getattr(self.controller, name) for name in CONTROLLER_STATES})
+        state['step'] = self.step
+        return state
+
+    def restore(self):
+        # Fresh (motor, controller) copies in the snapshot state, so one
+        # snapshot can be restored any number of times
+        return copy.copy(self.motor), copy.copy(self.controller)
+
+
+def run_segment(motor, controller, profile, t_end, start=0, engine='auto', stop=None):
+    # Advances motor and controller from step start up to t_end, or up to
+    # step stop when given (see Simulation.run_loop)
+    if engine == 'auto':
+        engine = 'fast' if FastKernel.HAVE_NUMBA and motor.integrator == 'euler' else 'objects'
+    if engine == 'fast':
+        return FastKernel.run(motor, controller, t_end, profile, start, stop=stop)
+    elif engine == 'objects':
+        return Simulation.run_loop(motor, controller, Inverter(), Sensors(), profile, t_end, start, stop=stop)
+    else:
+        raise ValueError("Invalid engine")
+
+
+def run_prefix(motor_type, t_split, Ts=1e-4, profile=None, motor_params=None,
+               controller_params=None, engine='auto', **motor_kwargs):
+    # Runs the shared part [0, t_split) once; returns (Snapshot, history)
+    profile = default_profile if profile is None else profile
+    motor = Simulation.make_motor(motor_type, Ts, motor_params, **motor_kwargs)
+    controller = Simulation.make_controller(Ts, controller_params)
+    history = run_segment(motor, controller, profile, t_split, 0, engine)
+    return Snapshot(motor, controller, int(t_split / Ts)), history
+
+
+def concatenate(prefix, suffix):
+    return SimulationResult.concatenate(prefix, suffix)
+
+
+def branch(snapshot, profile, t_end, engine='auto', prefix=None):
+    # One continuation of snapshot under profile; with the prefix history
+    # the result covers the whole run from t = 0
+    motor, controller = snapshot.restore()
+    history = run_segment(motor, controller, profile, t_end, snapshot.step, engine)
+    return history if prefix is None else concatenate(prefix, history)
+
+
+# Set in the parent before the pool starts, so forked workers inherit it
+_fork = {}
+
+
+def _run_branch(args):
+    i, profile = args
+    return i, branch(_fork['snapshot'], profile, _fork['t_end'], _fork['engine'])
+
+
+def _init_fork(snapshot, t_end, engine):
+    # Forked workers already have _fork; spawned ones receive it here
+    _fork.update(snapshot=snapshot, t_end=t_end, engine=engine)
+
+
+def fork(snapshot, profiles, t_end, processes=None, engine='auto', prefix=None):
+    # One branch per profile, all starting from snapshot. Every branch costs
+    # only its suffix. With more than one process, workers are forked after
+    # the snapshot is published and share it copy-on-write.
+    processes = processes or os.cpu_count() or 1
+    histories = [None] * len(profiles)
+    tasks = list(enumerate(profiles))
+
+    _fork.update(snapshot=snapshot, t_end=t_end, engine=engine)
+    try:
+        if processes == 1 or len(profiles) == 1:
+            results = map(_run_branch, tasks)
+            for i, history in results:
+                histories[i] = history
+        else:
+            method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+            with multiprocessing.get_context(method).Pool(
+                    processes, _init_fork, (snapshot, t_end, engine)) as pool:
+                for i, history in pool.imap_unordered(_run_branch, tasks):
+                    histories[i] = history
+    finally:
+        _fork.clear()
+
+    if prefix is not None:
+        histories = [concatenate(prefix, history) for history in histories]
+    return histories
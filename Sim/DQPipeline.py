@@ -0,0 +1,97 @@
+import math
+import numpy as np
+from . import Transforms
+from .Profile import sample_profile
+from .SimulationResult import SimulationResult
+
+# The loop of Simulate.py kept in the dq frame. The object loop converts
+# five times per step (sensor dq->abc, controller abc->dq and dq->abc,
+# motor abc->dq of voltages and currents) to end up where it started; here
+# cos/sin of theta_e are evaluated once per step and the only frame change
+# left is the one the object loop really makes: the controller works at
+# the theta_e of the previous step while physics_step projects onto the new
+# one. That rotation by delta = theta_e_new - theta_e_old is applied
+# directly in dq, with cos/sin of delta from the angle-difference identity.
+#
+# Phase-domain effects still go through abc: the inverter clamp when the
+# voltage vector leaves the Vbus/2 circle (Inverter.step_dq) and the
+# trapezoidal back-EMF of BLDCMotor (back_emf_dq). Results match the
+# object loop to rounding, not bit for bit.
+
+
+def physics_step(motor, Vd, Vq, Tload, Id, Iq, cos_p, sin_p):
+    # BLACMotor/BLDCMotor.physics_step ('euler') for voltages and measured
+    # currents given in the frame of the previous theta_e (cos_p, sin_p).
+    # Returns (Te, cos_t, sin_t) with the cos/sin of the new theta_e.
+    We = motor.Npp * motor.Wr
+    motor.theta_e = motor.Npp * motor.theta
+    motor.theta_e = motor.theta_e % (2 * math.pi)
+    cos_t = math.cos(motor.theta_e)
+    sin_t = math.sin(motor.theta_e)
+
+    cos_d, sin_d = Transforms.angle_difference_cs(cos_t, sin_t, cos_p, sin_p)
+    Vd_ref, Vq_ref = Transforms.rotate_dq(Vd, Vq, cos_d, sin_d)
+    Id_meas, Iq_meas = Transforms.rotate_dq(Id, Iq, cos_d, sin_d)
+
+    ed, eq = motor.back_emf_dq(motor.theta_e, We, cos_t, sin_t)
+
+    dId = (1.0/motor.Ld) * (Vd_ref - motor.Rs*Id_meas + We*motor.Lq*Iq_meas - ed)
+    dIq = (1.0/motor.Lq) * (Vq_ref - motor.Rs*Iq_meas - We*motor.Ld*Id_meas - eq)
+
+    Id_next = Id_meas + motor.Ts * dId
+    Iq_next = Iq_meas + motor.Ts * dIq
+
+    if abs(We) > 1e-3:
+        Te = 1.5 * motor.Npp * (ed * Id_next + eq * Iq_next) / We + \
+        1.5 * motor.Npp * (motor.Ld - motor.Lq) * Id_next * Iq_next
+    else:
+        Te = 1.5 * motor.Npp * motor.Lambda_m * Iq_next
+
+    Tc_dir = motor.Tc if motor.Wr > 0 else (-motor.Tc if motor.Wr < 0 else 0)
+
+    accel = (Te - Tload - (motor.Bn * motor.Wr) - Tc_dir) / motor.J
+    motor.Wr += accel * motor.Ts
+
+    motor.theta += motor.Wr * motor.Ts
+    motor.theta = motor.theta % (2*math.pi)
+
+    motor.Id = Id_next
+    motor.Iq = Iq_next
+
+    return Te, cos_t, sin_t
+
+
+def run_loop(motor, controller, inverter, sensors, profile, t_end, start=0, dtype=np.float64):
+    # Same arguments and SimulationResult as Simulation.run_loop; sensors and
+    # inverter need measure_dq and step_dq
+    if motor.integrator != 'euler':
+        raise ValueError("DQPipeline only implements the 'euler' integrator")
+
+    Ts = motor.Ts
+    num_steps = int(t_end / Ts) - start
+
+    history = SimulationResult(Ts, num_steps, start, motor.Npp, dtype)
+    samples = sample_profile(profile, Ts, num_steps, start)
+    history.set_inputs(*samples)
+
+    rpm_ref, tload, vbus = [x.tolist() for x in samples]
+
+    # cos/sin of motor.theta_e, carried from one step to the next
+    cos_t = math.cos(motor.theta_e)
+    sin_t = math.sin(motor.theta_e)
+
+    for k in range(num_steps):
+        RPMref, Tload, V_bus = rpm_ref[k], tload[k], vbus[k]
+
+        Id, Iq, theta_e, Wr_meas = sensors.measure_dq(motor, RPMref)
+
+        Iq_ref = controller.speed_step(RPMref, Wr_meas)
+        Vd_ref, Vq_ref = controller.current_step_dq(Iq_ref, Id, Iq)
+
+        Vd, Vq = inverter.step_dq(Vd_ref, Vq_ref, V_bus, cos_t, sin_t)
+
+        Te, cos_t, sin_t = physics_step(motor, Vd, Vq, Tload, Id, Iq, cos_t, sin_t)
+
+        history.record(k, motor.Wr, motor.Iq, motor.Id, Te, motor.theta)
+
+    return history
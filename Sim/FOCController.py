@@ -1,9 +1,11 @@
 import math
-import Transforms
+from . import Transforms
 
 class FOCController:
     def __init__(self, Ts, Imax=8.0):
         self.Ts = Ts
+        # Sample period of the speed loop; differs from Ts when it is decimated
+        self.Ts_speed = Ts
         self.Imax = Imax
         
         self.Kps = 1.25
@@ -18,18 +20,34 @@ class FOCController:
         self.Ui_Iq = 0.0
 
     def control_step(self, RPMref, Wr, Ia, Ib, Ic, theta_e, Vbus):
-        
-        Id, Iq = Transforms.abc_to_dq(Ia, Ib, Ic, theta_e)
+        Iq_ref = self.speed_step(RPMref, Wr)
+        return self.current_step(Iq_ref, Ia, Ib, Ic, theta_e, Vbus)
 
+    def speed_step(self, RPMref, Wr):
         # Controlador de velocidade        
         error_speed = (RPMref * 2 * math.pi / 60.0) - Wr
         Up_s = self.Kps * error_speed
-        Ui_s_next = self.Ui_s + (self.Kis * self.Ts * error_speed)
+        Ui_s_next = self.Ui_s + (self.Kis * self.Ts_speed * error_speed)
         Iq_ref = Up_s + Ui_s_next
         self.Ui_s = Ui_s_next 
+
+        return Iq_ref
+
+    def current_step(self, Iq_ref, Ia, Ib, Ic, theta_e, Vbus, Id_ref=0.0):
         
-        Id_ref = 0.0
+        cos_t = math.cos(theta_e)
+        sin_t = math.sin(theta_e)
+
+        Id, Iq = Transforms.abc_to_dq_cs(Ia, Ib, Ic, cos_t, sin_t)
+
+        Vd_ref, Vq_ref = self.current_step_dq(Iq_ref, Id, Iq, Id_ref)
 
+        Va_ref, Vb_ref, Vc_ref = Transforms.dq_to_abc_cs(Vd_ref, Vq_ref, cos_t, sin_t)
+            
+        return Va_ref, Vb_ref, Vc_ref
+
+    def current_step_dq(self, Iq_ref, Id, Iq, Id_ref=0.0):
+        # PI current loops on measured dq currents; returns (Vd_ref, Vq_ref)
         # Controlador de corrente Iq
         err_Iq = Iq_ref - Iq
         Up_Iq = self.KpIq * err_Iq
@@ -44,6 +62,4 @@ class FOCController:
         Vd_ref = Up_Id + Ui_Id_next
         self.Ui_Id = Ui_Id_next
 
-        Va_ref, Vb_ref, Vc_ref = Transforms.dq_to_abc(Vd_ref, Vq_ref, theta_e)
-            
-        return Va_ref, Vb_ref, Vc_ref
+        return Vd_ref, Vq_ref
@@ -0,0 +1,232 @@
+import importlib.util
+import math
+import numpy as np
+from .BLDCMotor import BLDCMotor
+from .Profile import sample_profile
+from .SimulationResult import SimulationResult
+
+# Fused sensor -> controller -> inverter -> motor loop. Every expression
+# below mirrors Sensors.measure, FOCController.control_step, Inverter.step
+# and BLACMotor/BLDCMotor.physics_step operation by operation, so results
+# are bit-for-bit identical to stepping the objects. Keep them in sync.
+
+# numba is only imported, and the kernel compiled, by the first simulate()
+HAVE_NUMBA = importlib.util.find_spec('numba') is not None
+
+_compiled = False
+
+
+def _jit_kernel():
+    global _compiled, _trapezoidal_shape, _kernel
+    if not _compiled and HAVE_NUMBA:
+        import numba
+        _trapezoidal_shape = numba.njit(cache=True)(_trapezoidal_shape)
+        _kernel = numba.njit(cache=True)(_kernel)
+    _compiled = True
+    return _kernel
+
+
+def _trapezoidal_shape(theta):
+    t = theta % (2 * math.pi)
+    pi = math.pi
+
+    if t < pi/6:
+        return t * (6/pi)
+    elif t < 5*pi/6:
+        return 1.0
+    elif t < 7*pi/6:
+        return 1.0 - (t - 5*pi/6) * (6/pi)
+    elif t < 11*pi/6:
+        return -1.0
+    else:
+        return -1.0 + (t - 11*pi/6) * (6/pi)
+
+
+def _kernel(bldc, use_table, ed_table, eq_table, inv_step, size,
+            Npp, Rs, Ld, Lq, Lambda_m, Bn, J, Tc, Ts_m,
+            Kps, Kis, KpId, KiId, KpIq, KiIq, Ts_c, Ts_s,
+            Id, Iq, Wr, theta, theta_e, Ui_s, Ui_Id, Ui_Iq,
+            rpm_ref, tload, vbus, Wr_out, Iq_out, Id_out, Te_out, theta_out):
+    sqrt3 = math.sqrt(3)
+    sqrt3_2 = math.sqrt(3)/2
+    # Steps where the inverter clamped at least one phase
+    clamped = 0
+
+    for k in range(len(rpm_ref)):
+        RPMref = rpm_ref[k]
+        Tload = tload[k]
+        V_bus = vbus[k]
+
+        # Sensors.measure
+        cos_t = math.cos(theta_e)
+        sin_t = math.sin(theta_e)
+        X_alpha = Id * cos_t - Iq * sin_t
+        X_beta = Id * sin_t + Iq * cos_t
+        Ia = X_alpha
+        Ib = (-X_alpha + sqrt3 * X_beta) / 2
+        Ic = (-X_alpha - sqrt3 * X_beta) / 2
+        Wr_meas = Wr
+
+        # FOCController.control_step
+        X_alpha = (2/3) * (Ia - 0.5 * Ib - 0.5 * Ic)
+        X_beta = (2/3) * (sqrt3_2 * (Ib - Ic))
+        Id_c = X_alpha * cos_t + X_beta * sin_t
+        Iq_c = -X_alpha * sin_t + X_beta * cos_t
+
+        error_speed = (RPMref * 2 * math.pi / 60.0) - Wr_meas
+        Up_s = Kps * error_speed
+        Ui_s = Ui_s + (Kis * Ts_s * error_speed)
+        Iq_ref = Up_s + Ui_s
+
+        err_Iq = Iq_ref - Iq_c
+        Up_Iq = KpIq * err_Iq
+        Ui_Iq = Ui_Iq + (KiIq * Ts_c * err_Iq)
+        Vq_ref = Up_Iq + Ui_Iq
+
+        err_Id = 0.0 - Id_c
+        Up_Id = KpId * err_Id
+        Ui_Id = Ui_Id + (KiId * Ts_c * err_Id)
+        Vd_ref = Up_Id + Ui_Id
+
+        X_alpha = Vd_ref * cos_t - Vq_ref * sin_t
+        X_beta = Vd_ref * sin_t + Vq_ref * cos_t
+        Va_ref = X_alpha
+        Vb_ref = (-X_alpha + sqrt3 * X_beta) / 2
+        Vc_ref = (-X_alpha - sqrt3 * X_beta) / 2
+
+        # Inverter.step
+        limit = V_bus / 2.0
+        Va = max(-limit, min(limit, Va_ref))
+        Vb = max(-limit, min(limit, Vb_ref))
+        Vc = max(-limit, min(limit, Vc_ref))
+        if Va != Va_ref or Vb != Vb_ref or Vc != Vc_ref:
+            clamped += 1
+
+        # physics_step
+        We = Npp * Wr
+        theta_e = Npp * theta
+        theta_e = theta_e % (2 * math.pi)
+        cos_t = math.cos(theta_e)
+        sin_t = math.sin(theta_e)
+
+        if bldc:
+            E_mag = We * Lambda_m
+            if use_table:
+                x = (theta_e % (2 * math.pi)) * inv_step
+                i = int(x)
+                if i >= size:
+                    i = size - 1
+                frac = x - i
+                ed = E_mag * (ed_table[i] + frac * (ed_table[i + 1] - ed_table[i]))
+                eq = E_mag * (eq_table[i] + frac * (eq_table[i + 1] - eq_table[i]))
+            else:
+                ea = -E_mag * _trapezoidal_shape(theta_e)
+                eb = -E_mag * _trapezoidal_shape(theta_e - 2*math.pi/3)
+                ec = -E_mag * _trapezoidal_shape(theta_e + 2*math.pi/3)
+                X_alpha = (2/3) * (ea - 0.5 * eb - 0.5 * ec)
+                X_beta = (2/3) * (sqrt3_2 * (eb - ec))
+                ed = X_alpha * cos_t + X_beta * sin_t
+                eq = -X_alpha * sin_t + X_beta * cos_t
+        else:
+            ed = 0.0
+            eq = We * Lambda_m
+
+        X_alpha = (2/3) * (Va - 0.5 * Vb - 0.5 * Vc)
+        X_beta = (2/3) * (sqrt3_2 * (Vb - Vc))
+        Vd = X_alpha * cos_t + X_beta * sin_t
+        Vq = -X_alpha * sin_t + X_beta * cos_t
+
+        X_alpha = (2/3) * (Ia - 0.5 * Ib - 0.5 * Ic)
+        X_beta = (2/3) * (sqrt3_2 * (Ib - Ic))
+        Id_meas = X_alpha * cos_t + X_beta * sin_t
+        Iq_meas = -X_alpha * sin_t + X_beta * cos_t
+
+        dId = (1.0/Ld) * (Vd - Rs*Id_meas + We*Lq*Iq_meas - ed)
+        dIq = (1.0/Lq) * (Vq - Rs*Iq_meas - We*Ld*Id_meas - eq)
+
+        Id = Id_meas + Ts_m * dId
+        Iq = Iq_meas + Ts_m * dIq
+
+        if abs(We) > 1e-3:
+            Te = 1.5 * Npp * (ed * Id + eq * Iq) / We + \
+            1.5 * Npp * (Ld - Lq) * Id * Iq
+        else:
+            Te = 1.5 * Npp * Lambda_m * Iq
+
+        Tc_dir = Tc if Wr > 0 else (-Tc if Wr < 0 else 0.0)
+
+        accel = (Te - Tload - (Bn * Wr) - Tc_dir) / J
+        Wr += accel * Ts_m
+
+        theta += Wr * Ts_m
+        theta = theta % (2*math.pi)
+
+        # Data logging
+        Wr_out[k] = Wr
+        Iq_out[k] = Iq
+        Id_out[k] = Id
+        Te_out[k] = Te
+        theta_out[k] = theta
+
+    return Id, Iq, Wr, theta, theta_e, Ui_s, Ui_Id, Ui_Iq, clamped
+
+
+def simulate(motor, controller, rpm_ref, tload, vbus):
+    # Advances motor and controller by len(rpm_ref) steps, exactly like the
+    # loop in Simulate.py, and leaves their state where the loop would.
+    if motor.integrator != 'euler':
+        raise ValueError("FastKernel only implements the 'euler' integrator")
+
+    n = len(rpm_ref)
+    bldc = isinstance(motor, BLDCMotor)
+    table = motor.emf_table if bldc else None
+    use_table = table is not None
+
+    if HAVE_NUMBA:
+        rpm_ref = np.ascontiguousarray(rpm_ref, dtype=float)
+        tload = np.ascontiguousarray(tload, dtype=float)
+        vbus = np.ascontiguousarray(vbus, dtype=float)
+        outputs = [np.zeros(n) for _ in range(5)]
+        ed_table = table.ed_table if use_table else np.zeros(2)
+        eq_table = table.eq_table if use_table else np.zeros(2)
+    else:
+        # Plain Python runs fastest on lists of floats
+        rpm_ref = np.asarray(rpm_ref, dtype=float).tolist()
+        tload = np.asarray(tload, dtype=float).tolist()
+        vbus = np.asarray(vbus, dtype=float).tolist()
+        outputs = [[0.0] * n for _ in range(5)]
+        ed_table = table._ed_list if use_table else None
+        eq_table = table._eq_list if use_table else None
+
+    state = _jit_kernel()(
+        bldc, use_table, ed_table, eq_table,
+        table.inv_step if use_table else 0.0, table.size if use_table else 0,
+        motor.Npp, motor.Rs, motor.Ld, motor.Lq, motor.Lambda_m, motor.Bn, motor.J, motor.Tc, motor.Ts,
+        controller.Kps, controller.Kis, controller.KpId, controller.KiId,
+        controller.KpIq, controller.KiIq, controller.Ts, controller.Ts_speed,
+        motor.Id, motor.Iq, motor.Wr, motor.theta, motor.theta_e,
+        controller.Ui_s, controller.Ui_Id, controller.Ui_Iq,
+        rpm_ref, tload, vbus, *outputs
+    )
+
+    (motor.Id, motor.Iq, motor.Wr, motor.theta, motor.theta_e,
+     controller.Ui_s, controller.Ui_Id, controller.Ui_Iq) = [float(x) for x in state[:8]]
+
+    Wr, Iq, Id, Te, theta = [np.asarray(x, dtype=float) for x in outputs]
+    # 'clamped' counts the steps where Inverter.step saturated a phase
+    return {'rpm_act': Wr * 60 / (2*math.pi), 'Iq': Iq, 'Id': Id, 'Te': Te,
+            'Wr': Wr, 'theta': theta, 'clamped': int(state[8])}
+
+
+def run(motor, controller, t_end, profile, start=0, dtype=np.float64, stop=None):
+    # Same history as the loop in Simulate.py, as a SimulationResult; see
+    # Simulation.run_loop for start and stop
+    num_steps = (int(t_end / motor.Ts) if stop is None else stop) - start
+    rpm_ref, tload, vbus = sample_profile(profile, motor.Ts, num_steps, start)
+
+    out = simulate(motor, controller, rpm_ref, tload, vbus)
+
+    return SimulationResult.from_arrays(
+        motor.Ts, start, motor.Npp, out['Wr'], out['Iq'], out['Id'], out['Te'], out['theta'],
+        rpm_ref, tload, vbus, dtype
+    )
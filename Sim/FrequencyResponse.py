@@ -0,0 +1,287 @@
+import copy
+import math
+import numpy as np
+from .BLACMotor import BLACMotor
+from .FOCController import FOCController
+from . import DQPipeline
+
+# Small-signal frequency response of the FOC loops around an operating
+# point. The discrete map of one simulation step (speed PI, current PIs,
+# BLACMotor 'euler' step including the one-step frame lag of physics_step)
+# is linearized with a finite-difference Jacobian,
+#   x[k+1] = A x[k] + B u[k],   y[k] = C x[k] + D u[k],
+#   x = (Id, Iq, Wr, Ui_s, Ui_Id, Ui_Iq),
+# and evaluated on z = exp(j w Ts) for all frequencies at once, so the
+# sampling at Ts is part of every response. The inverter is taken as
+# unsaturated.
+#
+# A loop is opened at its break point: the plant takes the injected signal
+# instead of the controller output, and the open-loop gain is
+# L = -(controller output / injected signal), so 1 + L = 0 is instability.
+#   speed  breaks at Iq_ref (speed PI output)
+#   id/iq  break at Vd/Vq (current PI outputs)
+# The other loops stay closed (loop-at-a-time margins).
+#
+#   fa = FrequencyAnalyzer(1e-4)
+#   result = fa.analyze(40, Tload=20)
+#   result['speed']['phase_margin'], result['iq']['bandwidth']
+
+STATES = ('Id', 'Iq', 'Wr', 'Ui_s', 'Ui_Id', 'Ui_Iq')
+INPUTS = ('rpm_ref', 'Tload', 'Id_ref', 'Iq_ref', 'Vd', 'Vq')
+OUTPUTS = ('rpm_act', 'Id', 'Iq', 'Te', 'Iq_ref', 'Vd', 'Vq')
+BREAK_POINTS = ('Iq_ref', 'Vd', 'Vq')
+
+LOOPS = {'speed': 'Iq_ref', 'id': 'Vd', 'iq': 'Vq'}
+# loop -> (input, output, loop opened) of its closed-loop response; the
+# current loops are measured with the speed loop open
+CLOSED_LOOPS = {
+    'speed': ('rpm_ref', 'rpm_act', None),
+    'id': ('Id_ref', 'Id', 'Iq_ref'),
+    'iq': ('Iq_ref', 'Iq', 'Iq_ref'),
+}
+
+
+def frequency_grid(Ts, n=2000, f_min=0.1):
+    # Log-spaced frequencies (Hz) up to just below the Nyquist frequency
+    return np.logspace(math.log10(f_min), math.log10(0.4999 / Ts), n)
+
+
+def bode(H):
+    # Magnitude (dB) and unwrapped phase (deg) of a response
+    return 20 * np.log10(np.abs(H)), np.degrees(np.unwrap(np.angle(H)))
+
+
+def _crossings(freqs, values):
+    # Log-frequency interpolated points where values changes sign
+    idx = np.flatnonzero(np.signbit(values[:-1]) != np.signbit(values[1:]))
+    a, b = values[idx], values[idx + 1]
+    frac = a / (a - b)
+    logf = np.log(freqs)
+    return idx, frac, np.exp(logf[idx] + frac * (logf[idx + 1] - logf[idx]))
+
+
+def margins(freqs, L):
+    # Phase margin (deg) at the gain crossover(s) |L| = 1 and gain margin
+    # (dB) at the phase crossover(s) -180 deg; the smallest of each is
+    # reported, inf when there is no crossover
+    log_mag = np.log(np.abs(L))
+    phase = np.degrees(np.unwrap(np.angle(L)))
+
+    idx, frac, f_gain = _crossings(freqs, log_mag)
+    pm = phase[idx] + frac * (phase[idx + 1] - phase[idx])
+    pm = (pm + 180.0 + 180.0) % 360.0 - 180.0
+
+    # Distance to the nearest odd multiple of 180 deg, as a sign change
+    shifted = (phase + 180.0) % 360.0
+    wrapped = np.where(shifted > 180.0, shifted - 360.0, shifted)
+    jdx, jfrac, f_phase = _crossings(freqs, wrapped)
+    # Discard the jumps at +-180 of wrapped itself
+    real = np.abs(wrapped[jdx] - wrapped[jdx + 1]) < 180.0
+    jdx, jfrac, f_phase = jdx[real], jfrac[real], f_phase[real]
+    gm = -(log_mag[jdx] + jfrac * (log_mag[jdx + 1] - log_mag[jdx])) * (20 / math.log(10))
+
+    result = {
+        'phase_margin': math.inf, 'gain_crossover': math.nan,
+        'gain_margin': math.inf, 'phase_crossover': math.nan,
+        'gain_crossovers': f_gain, 'phase_crossovers': f_phase,
+    }
+    if len(pm):
+        i = int(np.argmin(pm))
+        result['phase_margin'] = float(pm[i])
+        result['gain_crossover'] = float(f_gain[i])
+    if len(gm):
+        j = int(np.argmin(np.abs(gm)))
+        result['gain_margin'] = float(gm[j])
+        result['phase_crossover'] = float(f_phase[j])
+    return result
+
+
+def bandwidth(freqs, T, dc):
+    # First frequency where |T| falls 3 dB below its DC gain
+    below = np.abs(T) < abs(dc) / math.sqrt(2)
+    if not below.any():
+        return math.inf
+    k = int(np.argmax(below))
+    if k == 0:
+        return float(freqs[0])
+    return float(_crossings(freqs[k-1:k+1], np.abs(T[k-1:k+1]) - abs(dc) / math.sqrt(2))[2][0])
+
+
+class LinearModel:
+    # Discrete state-space model with named inputs and outputs
+
+    def __init__(self, A, B, C, D, Ts, inputs=INPUTS, outputs=OUTPUTS, x0=None):
+        self.A, self.B, self.C, self.D = A, B, C, D
+        self.Ts = Ts
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        # Operating point the model was linearized at
+        self.x0 = x0
+
+    def poles(self):
+        return np.linalg.eigvals(self.A)
+
+    def is_stable(self):
+        return bool(np.all(np.abs(self.poles()) < 1.0))
+
+    def evaluate(self, z, input=None, output=None):
+        # C (zI - A)^-1 B + D for an array of z; (len(z), outputs, inputs),
+        # or a single channel when input and output are given
+        B, C, D = self.B, self.C, self.D
+        if input is not None:
+            B = B[:, [self.inputs.index(input)]]
+            D = D[:, [self.inputs.index(input)]]
+        if output is not None:
+            C = C[[self.outputs.index(output)]]
+            D = D[[self.outputs.index(output)]]
+
+        z = np.atleast_1d(np.asarray(z, dtype=complex))
+        lam, V = np.linalg.eig(self.A)
+        if np.linalg.cond(V) < 1e8:
+            # Modal form: one division per frequency and pole
+            H = np.einsum('oi,fi,ij->foj', C @ V, 1.0 / (z[:, None] - lam), np.linalg.solve(V, B)) + D
+        else:
+            # Nearly defective A: solve (zI - A) per frequency
+            M = z[:, None, None] * np.eye(len(lam)) - self.A
+            H = C @ np.linalg.solve(M, np.broadcast_to(B, (len(z),) + B.shape)) + D
+        if input is not None and output is not None:
+            return H[:, 0, 0]
+        return H
+
+    def response(self, freqs, input=None, output=None):
+        z = np.exp(2j * math.pi * np.asarray(freqs, dtype=float) * self.Ts)
+        return self.evaluate(z, input, output)
+
+    def dc_gain(self, input, output):
+        return self.evaluate([1.0], input, output)[0].real
+
+
+class FrequencyAnalyzer:
+    def __init__(self, Ts, motor=None, controller=None, tol=1e-12, max_iter=20):
+        self.Ts = Ts
+        self.motor = motor if motor is not None else BLACMotor(Ts)
+        self.controller = controller if controller is not None else FOCController(Ts)
+        if not isinstance(self.motor, BLACMotor):
+            raise ValueError("FrequencyAnalyzer linearizes the BLACMotor dq model")
+        if self.motor.integrator != 'euler':
+            raise ValueError("FrequencyAnalyzer only implements the 'euler' integrator")
+        if self.controller.Ts_speed != self.controller.Ts:
+            raise ValueError("FrequencyAnalyzer runs the speed loop every step")
+        self.tol = tol
+        self.max_iter = max_iter
+
+    def step(self, x, u, opened=None):
+        # One simulation step from state x with inputs u (INPUTS order);
+        # returns (x_next, y) with y in OUTPUTS order. With opened set to a
+        # break point, the plant takes u at that point instead of the
+        # controller output; otherwise u there is added to it.
+        Id, Iq, Wr, Ui_s, Ui_Id, Ui_Iq = x
+        RPMref, Tload, Id_ref, dIq_ref, dVd, dVq = u
+        motor = copy.copy(self.motor)
+        controller = copy.copy(self.controller)
+
+        motor.Id, motor.Iq, motor.Wr = Id, Iq, Wr
+        motor.theta = 0.0
+        # physics_step sets theta_e from the angle at the start of the previous step
+        motor.theta_e = (motor.Npp * (0.0 - Wr * motor.Ts)) % (2 * math.pi)
+        controller.Ui_s, controller.Ui_Id, controller.Ui_Iq = Ui_s, Ui_Id, Ui_Iq
+
+        Iq_ref = controller.speed_step(RPMref, Wr)
+        Iq_cmd = dIq_ref if opened == 'Iq_ref' else Iq_ref + dIq_ref
+        Vd_ref, Vq_ref = controller.current_step_dq(Iq_cmd, Id, Iq, Id_ref)
+        Vd = dVd if opened == 'Vd' else Vd_ref + dVd
+        Vq = dVq if opened == 'Vq' else Vq_ref + dVq
+
+        cos_p = math.cos(motor.theta_e)
+        sin_p = math.sin(motor.theta_e)
+        Te, _, _ = DQPipeline.physics_step(motor, Vd, Vq, Tload, Id, Iq, cos_p, sin_p)
+
+        x_next = np.array([motor.Id, motor.Iq, motor.Wr, controller.Ui_s, controller.Ui_Id, controller.Ui_Iq])
+        y = np.array([motor.Wr * 60 / (2*math.pi), motor.Id, motor.Iq, Te, Iq_ref, Vd_ref, Vq_ref])
+        return x_next, y
+
+    def _jacobian(self, x, u, opened):
+        # Central differences of step with respect to x and u
+        v = np.concatenate((x, u))
+        n = len(x)
+        columns = []
+        for i in range(len(v)):
+            eps = 1e-6 * max(1.0, abs(v[i]))
+            hi = v.copy()
+            lo = v.copy()
+            hi[i] += eps
+            lo[i] -= eps
+            x_hi, y_hi = self.step(hi[:n], hi[n:], opened)
+            x_lo, y_lo = self.step(lo[:n], lo[n:], opened)
+            columns.append(np.concatenate((x_hi - x_lo, y_hi - y_lo)) / (2 * eps))
+        J = np.array(columns).T
+        return J[:n, :n], J[:n, n:], J[n:, :n], J[n:, n:]
+
+    def operating_point(self, RPMref, Tload=0.0, Id_ref=0.0):
+        # Fixed point x = step(x) of the closed loop, by Newton's method
+        motor = self.motor
+        Wr = RPMref * 2 * math.pi / 60.0
+        if Wr == 0:
+            raise ValueError("Linearize at a non-zero speed; Coulomb friction is not differentiable at rest")
+        u = np.array([RPMref, Tload, Id_ref, 0.0, 0.0, 0.0])
+
+        Iq = (Tload + motor.Bn * Wr + math.copysign(motor.Tc, Wr)) / (1.5 * motor.Npp * motor.Lambda_m)
+        We = motor.Npp * Wr
+        x = np.array([Id_ref, Iq, Wr, Iq, -We * motor.Lq * Iq, motor.Rs * Iq + We * motor.Lambda_m])
+
+        for _ in range(self.max_iter):
+            x_next, _ = self.step(x, u)
+            residual = x_next - x
+            if np.max(np.abs(residual)) <= self.tol * max(1.0, np.max(np.abs(x))):
+                return x
+            A = self._jacobian(x, u, None)[0]
+            x = x - np.linalg.solve(A - np.eye(len(x)), residual)
+        raise RuntimeError("Operating point did not converge")
+
+    def linearize(self, RPMref, Tload=0.0, Vbus=311.0, Id_ref=0.0, opened=None, x0=None):
+        if opened is not None and opened not in BREAK_POINTS:
+            raise ValueError(f"opened must be one of {BREAK_POINTS}")
+        x0 = self.operating_point(RPMref, Tload, Id_ref) if x0 is None else x0
+        u0 = np.array([RPMref, Tload, Id_ref, 0.0, 0.0, 0.0])
+        _, y0 = self.step(x0, u0)
+
+        Vd, Vq = y0[OUTPUTS.index('Vd')], y0[OUTPUTS.index('Vq')]
+        if Vd * Vd + Vq * Vq > (Vbus / 2.0) ** 2:
+            raise ValueError("The operating point saturates the inverter")
+
+        if opened is not None:
+            # Feed the plant the controller output of the operating point
+            u0[INPUTS.index(opened)] = y0[OUTPUTS.index(opened)]
+        A, B, C, D = self._jacobian(x0, u0, opened)
+        return LinearModel(A, B, C, D, self.Ts, x0=x0)
+
+    def open_loop(self, loop, freqs, RPMref, Tload=0.0, Vbus=311.0, x0=None):
+        point = LOOPS[loop]
+        model = self.linearize(RPMref, Tload, Vbus, opened=point, x0=x0)
+        return -model.response(freqs, point, point)
+
+    def analyze(self, RPMref, Tload=0.0, Vbus=311.0, freqs=None, loops=('speed', 'id', 'iq')):
+        # Open- and closed-loop responses, margins and -3 dB bandwidth (Hz) of
+        # every loop at one operating point
+        freqs = frequency_grid(self.Ts) if freqs is None else np.asarray(freqs, dtype=float)
+        x0 = self.operating_point(RPMref, Tload)
+        models = {None: self.linearize(RPMref, Tload, Vbus, x0=x0)}
+
+        result = {'freqs': freqs, 'x0': x0, 'stable': models[None].is_stable(),
+                  'poles': models[None].poles()}
+        for loop in loops:
+            point = LOOPS[loop]
+            if point not in models:
+                models[point] = self.linearize(RPMref, Tload, Vbus, opened=point, x0=x0)
+            L = -models[point].response(freqs, point, point)
+
+            input, output, opened = CLOSED_LOOPS[loop]
+            if opened not in models:
+                models[opened] = self.linearize(RPMref, Tload, Vbus, opened=opened, x0=x0)
+            T = models[opened].response(freqs, input, output)
+            dc = models[opened].dc_gain(input, output)
+
+            entry = {'open_loop': L, 'closed_loop': T, 'bandwidth': bandwidth(freqs, T, dc)}
+            entry.update(margins(freqs, L))
+            result[loop] = entry
+        return result
@@ -0,0 +1,180 @@
+import json
+import math
+import time
+from . import Simulation
+
+# Opt-in timing of the loop stages of Simulate.py (sensing, control,
+# inverter, physics, logging). Instrumentation.wrap() replaces a component
+# method on that one instance by a timed wrapper, so uninstrumented runs
+# execute exactly the code they did before: there is no flag tested per
+# step and FastKernel is never touched.
+
+STAGES = ('sensing', 'control', 'inverter', 'physics', 'logging')
+
+# Latency histograms use power-of-two nanosecond bins: bin b holds
+# durations in [2**(b-1), 2**b) ns
+HISTOGRAM_BINS = 48
+
+
+class Instrumentation:
+    def __init__(self, trace=False, max_events=200000):
+        self.total = {}
+        self.calls = {}
+        self.histogram = {}
+        self.counters = {}
+        # Chrome-trace events, capped so long runs stay bounded in memory
+        self.trace = trace
+        self.max_events = max_events
+        self.events = []
+        self.origin = time.perf_counter_ns()
+
+    def _stage(self, stage):
+        if stage not in self.total:
+            self.total[stage] = 0
+            self.calls[stage] = 0
+            self.histogram[stage] = [0] * HISTOGRAM_BINS
+
+    def record(self, stage, start, end):
+        # start/end from time.perf_counter_ns()
+        dt = end - start
+        self.total[stage] += dt
+        self.calls[stage] += 1
+        self.histogram[stage][min(dt.bit_length(), HISTOGRAM_BINS - 1)] += 1
+        if self.trace and len(self.events) < self.max_events:
+            self.events.append((stage, start, dt))
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def timed(self, stage, fn):
+        # fn wrapped so each call is recorded under stage
+        self._stage(stage)
+        clock = time.perf_counter_ns
+        record = self.record
+
+        def wrapper(*args):
+            start = clock()
+            result = fn(*args)
+            record(stage, start, clock())
+            return result
+        return wrapper
+
+    def wrap(self, obj, method, stage):
+        # Instance-level override of obj.method; unwrap() restores it
+        setattr(obj, method, self.timed(stage, getattr(obj, method)))
+        return obj
+
+    @staticmethod
+    def unwrap(obj, method):
+        obj.__dict__.pop(method, None)
+        return obj
+
+    def wrap_inverter(self, inverter):
+        # Also counts steps where any phase hit the +/- Vbus/2 clamp
+        step = self.timed('inverter', inverter.step)
+        count = self.count
+
+        def wrapper(Va_ref, Vb_ref, Vc_ref, Vbus):
+            Va, Vb, Vc = step(Va_ref, Vb_ref, Vc_ref, Vbus)
+            if Va != Va_ref or Vb != Vb_ref or Vc != Vc_ref:
+                count('inverter_clamp')
+            return Va, Vb, Vc
+        inverter.step = wrapper
+        return inverter
+
+    def wrap_motor(self, motor):
+        # Also counts steps taking the abs(We) <= 1e-3 low-speed torque branch
+        step = self.timed('physics', motor.physics_step)
+        count = self.count
+
+        def wrapper(*args):
+            if abs(motor.Npp * motor.Wr) <= 1e-3:
+                count('low_speed_branch')
+            return step(*args)
+        motor.physics_step = wrapper
+        return motor
+
+    def instrument(self, motor, controller, inverter, sensors):
+        self.wrap(sensors, 'measure', 'sensing')
+        self.wrap(controller, 'control_step', 'control')
+        self.wrap_inverter(inverter)
+        self.wrap_motor(motor)
+        self._stage('logging')
+
+    def release(self, motor, controller, inverter, sensors):
+        self.unwrap(sensors, 'measure')
+        self.unwrap(controller, 'control_step')
+        self.unwrap(inverter, 'step')
+        self.unwrap(motor, 'physics_step')
+
+    def percentile(self, stage, q):
+        # Upper edge (s) of the histogram bin holding the q-th percentile
+        counts = self.histogram[stage]
+        target = q / 100.0 * sum(counts)
+        seen = 0
+        for b, n in enumerate(counts):
+            seen += n
+            if n and seen >= target:
+                return 2.0**b * 1e-9
+        return math.nan
+
+    def as_dict(self):
+        grand = sum(self.total.values()) or 1
+        stages = {}
+        for stage in self.total:
+            calls = self.calls[stage]
+            stages[stage] = {
+                'calls': calls,
+                'total_s': self.total[stage] * 1e-9,
+                'mean_s': self.total[stage] * 1e-9 / calls if calls else math.nan,
+                'share': self.total[stage] / grand,
+                'p50_s': self.percentile(stage, 50),
+                'p99_s': self.percentile(stage, 99),
+                'histogram_ns_log2': list(self.histogram[stage]),
+            }
+        return {'stages': stages, 'counters': dict(self.counters)}
+
+    def report(self):
+        # Flat text table, one row per stage followed by the counters
+        data = self.as_dict()
+        lines = [f"{'stage':10s} {'calls':>10s} {'total (s)':>10s} {'mean (us)':>10s} "
+                 f"{'p99 (us)':>10s} {'share':>7s}"]
+        for stage, row in data['stages'].items():
+            lines.append(f"{stage:10s} {row['calls']:10d} {row['total_s']:10.4f} "
+                         f"{row['mean_s'] * 1e6:10.3f} {row['p99_s'] * 1e6:10.3f} "
+                         f"{100 * row['share']:6.1f}%")
+        for name, value in data['counters'].items():
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+    def chrome_trace(self, path):
+        # Complete ('X') events in microseconds, viewable in chrome://tracing
+        events = [
+            {'name': stage, 'ph': 'X', 'pid': 0, 'tid': 0,
+             'ts': (start - self.origin) * 1e-3, 'dur': dt * 1e-3}
+            for stage, start, dt in self.events
+        ]
+        for name, value in self.counters.items():
+            events.append({'name': name, 'ph': 'C', 'pid': 0, 'tid': 0,
+                           'ts': (time.perf_counter_ns() - self.origin) * 1e-3,
+                           'args': {name: value}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ns'}, f)
+
+
+def run_loop(motor, controller, inverter, sensors, profile, t_end, instrumentation):
+    # Simulation.run_loop with every stage, including logging, timed
+    Ts = motor.Ts
+    history, samples = Simulation.loop_history(profile, Ts, int(t_end / Ts), 0, motor.Npp)
+
+    instrumentation.instrument(motor, controller, inverter, sensors)
+    instrumentation.wrap(history, 'record', 'logging')
+    try:
+        Simulation.control_loop(motor, controller, sensors.measure, samples,
+                                Simulation.inverter_plant(motor, inverter),
+                                Simulation.history_recorder(motor, history))
+    finally:
+        instrumentation.release(motor, controller, inverter, sensors)
+        instrumentation.unwrap(history, 'record')
+
+    return history
@@ -0,0 +1,338 @@
+import math
+import numpy as np
+from . import Transforms
+
+# Integration schemes for BLACMotor/BLDCMotor.
+#   euler - the original semi-implicit forward Euler in physics_step
+#   rk4   - classic fixed-step Runge-Kutta
+#   rk45  - adaptive Dormand-Prince 5(4) with error control
+#   exp   - exact exponential (zero-order hold) update of the RL current
+#           dynamics with We frozen over the step, then the Euler mechanics
+#   zoh_table - 'exp' with the per-step discretization looked up in a
+#           ZOHTable cached on the motor instead of recomputed every step
+INTEGRATORS = ('euler', 'rk4', 'rk45', 'exp', 'zoh_table')
+
+# Dormand-Prince coefficients
+_DP_A = (
+    (),
+    (1/5,),
+    (3/40, 9/40),
+    (44/45, -56/15, 32/9),
+    (19372/6561, -25360/2187, 64448/6561, -212/729),
+    (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+    (35/384, 0.0, 500/1113, 125/192, -2187/6784, 11/84),
+)
+_DP_B = (35/384, 0.0, 500/1113, 125/192, -2187/6784, 11/84, 0.0)
+_DP_E = (71/57600, 0.0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40)
+
+
+def check_integrator(name):
+    if name not in INTEGRATORS:
+        raise ValueError(f"Invalid integrator '{name}', expected one of {INTEGRATORS}")
+    return name
+
+
+def torque(motor, Id, Iq, We, ed, eq):
+    # Same expression as physics_step
+    if abs(We) > 1e-3:
+        return 1.5 * motor.Npp * (ed * Id + eq * Iq) / We + \
+            1.5 * motor.Npp * (motor.Ld - motor.Lq) * Id * Iq
+    return 1.5 * motor.Npp * motor.Lambda_m * Iq
+
+
+def derivatives(motor, state, Va, Vb, Vc, Tload):
+    # state = (Id, Iq, Wr, theta); the phase voltages are held over the step
+    # (ZOH in the abc frame), so Vd/Vq follow the rotor angle.
+    Id, Iq, Wr, theta = state
+    motor.evaluations += 1
+
+    theta_e = (motor.Npp * theta) % (2 * math.pi)
+    cos_t = math.cos(theta_e)
+    sin_t = math.sin(theta_e)
+    We = motor.Npp * Wr
+
+    Vd, Vq = Transforms.abc_to_dq_cs(Va, Vb, Vc, cos_t, sin_t)
+    ed, eq = motor.back_emf_dq(theta_e, We, cos_t, sin_t)
+
+    dId = (1.0/motor.Ld) * (Vd - motor.Rs*Id + We*motor.Lq*Iq - ed)
+    dIq = (1.0/motor.Lq) * (Vq - motor.Rs*Iq - We*motor.Ld*Id - eq)
+
+    Te = torque(motor, Id, Iq, We, ed, eq)
+    Tc_dir = motor.Tc if Wr > 0 else (-motor.Tc if Wr < 0 else 0)
+    dWr = (Te - Tload - (motor.Bn * Wr) - Tc_dir) / motor.J
+
+    return (dId, dIq, dWr, Wr), Te
+
+
+def _end_torque(motor, state):
+    Id, Iq, Wr, theta = state
+    We = motor.Npp * Wr
+    ed, eq = motor.back_emf_dq((motor.Npp * theta) % (2 * math.pi), We)
+    return torque(motor, Id, Iq, We, ed, eq)
+
+
+def _combine(state, h, coeffs, ks):
+    out = list(state)
+    for c, k in zip(coeffs, ks):
+        if c != 0.0:
+            for i in range(4):
+                out[i] += h * c * k[i]
+    return tuple(out)
+
+
+def rk4_step(motor, state, Va, Vb, Vc, Tload, h):
+    k1, _ = derivatives(motor, state, Va, Vb, Vc, Tload)
+    k2, _ = derivatives(motor, _combine(state, h, (0.5,), (k1,)), Va, Vb, Vc, Tload)
+    k3, _ = derivatives(motor, _combine(state, h, (0.5,), (k2,)), Va, Vb, Vc, Tload)
+    k4, _ = derivatives(motor, _combine(state, h, (1.0,), (k3,)), Va, Vb, Vc, Tload)
+    state = _combine(state, h, (1/6, 1/3, 1/3, 1/6), (k1, k2, k3, k4))
+    return state, _end_torque(motor, state)
+
+
+def dopri_step(motor, state, Va, Vb, Vc, Tload, h):
+    # One Dormand-Prince step; returns the 5th order solution and the error
+    # estimate against the embedded 4th order one.
+    ks = []
+    for i in range(7):
+        stage = _combine(state, h, _DP_A[i], ks) if i else state
+        k, _ = derivatives(motor, stage, Va, Vb, Vc, Tload)
+        ks.append(k)
+    y = _combine(state, h, _DP_B, ks)
+    err = _combine((0.0, 0.0, 0.0, 0.0), h, _DP_E, ks)
+    return y, err
+
+
+def rk45_advance(motor, state, Va, Vb, Vc, Tload, dt):
+    # Adaptive integration over exactly dt. The last unclipped step size is
+    # kept on the motor to warm start the next call.
+    t = 0.0
+    h = motor.h_adapt
+    while t < dt:
+        clipped = h >= dt - t
+        step = dt - t if clipped else h
+        y, err = dopri_step(motor, state, Va, Vb, Vc, Tload, step)
+
+        norm = 0.0
+        for i in range(4):
+            scale = motor.atol + motor.rtol * max(abs(state[i]), abs(y[i]))
+            e = abs(err[i]) / scale
+            # max() drops NaN, so a non-finite estimate or state is a rejection
+            if not (math.isfinite(e) and math.isfinite(y[i])):
+                norm = math.inf
+                break
+            norm = max(norm, e)
+
+        if norm <= 1.0:
+            state = y
+            t = dt if clipped else t + step
+        elif step <= motor.h_min:
+            raise RuntimeError(f"rk45 step size fell below h_min = {motor.h_min:g} s")
+
+        factor = 5.0 if norm == 0.0 else min(5.0, max(0.2, 0.9 * norm ** -0.2))
+        h = step * factor
+        if not clipped or norm > 1.0:
+            motor.h_adapt = h
+    return state, _end_torque(motor, state)
+
+
+def expm2(a, b, c, d, h):
+    # Closed-form exp([[a, b], [c, d]] * h)
+    s = 0.5 * (a + d)
+    delta = 0.25 * (a - d) ** 2 + b * c
+    if delta < 0.0:
+        w = math.sqrt(-delta)
+        ch = math.cos(w * h)
+        sh = math.sin(w * h) / w
+    elif delta > 0.0:
+        w = math.sqrt(delta)
+        ch = math.cosh(w * h)
+        sh = math.sinh(w * h) / w
+    else:
+        ch = 1.0
+        sh = h
+    g = math.exp(s * h)
+    return (g * (ch + sh * (a - s)), g * sh * b,
+            g * sh * c, g * (ch + sh * (d - s)))
+
+
+def rl_zoh(Rs, Ld, Lq, We, h):
+    # Zero-order-hold discretization of the dq current dynamics
+    #   dI/dt = A I + u,  u = ((Vd - ed)/Ld, (Vq - eq)/Lq)
+    # I_next = Phi I + Gamma u, Gamma = A^-1 (Phi - I). A is invertible for Rs > 0.
+    a = -Rs / Ld
+    b = We * Lq / Ld
+    c = -We * Ld / Lq
+    d = -Rs / Lq
+    p11, p12, p21, p22 = expm2(a, b, c, d, h)
+
+    det = a * d - b * c
+    m11, m12, m21, m22 = p11 - 1.0, p12, p21, p22 - 1.0
+    g11 = (d * m11 - b * m21) / det
+    g12 = (d * m12 - b * m22) / det
+    g21 = (-c * m11 + a * m21) / det
+    g22 = (-c * m12 + a * m22) / det
+    return (p11, p12, p21, p22), (g11, g12, g21, g22)
+
+
+class ZOHTable:
+    # rl_zoh(Rs, Ld, Lq, We, h) tabulated on a grid of We with spacing
+    # We_step and linearly interpolated between bins. Bins are computed on
+    # first use, so only the speed range actually visited is stored. Phi
+    # and Gamma are smooth in We, the interpolation error is of the order
+    # of (We_step * h)**2.
+
+    def __init__(self, Rs, Ld, Lq, h, We_step=1.0):
+        if We_step <= 0:
+            raise ValueError("We_step must be positive")
+        self.Rs = Rs
+        self.Ld = Ld
+        self.Lq = Lq
+        self.h = h
+        self.We_step = We_step
+        self.inv_step = 1.0 / We_step
+        self.bins = {}
+
+    def key(self):
+        return (self.Rs, self.Ld, self.Lq, self.h, self.We_step)
+
+    def _bin(self, i):
+        entry = self.bins.get(i)
+        if entry is None:
+            Phi, Gamma = rl_zoh(self.Rs, self.Ld, self.Lq, i * self.We_step, self.h)
+            entry = self.bins[i] = Phi + Gamma
+        return entry
+
+    def lookup(self, We):
+        x = We * self.inv_step
+        i = math.floor(x)
+        f = x - i
+        a0, a1, a2, a3, a4, a5, a6, a7 = self._bin(i)
+        b0, b1, b2, b3, b4, b5, b6, b7 = self._bin(i + 1)
+        return ((a0 + f * (b0 - a0), a1 + f * (b1 - a1), a2 + f * (b2 - a2), a3 + f * (b3 - a3)),
+                (a4 + f * (b4 - a4), a5 + f * (b5 - a5), a6 + f * (b6 - a6), a7 + f * (b7 - a7)))
+
+
+def zoh_table(motor):
+    # The motor's ZOHTable, rebuilt whenever Rs, Ld, Lq, Ts or We_step changed
+    table = motor.zoh_cache
+    if table is None or table.key() != (motor.Rs, motor.Ld, motor.Lq, motor.Ts, motor.We_step):
+        table = motor.zoh_cache = ZOHTable(motor.Rs, motor.Ld, motor.Lq, motor.Ts, motor.We_step)
+    return table
+
+
+def rl_discretization(motor, We, h):
+    # Table lookup for full steps of a 'zoh_table' motor, exact otherwise
+    # (partial steps from run_with_events, other integrators)
+    if motor.integrator == 'zoh_table' and h == motor.Ts:
+        return zoh_table(motor).lookup(We)
+    return rl_zoh(motor.Rs, motor.Ld, motor.Lq, We, h)
+
+
+def exp_advance(motor, state, Va, Vb, Vc, Tload, dt):
+    Id, Iq, Wr, theta = state
+    motor.evaluations += 1
+
+    theta_e = (motor.Npp * theta) % (2 * math.pi)
+    cos_t = math.cos(theta_e)
+    sin_t = math.sin(theta_e)
+    We = motor.Npp * Wr
+
+    Vd, Vq = Transforms.abc_to_dq_cs(Va, Vb, Vc, cos_t, sin_t)
+    ed, eq = motor.back_emf_dq(theta_e, We, cos_t, sin_t)
+
+    (p11, p12, p21, p22), (g11, g12, g21, g22) = motor.rl_discretization(We, dt)
+    ud = (Vd - ed) / motor.Ld
+    uq = (Vq - eq) / motor.Lq
+    Id_next = p11 * Id + p12 * Iq + g11 * ud + g12 * uq
+    Iq_next = p21 * Id + p22 * Iq + g21 * ud + g22 * uq
+
+    # Mechanics as in physics_step: torque from the updated currents
+    Te = torque(motor, Id_next, Iq_next, We, ed, eq)
+    Tc_dir = motor.Tc if Wr > 0 else (-motor.Tc if Wr < 0 else 0)
+    accel = (Te - Tload - (motor.Bn * Wr) - Tc_dir) / motor.J
+    Wr_next = Wr + accel * dt
+    theta_next = theta + Wr_next * dt
+
+    return (Id_next, Iq_next, Wr_next, theta_next), Te
+
+
+def euler_advance(motor, state, Va, Vb, Vc, Tload, dt):
+    # Semi-implicit Euler of physics_step applied to the motor's own dq state
+    Id, Iq, Wr, theta = state
+    (dId, dIq, _, _), _ = derivatives(motor, state, Va, Vb, Vc, Tload)
+    Id_next = Id + dt * dId
+    Iq_next = Iq + dt * dIq
+
+    We = motor.Npp * Wr
+    ed, eq = motor.back_emf_dq((motor.Npp * theta) % (2 * math.pi), We)
+    Te = torque(motor, Id_next, Iq_next, We, ed, eq)
+    Tc_dir = motor.Tc if Wr > 0 else (-motor.Tc if Wr < 0 else 0)
+    accel = (Te - Tload - (motor.Bn * Wr) - Tc_dir) / motor.J
+    Wr_next = Wr + accel * dt
+
+    return (Id_next, Iq_next, Wr_next, theta + Wr_next * dt), Te
+
+
+_ADVANCE = {
+    'euler': euler_advance,
+    'rk4': rk4_step,
+    'rk45': rk45_advance,
+    'exp': exp_advance,
+    'zoh_table': exp_advance,
+}
+
+
+def advance(motor, Va, Vb, Vc, Tload, dt):
+    # Integrates the motor over dt with its integrator and constant inputs.
+    # Returns the electromagnetic torque at the end of the interval.
+    state = (motor.Id, motor.Iq, motor.Wr, motor.theta)
+    (Id, Iq, Wr, theta), Te = _ADVANCE[motor.integrator](motor, state, Va, Vb, Vc, Tload, dt)
+
+    motor.Id = Id
+    motor.Iq = Iq
+    motor.Wr = Wr
+    motor.theta = theta % (2 * math.pi)
+
+    return Te
+
+
+def physics_step(motor, Va, Vb, Vc, Tload):
+    # physics_step for the non-Euler integrators. theta_e keeps the
+    # physics_step convention (angle at the start of the step) for Sensors.
+    motor.theta_e = (motor.Npp * motor.theta) % (2 * math.pi)
+    return advance(motor, Va, Vb, Vc, Tload, motor.Ts)
+
+
+def run_with_events(motor, controller, inverter, sensors, profile, t_end, breakpoints=None):
+    # Simulation.control_loop with the controller sampled every controller.Ts.
+    # The physics of each control period is split at every breakpoint that
+    # falls inside it, so load steps hit the plant exactly at their time
+    # instead of at the next sample. Reference changes still take effect at
+    # the next controller sample, like in the drive. A Profile.Profile
+    # supplies its own breakpoints.
+    from . import Simulation  # Simulation imports the motors, which import this module
+
+    Ts = controller.Ts
+    if breakpoints is None:
+        breakpoints = profile.breakpoints() if hasattr(profile, 'breakpoints') else ()
+    breakpoints = np.sort(np.asarray(breakpoints, dtype=float))
+    history, samples = Simulation.loop_history(profile, Ts, int(t_end / Ts), 0, motor.Npp)
+
+    def plant(k, Va_ref, Vb_ref, Vc_ref, V_bus, Tload, Ia, Ib, Ic):
+        Va, Vb, Vc = inverter.step(Va_ref, Vb_ref, Vc_ref, V_bus)
+
+        motor.theta_e = (motor.Npp * motor.theta) % (2 * math.pi)
+        t = k * Ts
+        t_next = t + Ts
+        lo, hi = np.searchsorted(breakpoints, (t, t_next), side='right')
+        edges = [t] + breakpoints[lo:hi].tolist() + [t_next]
+        for t0, t1 in zip(edges[:-1], edges[1:]):
+            if t1 > t0:
+                # The load of a segment is its value strictly inside it
+                Tload_segment = profile(0.5 * (t0 + t1))[1]
+                Te = advance(motor, Va, Vb, Vc, Tload_segment, t1 - t0)
+        return Te
+
+    Simulation.control_loop(motor, controller, sensors.measure, samples, plant,
+                            Simulation.history_recorder(motor, history))
+    return history
@@ -1,4 +1,5 @@
 import math
+from . import Transforms
 
 class Inverter:
     def __init__(self):
@@ -12,3 +13,14 @@ class Inverter:
         Vc = max(-limit, min(limit, Vc_ref))
         
         return Va, Vb, Vc
+
+    def step_dq(self, Vd_ref, Vq_ref, Vbus, cos_t, sin_t):
+        # A phase reaches the clamp only when the voltage vector leaves the
+        # circle of radius Vbus/2; inside it the references pass unchanged.
+        # Outside it the per-phase clamp above is applied in abc.
+        limit = Vbus / 2.0
+        if Vd_ref * Vd_ref + Vq_ref * Vq_ref <= limit * limit:
+            return Vd_ref, Vq_ref
+
+        Va, Vb, Vc = self.step(*Transforms.dq_to_abc_cs(Vd_ref, Vq_ref, cos_t, sin_t), Vbus)
+        return Transforms.abc_to_dq_cs(Va, Vb, Vc, cos_t, sin_t)
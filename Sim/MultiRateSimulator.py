@@ -0,0 +1,107 @@
+import numpy as np
+from . import Transforms
+from . import Simulation
+from .Profile import evaluate_profile
+from .SimulationResult import SimulationResult
+
+
+def _ticks(period, base, name):
+    ticks = int(round(period / base))
+    if ticks < 1 or abs(ticks * base - period) > 1e-9 * period:
+        raise ValueError(f"{name} must be an integer multiple of Ts_physics")
+    return ticks
+
+
+class _SpeedDecimator:
+    # control_step of controller with the speed loop run on every `every`-th
+    # call only; the current loop runs on every call with the held Iq_ref
+
+    def __init__(self, controller, every):
+        self.controller = controller
+        self.every = every
+        self.count = 0
+        self.Iq_ref = 0.0
+
+    def control_step(self, RPMref, Wr, Ia, Ib, Ic, theta_e, Vbus):
+        if self.count == 0:
+            self.count = self.every
+            self.Iq_ref = self.controller.speed_step(RPMref, Wr)
+        self.count -= 1
+        return self.controller.current_step(self.Iq_ref, Ia, Ib, Ic, theta_e, Vbus)
+
+
+class MultiRateSimulator:
+    # Runs the Simulate.py loop with one rate per block:
+    #   physics       every Ts_physics, with the inverter voltages held (ZOH)
+    #   current loop  every Ts_current (sensing + current PIs + inverter)
+    #   speed loop    every Ts_speed
+    #   logging       every Ts_log
+    # All periods must be integer multiples of Ts_physics, and Ts_speed of
+    # Ts_current. The motor and controller sample times are set to match.
+
+    def __init__(self, motor, controller, inverter, sensors, profile,
+                 Ts_physics, Ts_current=None, Ts_speed=None, Ts_log=None):
+        Ts_current = Ts_physics if Ts_current is None else Ts_current
+        Ts_speed = Ts_current if Ts_speed is None else Ts_speed
+        Ts_log = Ts_current if Ts_log is None else Ts_log
+
+        self.motor = motor
+        self.controller = controller
+        self.inverter = inverter
+        self.sensors = sensors
+        self.profile = profile
+
+        self.Ts_physics = Ts_physics
+        self.current_every = _ticks(Ts_current, Ts_physics, 'Ts_current')
+        self.speed_every = _ticks(Ts_speed, Ts_physics, 'Ts_speed')
+        self.log_every = _ticks(Ts_log, Ts_physics, 'Ts_log')
+        if self.speed_every % self.current_every != 0:
+            raise ValueError("Ts_speed must be an integer multiple of Ts_current")
+
+        motor.Ts = Ts_physics
+        controller.Ts = Ts_current
+        controller.Ts_speed = Ts_speed
+
+    def run(self, t_end):
+        motor = self.motor
+        controller = self.controller
+        inverter = self.inverter
+        sensors = self.sensors
+        profile = self.profile
+        Ts = self.Ts_physics
+
+        num_ticks = int(t_end / Ts)
+        num_logs = (num_ticks + self.log_every - 1) // self.log_every
+        history = SimulationResult(self.log_every * Ts, num_logs, 0, motor.Npp)
+
+        # The profile is read at every current-loop tick, and each logged
+        # sample holds the inputs of the last current-loop tick before it
+        num_updates = (num_ticks + self.current_every - 1) // self.current_every
+        samples = evaluate_profile(profile, np.arange(num_updates) * self.current_every * Ts)
+        logged = np.arange(num_logs) * self.log_every // self.current_every
+        history.set_inputs(*(x[logged] for x in samples))
+
+        # Simulation.control_loop steps at the current-loop rate; its plant
+        # runs the physics ticks of one period and does the logging.
+        # Countdown instead of modulo test; a sample is logged when it hits 0
+        log_in = [0, 0]  # countdown and index of the next logged sample
+
+        def plant(k, Va_ref, Vb_ref, Vc_ref, V_bus, Tload, Ia, Ib, Ic):
+            Va, Vb, Vc = inverter.step(Va_ref, Vb_ref, Vc_ref, V_bus)
+            for tick in range(min(self.current_every, num_ticks - k * self.current_every)):
+                # The physics always gets the true phase currents, not the sensors'
+                Ia, Ib, Ic = Transforms.dq_to_abc(motor.Id, motor.Iq, motor.theta_e)
+
+                Te = motor.physics_step(Va, Vb, Vc, Tload, Ia, Ib, Ic)
+
+                if log_in[0] == 0:
+                    log_in[0] = self.log_every
+                    history.record(log_in[1], motor.Wr, motor.Iq, motor.Id, Te, motor.theta)
+                    log_in[1] += 1
+                log_in[0] -= 1
+            return Te
+
+        Simulation.control_loop(motor, _SpeedDecimator(controller, self.speed_every // self.current_every),
+                                sensors.measure, samples, plant)
+
+        return history
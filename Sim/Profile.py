@@ -0,0 +1,253 @@
+import bisect
+import hashlib
+import json
+import math
+import numpy as np
+
+# Reference/load profiles. A Signal is a piecewise function of time made of
+# constant, ramp, sinusoid or sampled time-series segments. A segment that
+# starts at t0 applies for t > t0, matching the `if t > 0.2:` convention of
+# Simulate.py, so a step at t0 is seen first by the sample after t0.
+
+
+class Signal:
+    def __init__(self, initial=0.0):
+        self.initial = float(initial)
+        self.starts = []
+        self.segments = []
+
+    def _add(self, t_start, segment):
+        t_start = float(t_start)
+        if self.starts and t_start <= self.starts[-1]:
+            raise ValueError("Segments must be added in increasing time order")
+        self.starts.append(t_start)
+        self.segments.append(segment)
+        return self
+
+    def _end_value(self):
+        # Value the signal settles at after its last segment started
+        if not self.segments:
+            return self.initial
+        kind = self.segments[-1][0]
+        if kind == 'const':
+            return self.segments[-1][1]
+        raise ValueError("A ramp can only start from a constant value")
+
+    def hold(self, t_start, value):
+        return self._add(t_start, ('const', float(value)))
+
+    def ramp(self, t_start, t_end, value):
+        # Linear from the current value at t_start to value at t_end, then held
+        if t_end <= t_start:
+            raise ValueError("t_end must be after t_start")
+        v0 = self._end_value()
+        self._add(t_start, ('ramp', float(t_start), v0, float(t_end), float(value)))
+        return self._add(t_end, ('const', float(value)))
+
+    def sine(self, t_start, offset, amplitude, frequency, phase=0.0):
+        # offset + amplitude * sin(2*pi*frequency*(t - t_start) + phase) until the next segment
+        return self._add(t_start, ('sine', float(t_start), float(offset), float(amplitude),
+                                   float(frequency), float(phase)))
+
+    @classmethod
+    def from_series(cls, times, values, interpolation='previous'):
+        # Sampled drive cycle; 'previous' holds each sample until the next one
+        times = np.asarray(times, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if times.ndim != 1 or times.shape != values.shape or len(times) == 0:
+            raise ValueError("times and values must be 1-D arrays of the same length")
+        if np.any(np.diff(times) <= 0):
+            raise ValueError("times must be strictly increasing")
+        if interpolation not in ('previous', 'linear'):
+            raise ValueError("interpolation must be 'previous' or 'linear'")
+        signal = cls(values[0])
+        return signal._add(times[0], ('series', times, values, interpolation))
+
+    @classmethod
+    def from_dict(cls, spec):
+        # Signal from plain data (scenario files): a number, a sampled series
+        # {'times': [...], 'values': [...], 'interpolation': 'previous'} or
+        # {'initial': v, 'segments': [['hold', t, v], ['ramp', t0, t1, v],
+        #  ['sine', t0, offset, amplitude, frequency, phase], ...]}
+        if isinstance(spec, (int, float)):
+            return cls(spec)
+        if 'times' in spec:
+            return cls.from_series(spec['times'], spec['values'], spec.get('interpolation', 'previous'))
+        signal = cls(spec.get('initial', 0.0))
+        for kind, *args in spec.get('segments', []):
+            if kind not in ('hold', 'ramp', 'sine'):
+                raise ValueError(f"Unknown segment '{kind}'")
+            getattr(signal, kind)(*args)
+        return signal
+
+    def breakpoints(self):
+        points = list(self.starts)
+        for segment in self.segments:
+            if segment[0] == 'series':
+                points.extend(segment[1][1:].tolist())
+        return sorted(set(points))
+
+    def _segment_value(self, segment, t):
+        kind = segment[0]
+        if kind == 'const':
+            return segment[1] + 0.0 * t
+        elif kind == 'ramp':
+            _, t0, v0, t1, v1 = segment
+            return v0 + (v1 - v0) * (t - t0) / (t1 - t0)
+        elif kind == 'sine':
+            _, t0, offset, amplitude, frequency, phase = segment
+            return offset + amplitude * np.sin(2 * math.pi * frequency * (t - t0) + phase)
+        else:
+            _, times, values, interpolation = segment
+            if interpolation == 'linear':
+                return np.interp(t, times, values)
+            # Same strict convention as the segments: a sample applies after its time
+            i = np.searchsorted(times, t, side='left') - 1
+            return values[np.clip(i, 0, len(values) - 1)]
+
+    def __call__(self, t):
+        i = bisect.bisect_left(self.starts, t) - 1
+        if i < 0:
+            return self.initial
+        return float(self._segment_value(self.segments[i], t))
+
+    def evaluate(self, t):
+        # Vectorized over an array of times
+        t = np.asarray(t, dtype=float)
+        out = np.full(t.shape, self.initial)
+        index = np.searchsorted(self.starts, t, side='left') - 1
+        for i, segment in enumerate(self.segments):
+            mask = index == i
+            if mask.any():
+                out[mask] = self._segment_value(segment, t[mask])
+        return out
+
+    def describe(self):
+        segments = []
+        for start, segment in zip(self.starts, self.segments):
+            if segment[0] == 'series':
+                digest = hashlib.sha256(segment[1].tobytes() + segment[2].tobytes()).hexdigest()
+                segment = ('series', digest, segment[3])
+            segments.append((start,) + tuple(segment))
+        return {'initial': self.initial, 'segments': segments}
+
+
+class Profile:
+    # RPMref, Tload and Vbus signals. profile(t) returns (RPMref, Tload, Vbus)
+    # like the callables used before; sample() evaluates a whole time grid
+    # at once and breakpoints() lists every discontinuity for integrators
+    # and schedulers that need to step onto them.
+
+    CHANNELS = ('RPMref', 'Tload', 'Vbus')
+
+    def __init__(self, RPMref=None, Tload=None, Vbus=None):
+        self.RPMref = RPMref if isinstance(RPMref, Signal) else Signal(RPMref or 0.0)
+        self.Tload = Tload if isinstance(Tload, Signal) else Signal(Tload or 0.0)
+        self.Vbus = Vbus if isinstance(Vbus, Signal) else Signal(311.0 if Vbus is None else Vbus)
+
+    @classmethod
+    def default(cls):
+        # Profile of Simulate.py and compare_motors.py
+        return cls(
+            RPMref=Signal(40.0).hold(0.4, 80.0).hold(0.6, 40.0),
+            Tload=Signal(0.0).hold(0.2, 20.0).hold(0.8, 0.0),
+            Vbus=Signal(311.0),
+        )
+
+    @classmethod
+    def from_csv(cls, path, interpolation='previous', delimiter=',', skip_header=1):
+        # Drive cycle with columns time, rpm_ref, tload and optionally vbus
+        data = np.genfromtxt(path, delimiter=delimiter, skip_header=skip_header, ndmin=2)
+        times = data[:, 0]
+        signals = [Signal.from_series(times, data[:, j], interpolation) for j in (1, 2)]
+        vbus = Signal.from_series(times, data[:, 3], interpolation) if data.shape[1] > 3 else None
+        return cls(signals[0], signals[1], vbus)
+
+    @classmethod
+    def from_dict(cls, spec):
+        # 'default', {'csv': path, ...from_csv options} or one Signal.from_dict
+        # entry per channel; missing channels keep the defaults of __init__
+        if spec is None or spec == 'default':
+            return cls.default()
+        if 'csv' in spec:
+            options = {k: v for k, v in spec.items() if k != 'csv'}
+            return cls.from_csv(spec['csv'], **options)
+        for name in spec:
+            if name not in cls.CHANNELS:
+                raise ValueError(f"Unknown profile channel '{name}'")
+        return cls(**{name: Signal.from_dict(value) for name, value in spec.items()})
+
+    def signals(self):
+        return (self.RPMref, self.Tload, self.Vbus)
+
+    def __call__(self, t):
+        return self.RPMref(t), self.Tload(t), self.Vbus(t)
+
+    def evaluate(self, t):
+        return tuple(signal.evaluate(t) for signal in self.signals())
+
+    def sample(self, Ts, num_steps, start=0):
+        # Values at t = k * Ts for k = start .. start + num_steps - 1
+        t = np.arange(start, start + num_steps) * Ts
+        return self.evaluate(t)
+
+    def breakpoints(self):
+        return sorted(set().union(*(signal.breakpoints() for signal in self.signals())))
+
+    def cache_key(self):
+        spec = {name: signal.describe() for name, signal in zip(self.CHANNELS, self.signals())}
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+default_profile = Profile.default()
+
+
+def sample_profile(profile, Ts, num_steps, start=0):
+    # (RPMref, Tload, Vbus) arrays on the time grid for any profile: a
+    # Profile is evaluated vectorized, a plain callable once per step.
+    if hasattr(profile, 'sample'):
+        return profile.sample(Ts, num_steps, start)
+
+    rpm_ref = np.zeros(num_steps)
+    tload = np.zeros(num_steps)
+    vbus = np.zeros(num_steps)
+    for i in range(num_steps):
+        rpm_ref[i], tload[i], vbus[i] = profile((start + i) * Ts)
+    return rpm_ref, tload, vbus
+
+
+def evaluate_profile(profile, t):
+    # (RPMref, Tload, Vbus) arrays at arbitrary times t: vectorized for a
+    # Profile, one call per time for a plain callable
+    if hasattr(profile, 'evaluate'):
+        return profile.evaluate(t)
+    values = np.array([profile(x) for x in np.asarray(t, dtype=float).tolist()], dtype=float)
+    values = values.reshape(-1, 3)
+    return values[:, 0].copy(), values[:, 1].copy(), values[:, 2].copy()
+
+
+class ProfileBatch:
+    # One profile per batch member for BatchSimulator; sample() returns
+    # (num_steps, N) arrays and profile(t) length-N arrays.
+
+    def __init__(self, profiles):
+        self.profiles = list(profiles)
+
+    def __call__(self, t):
+        values = np.array([profile(t) for profile in self.profiles])
+        return values[:, 0], values[:, 1], values[:, 2]
+
+    def sample(self, Ts, num_steps, start=0):
+        columns = [sample_profile(profile, Ts, num_steps, start) for profile in self.profiles]
+        return tuple(np.column_stack([c[j] for c in columns]) for j in range(3))
+
+    def breakpoints(self):
+        points = set()
+        for profile in self.profiles:
+            if hasattr(profile, 'breakpoints'):
+                points.update(profile.breakpoints())
+        return sorted(points)
+
+    def cache_key(self):
+        keys = [profile.cache_key() for profile in self.profiles]
+        return hashlib.sha256(json.dumps(keys).encode()).hexdigest()
@@ -0,0 +1,200 @@
+import collections
+import math
+import multiprocessing
+import os
+import socket
+import struct
+import time
+import numpy as np
+from . import Simulation
+
+# Real-time paced loop for testing firmware-like controllers. Every step of
+# Simulate.py's loop starts on a wall-clock tick of Ts; the controller can
+# be a local FOCController or a SocketController talking to an external
+# process. The run reports how late each step started (jitter), how many
+# steps overran their period (deadline misses) and the round-trip latency
+# of the external controller.
+#
+# Wire format (native byte order, one message per step):
+#   request  seq, RPMref, Wr, Ia, Ib, Ic, theta_e, Vbus   (int64 + 7 doubles)
+#   reply    seq, Va_ref, Vb_ref, Vc_ref                   (int64 + 3 doubles)
+
+REQUEST = struct.Struct('=q7d')
+REPLY = struct.Struct('=q3d')
+
+# Sleep until this close to a tick, then spin for the rest
+SPIN_NS = 200000
+
+
+def _socket(address):
+    # str -> Unix domain socket path, (host, port) -> TCP
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return data
+
+
+def serve_controller(controller, address, ready=None):
+    # Firmware side: answers control_step requests from one client until it
+    # disconnects. ready (a multiprocessing.Event) is set once listening.
+    server = _socket(address)
+    if isinstance(address, str) and os.path.exists(address):
+        os.unlink(address)
+    server.bind(address)
+    server.listen(1)
+    if ready is not None:
+        ready.set()
+    try:
+        conn, _ = server.accept()
+        if not isinstance(address, str):
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with conn:
+            while True:
+                try:
+                    seq, *inputs = REQUEST.unpack(_recv_exact(conn, REQUEST.size))
+                except ConnectionError:
+                    break
+                conn.sendall(REPLY.pack(seq, *controller.control_step(*inputs)))
+    finally:
+        server.close()
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)
+
+
+def _serve_foc(address, Ts, controller_params, ready):
+    serve_controller(Simulation.make_controller(Ts, controller_params), address, ready)
+
+
+def start_controller_process(address, Ts, controller_params=None):
+    # Stand-in firmware: an FOCController served from a separate process
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=_serve_foc, args=(address, Ts, controller_params, ready),
+                                      daemon=True)
+    process.start()
+    if not ready.wait(10.0):
+        process.terminate()
+        raise RuntimeError("Controller process did not start")
+    return process
+
+
+class SocketController:
+    # Drop-in for FOCController.control_step backed by an external process.
+    # A reply that does not arrive within timeout is counted and the last
+    # voltages are held; its late answer is discarded by sequence number.
+    # A request that cannot be sent within timeout may have left a partial
+    # frame on the wire, so it closes the connection with a ConnectionError.
+    # latencies keeps the round trips of the last latency_window replies.
+
+    def __init__(self, address, timeout=1e-3, latency_window=100000):
+        self.sock = _socket(address)
+        self.sock.connect(address)
+        self.sock.settimeout(timeout)
+        self.seq = 0
+        self.buffer = b''
+        self.last = (0.0, 0.0, 0.0)
+        self.timeouts = 0
+        self.latencies = collections.deque(maxlen=latency_window)
+
+    def control_step(self, RPMref, Wr, Ia, Ib, Ic, theta_e, Vbus):
+        self.seq += 1
+        start = time.perf_counter_ns()
+        try:
+            self.sock.sendall(REQUEST.pack(self.seq, RPMref, Wr, Ia, Ib, Ic, theta_e, Vbus))
+        except socket.timeout as e:
+            self.close()
+            raise ConnectionError("Timed out sending a request to the controller") from e
+        try:
+            while True:
+                # Partial replies stay buffered across a timeout
+                while len(self.buffer) < REPLY.size:
+                    chunk = self.sock.recv(4096)
+                    if not chunk:
+                        raise ConnectionError("Controller closed the connection")
+                    self.buffer += chunk
+                seq, Va, Vb, Vc = REPLY.unpack_from(self.buffer)
+                self.buffer = self.buffer[REPLY.size:]
+                if seq == self.seq:
+                    break
+        except socket.timeout:
+            self.timeouts += 1
+            return self.last
+        self.latencies.append(time.perf_counter_ns() - start)
+        self.last = (Va, Vb, Vc)
+        return self.last
+
+    def close(self):
+        self.sock.close()
+
+
+def _percentiles(samples_ns):
+    if len(samples_ns) == 0:
+        return {}
+    s = np.asarray(samples_ns, dtype=float) * 1e-9
+    return {'mean': float(np.mean(s)), 'p50': float(np.percentile(s, 50)),
+            'p99': float(np.percentile(s, 99)), 'max': float(np.max(s))}
+
+
+def run_paced(motor, controller, inverter, sensors, profile, t_end, Ts=None):
+    # Loop of Simulate.py paced to wall-clock time. Returns (history, stats):
+    # stats holds the start jitter and step time distributions (s), the
+    # number of deadline misses (a step still running at the next tick) and,
+    # for a SocketController, its latency distribution and timeouts.
+    Ts = motor.Ts if Ts is None else Ts
+    num_steps = int(t_end / Ts)
+    Ts_ns = round(Ts * 1e9)
+
+    history, samples = Simulation.loop_history(profile, Ts, num_steps, 0, motor.Npp)
+    jitter = np.zeros(num_steps, dtype=np.int64)
+    busy = np.zeros(num_steps, dtype=np.int64)
+
+    clock = time.perf_counter_ns
+    origin = clock() + Ts_ns
+    step = [0, 0]  # index and start time of the running step
+
+    # Each step starts with sensing: wait for its tick there, and stop its
+    # timer once logged
+    def paced_measure(motor, RPMref):
+        tick = origin + step[0] * Ts_ns
+        remaining = tick - clock()
+        if remaining > SPIN_NS:
+            time.sleep((remaining - SPIN_NS) * 1e-9)
+        while clock() < tick:
+            pass
+        step[1] = clock()
+        jitter[step[0]] = step[1] - tick
+        return sensors.measure(motor, RPMref)
+
+    record = Simulation.history_recorder(motor, history)
+
+    def paced_record(k, Te):
+        record(k, Te)
+        busy[k] = clock() - step[1]
+        step[0] = k + 1
+
+    Simulation.control_loop(motor, controller, paced_measure, samples,
+                            Simulation.inverter_plant(motor, inverter), paced_record)
+
+    stats = {
+        'steps': num_steps,
+        'Ts': Ts,
+        'jitter': _percentiles(jitter),
+        'step_time': _percentiles(busy),
+        'deadline_misses': int(np.count_nonzero(jitter + busy > Ts_ns)),
+        'utilization': float(np.mean(busy)) / Ts_ns if num_steps else math.nan,
+    }
+    if isinstance(controller, SocketController):
+        stats['controller_latency'] = _percentiles(controller.latencies)
+        stats['controller_timeouts'] = controller.timeouts
+
+    return history, stats
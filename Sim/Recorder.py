@@ -0,0 +1,173 @@
+import json
+import math
+import os
+import numpy as np
+
+HISTORY_CHANNELS = ('time', 'rpm_ref', 'rpm_act', 'Iq', 'Id', 'Te', 'Tload', 'Vbus')
+
+INDEX_FILE = 'index.json'
+
+
+def _channel_file(path, name, kind=None):
+    suffix = '.f64' if kind is None else f'.{kind}.f64'
+    return os.path.join(path, name + suffix)
+
+
+class StreamRecorder:
+    # Records samples into a fixed-size chunk buffer and appends each full
+    # chunk to one raw float64 file per channel, so memory stays constant
+    # whatever the run length. Channels can be decimated (one sample kept
+    # per block) and keep the min/max envelope of every block so short
+    # peaks survive the downsampling. index.json is rewritten after each
+    # flush; StreamReader only sees flushed data and can follow a live run.
+
+    def __init__(self, path, channels=HISTORY_CHANNELS, chunk_size=8192, decimation=None,
+                 envelope=True):
+        self.path = path
+        self.channels = tuple(channels)
+        decimation = decimation or {}
+        for name in decimation:
+            if name not in self.channels:
+                raise ValueError(f"Unknown channel '{name}'")
+        self.decimation = [int(decimation.get(name, 1)) for name in self.channels]
+        if min(self.decimation) < 1:
+            raise ValueError("decimation factors must be >= 1")
+
+        # Envelopes only make sense for decimated channels
+        if envelope is True:
+            envelope = [name for name, d in zip(self.channels, self.decimation) if d > 1]
+        self.envelope = set(envelope or ())
+
+        # Every chunk holds whole decimation blocks
+        step = 1
+        for d in self.decimation:
+            step = step * d // math.gcd(step, d)
+        self.chunk_size = -(-chunk_size // step) * step
+
+        self.buffer = np.empty((self.chunk_size, len(self.channels)))
+        self.fill = 0
+        self.samples = 0
+        self.counts = [0] * len(self.channels)
+
+        os.makedirs(path, exist_ok=True)
+        self.files = {}
+        for name in self.channels:
+            self.files[name] = open(_channel_file(path, name), 'wb')
+            if name in self.envelope:
+                self.files[name, 'min'] = open(_channel_file(path, name, 'min'), 'wb')
+                self.files[name, 'max'] = open(_channel_file(path, name, 'max'), 'wb')
+        self._write_index(complete=False)
+
+    def append(self, *values):
+        self.buffer[self.fill] = values
+        self.fill += 1
+        if self.fill == self.chunk_size:
+            self.flush()
+
+    def extend(self, block):
+        # block: (n, len(channels)) array, or a dict of equal-length arrays
+        if isinstance(block, dict):
+            block = np.column_stack([np.asarray(block[name], dtype=float) for name in self.channels])
+        start = 0
+        while start < len(block):
+            n = min(len(block) - start, self.chunk_size - self.fill)
+            self.buffer[self.fill:self.fill + n] = block[start:start + n]
+            self.fill += n
+            start += n
+            if self.fill == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        n = self.fill
+        if n == 0:
+            return
+
+        for j, name in enumerate(self.channels):
+            d = self.decimation[j]
+            column = self.buffer[:n, j]
+            column[::d].tofile(self.files[name])
+            self.counts[j] += len(column[::d])
+
+            if name in self.envelope:
+                blocks = -(-n // d)
+                padded = np.full(blocks * d, np.nan)
+                padded[:n] = column
+                padded = padded.reshape(blocks, d)
+                np.nanmin(padded, axis=1).tofile(self.files[name, 'min'])
+                np.nanmax(padded, axis=1).tofile(self.files[name, 'max'])
+
+        for f in self.files.values():
+            f.flush()
+
+        self.samples += n
+        self.fill = 0
+        self._write_index(complete=False)
+
+    def _write_index(self, complete):
+        index = {
+            'channels': list(self.channels),
+            'decimation': self.decimation,
+            'envelope': sorted(self.envelope),
+            'counts': self.counts,
+            'samples': self.samples,
+            'complete': complete,
+        }
+        tmp = os.path.join(self.path, INDEX_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.path, INDEX_FILE))
+
+    def close(self):
+        if not self.files:
+            return
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        self._write_index(complete=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StreamReader:
+    # Read-only memory-mapped view of a StreamRecorder directory. Call
+    # refresh() to pick up chunks flushed since the last look.
+
+    def __init__(self, path):
+        self.path = path
+        self.refresh()
+
+    def refresh(self):
+        with open(os.path.join(self.path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.channels = self.index['channels']
+        self.complete = self.index['complete']
+        return self
+
+    def _map(self, name, kind=None):
+        count = self.index['counts'][self.channels.index(name)]
+        if count == 0:
+            return np.zeros(0)
+        return np.memmap(_channel_file(self.path, name, kind), dtype=np.float64, mode='r', shape=(count,))
+
+    def __getitem__(self, name):
+        return self._map(name)
+
+    def __contains__(self, name):
+        return name in self.channels
+
+    def keys(self):
+        return list(self.channels)
+
+    def decimation(self, name):
+        return self.index['decimation'][self.channels.index(name)]
+
+    def envelope(self, name):
+        # (min, max) of every decimation block of the channel
+        if name not in self.index['envelope']:
+            raise KeyError(f"Channel '{name}' has no envelope")
+        return self._map(name, 'min'), self._map(name, 'max')
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from .SimulationResult import SimulationResult
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_source_version = None
+
+
+def source_version():
+    # Hash of every simulator module, so editing the model invalidates the cache
+    global _source_version
+    if _source_version is None:
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(SIM_DIR)):
+            if name.endswith('.py'):
+                digest.update(name.encode())
+                with open(os.path.join(SIM_DIR, name), 'rb') as f:
+                    digest.update(f.read())
+        _source_version = digest.hexdigest()
+    return _source_version
+
+
+def profile_token(profile, Ts, num_steps):
+    # Profiles that know how to describe themselves provide cache_key();
+    # sampleable ones are identified by their samples on the time grid, in
+    # one vectorized call. Plain callables give None: hashing them would
+    # cost a Python call per step on every lookup, so they bypass the cache.
+    if hasattr(profile, 'cache_key'):
+        return profile.cache_key()
+    if not hasattr(profile, 'sample'):
+        return None
+
+    digest = hashlib.sha256()
+    for values in profile.sample(Ts, num_steps):
+        digest.update(np.ascontiguousarray(values, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # Content-addressed store of simulation histories. Each entry is the
+    # SimulationResult.save() directory of a run, memory-mapped read-only
+    # on a hit.
+    # Entries are evicted least-recently-used once max_bytes is exceeded.
+
+    def __init__(self, directory, max_bytes=2 * 1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, spec):
+        spec = dict(spec, source_version=source_version())
+        text = json.dumps(spec, sort_keys=True, default=float)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            if meta.get('format') != 'result':
+                return None
+            history = SimulationResult.load(path, mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Touch the entry so eviction sees it as recently used
+        os.utime(path)
+        return history
+
+    def put(self, key, history):
+        path = self._path(key)
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            history.save(tmp)
+            meta = {'format': 'result', 'channels': list(history)}
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # Another process stored the same key first
+                shutil.rmtree(tmp)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self.evict()
+        cached = self.get(key)
+        return history if cached is None else cached
+
+    def get_or_run(self, spec, run):
+        key = self.key(spec)
+        history = self.get(key)
+        if history is None:
+            history = self.put(key, run())
+        return history
+
+    def size(self):
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, path, size))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for _, path, _ in self._entries():
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,167 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import numpy as np
+from . import Simulation
+from .Profile import Profile
+from .ResultCache import ResultCache
+from .Sweep import compute_metrics, METRICS
+
+# Batch runner behind `python -m Sim`: many scenarios in one warm process
+# (Numba compiled once, caches shared), results written to disk, no plots.
+#
+# A scenario file is JSON, either {"defaults": {...}, "scenarios": [...]}
+# or a plain list of scenarios, or JSON lines with one scenario per line.
+# Each scenario is an object with
+#   name               output name (default scenario_<index>)
+#   motor_type         'BLAC' or 'BLDC'
+#   Ts, t_end          step and duration in seconds
+#   motor_params       MOTOR_PARAMS overrides
+#   controller_params  CONTROLLER_PARAMS overrides
+#   profile            Profile.from_dict spec ('default' if missing)
+#   engine             as run_simulation ('auto' if missing)
+#   dtype              'float64' or 'float32' for the stored result
+#   outputs            any of 'npz' (history channels), 'result'
+#                      (SimulationResult.save directory) and 'metrics'
+#   ripple_window      [t0, t1] of the torque ripple metric (default from
+#                      the profile, see Sweep.compute_metrics)
+#
+#   python -m Sim scenarios.json --output-dir results
+#
+# Every scenario adds one line to <output-dir>/summary.jsonl with its status,
+# wall time and metrics; a failing scenario is recorded there and the batch
+# moves on.
+
+SCENARIO_KEYS = ('name', 'motor_type', 'Ts', 't_end', 'motor_params', 'controller_params',
+                 'profile', 'engine', 'dtype', 'outputs', 'ripple_window')
+
+OUTPUTS = ('npz', 'result', 'metrics')
+
+DEFAULTS = {
+    'motor_type': 'BLAC', 'Ts': 1e-4, 't_end': 1.0, 'motor_params': None,
+    'controller_params': None, 'profile': 'default', 'engine': 'auto', 'dtype': 'float64',
+    'outputs': ['npz', 'metrics'], 'ripple_window': None,
+}
+
+
+def load_scenarios(path):
+    # path '-' reads standard input
+    if path == '-':
+        text = sys.stdin.read()
+    else:
+        with open(path) as f:
+            text = f.read()
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    defaults = {}
+    if isinstance(data, dict):
+        defaults = data.get('defaults', {})
+        data = data.get('scenarios', [])
+
+    scenarios = []
+    for index, entry in enumerate(data):
+        scenario = dict(DEFAULTS)
+        scenario.update(defaults)
+        scenario.update(entry)
+        scenario.setdefault('name', f'scenario_{index}')
+        scenarios.append(scenario)
+    return scenarios
+
+
+def check_scenario(scenario):
+    for key in scenario:
+        if key not in SCENARIO_KEYS:
+            raise ValueError(f"Unknown scenario key '{key}'")
+    for output in scenario['outputs']:
+        if output not in OUTPUTS:
+            raise ValueError(f"Unknown output '{output}'")
+    if scenario['dtype'] not in ('float64', 'float32'):
+        raise ValueError("dtype must be 'float64' or 'float32'")
+
+
+def run_scenario(scenario, output_dir, cache=None):
+    # Runs one scenario and writes its outputs; returns the summary entry
+    check_scenario(scenario)
+    name = scenario['name']
+    profile = Profile.from_dict(scenario['profile'])
+
+    start = time.perf_counter()
+    history = Simulation.run_simulation(
+        scenario['motor_type'], scenario['Ts'], scenario['t_end'], scenario['motor_params'],
+        scenario['controller_params'], profile, scenario['engine'], cache)
+    elapsed = time.perf_counter() - start
+
+    if scenario['dtype'] == 'float32':
+        history = history.astype(np.float32)
+
+    entry = {'name': name, 'status': 'ok', 'elapsed': elapsed, 'steps': history.num_steps}
+    outputs = scenario['outputs']
+    if 'npz' in outputs:
+        np.savez(os.path.join(output_dir, name + '.npz'), **history.to_dict())
+    if 'result' in outputs:
+        history.save(os.path.join(output_dir, name))
+    if 'metrics' in outputs:
+        values = compute_metrics(history, ripple_window=scenario['ripple_window'])
+        # NaN (e.g. never settled) becomes null in the JSON summary
+        entry['metrics'] = {m: (None if math.isnan(v) else float(v)) for m, v in zip(METRICS, values)}
+    return entry
+
+
+def run_scenarios(scenarios, output_dir, cache=None, engine=None, verbose=False):
+    # engine overrides the engine of every scenario
+    os.makedirs(output_dir, exist_ok=True)
+    entries = []
+    with open(os.path.join(output_dir, 'summary.jsonl'), 'w') as summary:
+        for scenario in scenarios:
+            if engine is not None:
+                scenario = dict(scenario, engine=engine)
+            try:
+                entry = run_scenario(scenario, output_dir, cache)
+            except Exception as e:
+                entry = {'name': scenario.get('name'), 'status': 'error',
+                         'error': f'{type(e).__name__}: {e}'}
+            summary.write(json.dumps(entry) + '\n')
+            summary.flush()
+            entries.append(entry)
+            if verbose:
+                if entry['status'] == 'ok':
+                    print(f"{entry['name']}: {entry['steps']:,} steps in {entry['elapsed']:.3f} s")
+                else:
+                    print(f"{entry['name']}: {entry['error']}")
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m Sim',
+                                     description="Run a batch of simulation scenarios")
+    parser.add_argument('scenarios', nargs='+', help="scenario files (JSON or JSON lines, - for stdin)")
+    parser.add_argument('--output-dir', default='results')
+    parser.add_argument('--engine', choices=('auto', 'fast', 'objects', 'dq'),
+                        help="override the engine of every scenario")
+    parser.add_argument('--cache', help="ResultCache directory shared by all scenarios")
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    scenarios = []
+    for path in args.scenarios:
+        scenarios.extend(load_scenarios(path))
+
+    cache = ResultCache(args.cache) if args.cache else None
+    entries = run_scenarios(scenarios, args.output_dir, cache, args.engine, verbose=not args.quiet)
+
+    failed = sum(entry['status'] != 'ok' for entry in entries)
+    if not args.quiet:
+        print(f"{len(entries) - failed} of {len(entries)} scenarios done, "
+              f"summary in {os.path.join(args.output_dir, 'summary.jsonl')}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
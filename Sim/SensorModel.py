@@ -0,0 +1,234 @@
+import collections
+import math
+import numpy as np
+from . import Transforms
+from . import Simulation
+
+# Non-ideal sensors for the scalar loop (run_loop below) and for the ideal
+# sensing of BatchSimulator (BatchSensorModel):
+#   phase currents  offset + Gaussian noise, optional dither, then an ADC of
+#                   adc_bits over +-current_range (None: no quantization)
+#   rotor angle     incremental encoder of encoder_counts per mechanical
+#                   revolution (None: the motor's theta_e)
+#   speed           encoder position difference over speed_window steps
+#   delay           every measurement reaches the controller delay steps late
+#
+# Noise and dither are drawn from numpy in blocks of `block` steps, not per
+# sample. The generator of a run is seeded from SeedSequence(seed) with
+# spawn_key (member,), so batch member i of BatchSensorModel(seed) sees
+# exactly the samples of SensorModel(seed, member=i). seed=None picks fresh
+# entropy; it is kept in .seed to reproduce the run.
+#
+# The plant must integrate the true currents, not the measured ones. So
+# SensorModel has no Sensors.measure (Simulation.run_loop would feed its
+# output back into physics_step): sample() takes the true currents and
+# run_loop keeps them apart from the readings.
+
+
+def sensor_rng(seed, member=0):
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(member,)))
+
+
+class SensorModel:
+    def __init__(self, Ts, adc_bits=12, current_range=20.0, current_offset=(0.0, 0.0, 0.0),
+                 current_noise=0.02, dither=False, encoder_counts=4096, speed_window=20,
+                 delay=1, seed=None, member=0, block=4096):
+        if adc_bits is not None and adc_bits < 2:
+            raise ValueError("adc_bits must be at least 2")
+        if current_noise < 0:
+            raise ValueError("current_noise must be non-negative")
+        if encoder_counts is not None and encoder_counts < 2:
+            raise ValueError("encoder_counts must be at least 2")
+        if speed_window < 1:
+            raise ValueError("speed_window must be at least 1")
+        if delay < 0:
+            raise ValueError("delay must be non-negative")
+        if block < 1:
+            raise ValueError("block must be at least 1")
+
+        self.Ts = Ts
+        self.adc_bits = adc_bits
+        self.current_range = current_range
+        self.current_offset = tuple(float(x) for x in current_offset)
+        self.current_noise = current_noise
+        self.dither = dither
+        self.encoder_counts = encoder_counts
+        self.speed_window = speed_window
+        self.delay = delay
+        self.member = member
+        self.block = block
+        self.seed = np.random.SeedSequence(seed).entropy
+
+        if adc_bits is not None:
+            self.lsb = 2 * current_range / 2**adc_bits
+            self.code_min = -2**(adc_bits - 1)
+            self.code_max = 2**(adc_bits - 1) - 1
+        if encoder_counts is not None:
+            self.resolution = 2 * math.pi / encoder_counts
+            self.counts_per_rad = encoder_counts / (2 * math.pi)
+
+        self.reset()
+
+    def reset(self):
+        # Back to the first sample of the run: same seed, empty pipelines
+        self.rng = sensor_rng(self.seed, self.member)
+        self._noise = self._dither = None
+        self._index = self.block
+        self._count = None
+        self._position = 0
+        self._positions = collections.deque(maxlen=self.speed_window + 1)
+        self._pipeline = collections.deque(maxlen=self.delay + 1)
+
+    def _refill(self):
+        zeros = [[0.0, 0.0, 0.0]] * self.block
+        self._noise = zeros
+        self._dither = zeros
+        if self.current_noise > 0:
+            self._noise = (self.rng.standard_normal((self.block, 3)) * self.current_noise).tolist()
+        if self.dither and self.adc_bits is not None:
+            self._dither = (self.rng.random((self.block, 3)) - 0.5).tolist()
+        self._index = 0
+
+    def _adc(self, x, d):
+        code = round(x / self.lsb + d)
+        return max(self.code_min, min(self.code_max, code)) * self.lsb
+
+    def _encoder(self, motor):
+        count = math.floor(motor.theta * self.counts_per_rad)
+        if self._count is not None:
+            # Unwrap across the revolution boundary
+            d = count - self._count
+            if d > self.encoder_counts / 2:
+                d -= self.encoder_counts
+            elif d < -self.encoder_counts / 2:
+                d += self.encoder_counts
+            self._position += d
+        self._count = count
+        self._positions.append(self._position)
+
+        theta_e = (motor.Npp * (count * self.resolution)) % (2 * math.pi)
+        n = len(self._positions) - 1
+        Wr = (self._position - self._positions[0]) * self.resolution / (n * self.Ts) if n else 0.0
+        return theta_e, Wr
+
+    def sample(self, motor, Ia, Ib, Ic):
+        # Measurement of the true phase currents Ia, Ib, Ic and of motor
+        if self._index == self.block:
+            self._refill()
+        noise = self._noise[self._index]
+        dither = self._dither[self._index]
+        self._index += 1
+
+        currents = []
+        for x, offset, n, d in zip((Ia, Ib, Ic), self.current_offset, noise, dither):
+            x = x + offset + n
+            currents.append(x if self.adc_bits is None else self._adc(x, d))
+
+        if self.encoder_counts is None:
+            theta_e, Wr = motor.theta_e, motor.Wr
+        else:
+            theta_e, Wr = self._encoder(motor)
+
+        self._pipeline.append((currents[0], currents[1], currents[2], theta_e, Wr))
+        return self._pipeline[0]
+
+
+class BatchSensorModel:
+    # SensorModel for the N members of a BatchSimulator; member i is seeded
+    # like SensorModel(seed, member=i) and gives the same samples
+
+    def __init__(self, Ts, N, seed=None, **kwargs):
+        self.N = N
+        self.members = [SensorModel(Ts, seed=seed, member=i, **kwargs) for i in range(N)]
+        self.model = self.members[0]
+        self.seed = self.model.seed
+        self.reset()
+
+    def reset(self):
+        for member in self.members:
+            member.reset()
+        m = self.model
+        self._noise = self._dither = None
+        self._index = m.block
+        self._count = None
+        self._position = np.zeros(self.N, dtype=np.int64)
+        self._positions = collections.deque(maxlen=m.speed_window + 1)
+        self._pipeline = collections.deque(maxlen=m.delay + 1)
+
+    def _refill(self):
+        # (block, 3, N): one contiguous row per step and phase
+        m = self.model
+        self._noise = np.zeros((m.block, 3, self.N))
+        self._dither = np.zeros((m.block, 3, self.N))
+        for i, member in enumerate(self.members):
+            if m.current_noise > 0:
+                self._noise[:, :, i] = member.rng.standard_normal((m.block, 3)) * m.current_noise
+            if m.dither and m.adc_bits is not None:
+                self._dither[:, :, i] = member.rng.random((m.block, 3)) - 0.5
+        self._index = 0
+
+    def _encoder(self, batch):
+        m = self.model
+        count = np.floor(batch.theta * m.counts_per_rad).astype(np.int64)
+        if self._count is not None:
+            d = count - self._count
+            d = np.where(d > m.encoder_counts / 2, d - m.encoder_counts, d)
+            d = np.where(d < -m.encoder_counts / 2, d + m.encoder_counts, d)
+            self._position = self._position + d
+        self._count = count
+        self._positions.append(self._position)
+
+        theta_e = np.mod(batch.Npp * (count * m.resolution), 2 * math.pi)
+        n = len(self._positions) - 1
+        if n:
+            Wr = (self._position - self._positions[0]) * m.resolution / (n * m.Ts)
+        else:
+            Wr = np.zeros(self.N)
+        return theta_e, Wr
+
+    def sample(self, batch, Ia, Ib, Ic):
+        # Arrays of the N members; returns new arrays, inputs are not modified
+        m = self.model
+        if self._index == m.block:
+            self._refill()
+        noise = self._noise[self._index]
+        dither = self._dither[self._index]
+        self._index += 1
+
+        currents = []
+        for j, (x, offset) in enumerate(zip((Ia, Ib, Ic), m.current_offset)):
+            x = x + offset + noise[j]
+            if m.adc_bits is not None:
+                x = np.clip(np.rint(x / m.lsb + dither[j]), m.code_min, m.code_max) * m.lsb
+            currents.append(x)
+
+        if m.encoder_counts is None:
+            theta_e, Wr = batch.theta_e.copy(), batch.Wr.copy()
+        else:
+            theta_e, Wr = self._encoder(batch)
+
+        self._pipeline.append((currents[0], currents[1], currents[2], theta_e, Wr))
+        return self._pipeline[0]
+
+
+def run_loop(motor, controller, inverter, sensors, profile, t_end, start=0, dtype=np.float64):
+    # Simulation.run_loop with the controller on sensor readings and the
+    # motor on the true phase currents
+    Ts = motor.Ts
+    history, samples = Simulation.loop_history(profile, Ts, int(t_end / Ts) - start, start,
+                                               motor.Npp, dtype)
+    true_currents = [None]
+
+    def measure(motor, RPMref):
+        theta_e = motor.theta_e
+        Ia, Ib, Ic = Transforms.dq_to_abc_cs(motor.Id, motor.Iq, math.cos(theta_e), math.sin(theta_e))
+        true_currents[0] = (Ia, Ib, Ic)
+        return sensors.sample(motor, Ia, Ib, Ic)
+
+    def plant(k, Va_ref, Vb_ref, Vc_ref, V_bus, Tload, Ia_meas, Ib_meas, Ic_meas):
+        Va, Vb, Vc = inverter.step(Va_ref, Vb_ref, Vc_ref, V_bus)
+        return motor.physics_step(Va, Vb, Vc, Tload, *true_currents[0])
+
+    Simulation.control_loop(motor, controller, measure, samples, plant,
+                            Simulation.history_recorder(motor, history))
+    return history
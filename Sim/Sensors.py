@@ -1,5 +1,5 @@
 import math
-import Transforms
+from . import Transforms
 
 class Sensors:
     def __init__(self):
@@ -8,8 +8,13 @@ class Sensors:
     def measure(self, motor, RPMref):
         theta_e = motor.theta_e
         
-        Ia, Ib, Ic = Transforms.dq_to_abc(motor.Id, motor.Iq, theta_e)
+        Ia, Ib, Ic = Transforms.dq_to_abc_cs(motor.Id, motor.Iq, math.cos(theta_e), math.sin(theta_e))
         
         Wr_meas = motor.Wr
         
         return Ia, Ib, Ic, theta_e, Wr_meas
+
+    def measure_dq(self, motor, RPMref):
+        # Ideal sensors seen from the dq frame: the phase currents measured
+        # above and transformed back by the controller are the motor's Id, Iq
+        return motor.Id, motor.Iq, motor.theta_e, motor.Wr
@@ -1,11 +1,11 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import math
-from BLACMotor import BLACMotor
-from BLDCMotor import BLDCMotor
-from FOCController import FOCController
-from Inverter import Inverter
-from Sensors import Sensors
+from .BLACMotor import BLACMotor
+from .BLDCMotor import BLDCMotor
+from .FOCController import FOCController
+from .Inverter import Inverter
+from .Sensors import Sensors
+from .Profile import Profile
 
 if __name__ == "__main__":
     Ts = 1e-4
@@ -19,6 +19,10 @@ if __name__ == "__main__":
     
     num_steps = int(t_end / Ts)
 
+    # RPMref 40 -> 80 -> 40 with a 20 Nm load between 0.2 s and 0.8 s
+    profile = Profile.default()
+    rpm_ref, tload, vbus = [x.tolist() for x in profile.sample(Ts, num_steps)]
+
     history = {
         'time': np.zeros(num_steps),
         'rpm_ref': np.zeros(num_steps),
@@ -39,19 +43,7 @@ if __name__ == "__main__":
         # ---------------------------------------------------------
         # 1. INPUTS & PROFILE
         # ---------------------------------------------------------
-        RPMref = 40.0
-        Tload = 0.0
-        
-        if t > 0.2:
-            Tload = 20.0
-        if t > 0.4:
-            RPMref = 80.0
-        if t > 0.6:
-            RPMref = 40.0
-        if t > 0.8:
-            Tload = 0.0
-            
-        V_bus = 311.0 
+        RPMref, Tload, V_bus = rpm_ref[k], tload[k], vbus[k]
 
         # ---------------------------------------------------------
         # 2. SENSORING STEP
@@ -89,6 +81,9 @@ if __name__ == "__main__":
         
     data = history
 
+    # Imported only here so the simulation itself starts without matplotlib
+    import matplotlib.pyplot as plt
+
     fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(10, 12), sharex=True)
 
     ax1.plot(data['time'], data['rpm_ref'], 'r--', label='RPM Ref')
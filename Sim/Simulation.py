@@ -0,0 +1,196 @@
+import numpy as np
+from .BLACMotor import BLACMotor
+from .BLDCMotor import BLDCMotor
+from .FOCController import FOCController
+from .Inverter import Inverter
+from .Sensors import Sensors
+from .BatchSimulator import MOTOR_PARAMS, CONTROLLER_PARAMS
+from .Profile import default_profile, sample_profile
+from .SimulationResult import SimulationResult
+from . import FastKernel
+from . import DQPipeline
+from . import ResultCache
+from . import Instrumentation
+
+
+def make_motor(motor_type, Ts, motor_params=None, **kwargs):
+    if motor_type == 'BLAC':
+        motor = BLACMotor(Ts, **kwargs)
+    elif motor_type == 'BLDC':
+        motor = BLDCMotor(Ts, **kwargs)
+    else:
+        raise ValueError("Invalid motor type")
+
+    for name, value in (motor_params or {}).items():
+        if name not in MOTOR_PARAMS:
+            raise ValueError(f"Unknown motor parameter '{name}'")
+        setattr(motor, name, float(value))
+
+    return motor
+
+
+def make_controller(Ts, controller_params=None):
+    controller = FOCController(Ts)
+
+    for name, value in (controller_params or {}).items():
+        if name not in CONTROLLER_PARAMS:
+            raise ValueError(f"Unknown controller parameter '{name}'")
+        setattr(controller, name, float(value))
+
+    return controller
+
+
+def split_params(params):
+    # Splits one flat dict of overrides into motor and controller parameters
+    motor_params = {}
+    controller_params = {}
+    for name, value in params.items():
+        if name in MOTOR_PARAMS:
+            motor_params[name] = value
+        elif name in CONTROLLER_PARAMS:
+            controller_params[name] = value
+        else:
+            raise ValueError(f"Unknown parameter '{name}'")
+    return motor_params, controller_params
+
+
+def control_loop(motor, controller, measure, samples, plant, record=None):
+    # The loop of Simulate.py over the sampled (RPMref, Tload, Vbus) arrays,
+    # one step per sample, with the parts that differ between engines as hooks:
+    #   measure(motor, RPMref) -> Ia, Ib, Ic, theta_e, Wr  what the controller sees
+    #   plant(k, Va_ref, Vb_ref, Vc_ref, V_bus, Tload, Ia, Ib, Ic) -> Te
+    #       applies the voltage references of step k to the motor
+    #   record(k, Te)  logs the state after step k (None: the plant logs)
+    rpm_ref, tload, vbus = [x.tolist() for x in samples]
+
+    for k in range(len(rpm_ref)):
+        RPMref, Tload, V_bus = rpm_ref[k], tload[k], vbus[k]
+
+        Ia, Ib, Ic, theta_e, Wr_meas = measure(motor, RPMref)
+
+        Va_ref, Vb_ref, Vc_ref = controller.control_step(
+            RPMref, Wr_meas, Ia, Ib, Ic, theta_e, V_bus
+        )
+
+        Te = plant(k, Va_ref, Vb_ref, Vc_ref, V_bus, Tload, Ia, Ib, Ic)
+
+        if record is not None:
+            record(k, Te)
+
+
+def inverter_plant(motor, inverter):
+    # The plant of Simulate.py: averaged inverter, then one physics_step
+    def plant(k, Va_ref, Vb_ref, Vc_ref, V_bus, Tload, Ia, Ib, Ic):
+        Va, Vb, Vc = inverter.step(Va_ref, Vb_ref, Vc_ref, V_bus)
+        return motor.physics_step(Va, Vb, Vc, Tload, Ia, Ib, Ic)
+    return plant
+
+
+def loop_history(profile, Ts, num_steps, start=0, Npp=1.0, dtype=np.float64):
+    # SimulationResult of a control_loop run and the profile samples it runs on
+    history = SimulationResult(Ts, num_steps, start, Npp, dtype)
+    samples = sample_profile(profile, Ts, num_steps, start)
+    history.set_inputs(*samples)
+    return history, samples
+
+
+def history_recorder(motor, history):
+    # record hook of control_loop writing the motor state into a SimulationResult
+    record = history.record
+
+    def record_step(k, Te):
+        record(k, motor.Wr, motor.Iq, motor.Id, Te, motor.theta)
+    return record_step
+
+
+def run_loop(motor, controller, inverter, sensors, profile, t_end, start=0, dtype=np.float64, stop=None):
+    # The loop of Simulate.py. start skips the first steps, for runs resumed
+    # from a Checkpoint; the history then begins at t = start * Ts. stop, a
+    # step index, replaces t_end for runs split into chunks: int(t_end / Ts)
+    # of t_end = stop * Ts can round down to stop - 1.
+    Ts = motor.Ts
+    num_steps = (int(t_end / Ts) if stop is None else stop) - start
+    history, samples = loop_history(profile, Ts, num_steps, start, motor.Npp, dtype)
+    control_loop(motor, controller, sensors.measure, samples, inverter_plant(motor, inverter),
+                 history_recorder(motor, history))
+    return history
+
+
+def run_simulation(motor_type, Ts=1e-4, t_end=1.0, motor_params=None, controller_params=None,
+                   profile=None, engine='auto', cache=None, instrumentation=None):
+    # engine: 'objects' steps the classes, 'fast' uses FastKernel and 'auto'
+    # picks 'fast' when Numba is available. Both give identical histories.
+    # 'dq' runs DQPipeline, which skips the abc round trips and matches them
+    # to rounding only.
+    # With a ResultCache, a previous run with the same inputs is returned as
+    # read-only memory-mapped arrays instead (not for plain callable profiles,
+    # see ResultCache.profile_token). An Instrumentation.Instrumentation
+    # times every stage of the objects loop; it bypasses engine and cache.
+    profile = default_profile if profile is None else profile
+
+    motor = make_motor(motor_type, Ts, motor_params)
+    controller = make_controller(Ts, controller_params)
+
+    if instrumentation is not None:
+        return Instrumentation.run_loop(motor, controller, Inverter(), Sensors(), profile, t_end,
+                                        instrumentation)
+
+    token = None if cache is None else ResultCache.profile_token(profile, Ts, int(t_end / Ts))
+    if token is not None:
+        spec = {
+            'motor_type': motor_type, 'Ts': Ts, 't_end': t_end,
+            'motor': {name: getattr(motor, name) for name in MOTOR_PARAMS},
+            'controller': {name: getattr(controller, name) for name in CONTROLLER_PARAMS},
+            'profile': token,
+        }
+        # 'fast', 'objects' and 'auto' give bit-identical histories (see
+        # tests/test_engines.py) and share entries; only 'dq' differs, in
+        # rounding, so only it is part of the key
+        if engine == 'dq':
+            spec['engine'] = engine
+        return cache.get_or_run(spec, lambda: run_simulation(
+            motor_type, Ts, t_end, motor_params, controller_params, profile, engine))
+
+    if engine == 'auto':
+        engine = 'fast' if FastKernel.HAVE_NUMBA else 'objects'
+
+    if engine == 'fast':
+        return FastKernel.run(motor, controller, t_end, profile)
+    elif engine == 'objects':
+        return run_loop(motor, controller, Inverter(), Sensors(), profile, t_end)
+    elif engine == 'dq':
+        return DQPipeline.run_loop(motor, controller, Inverter(), Sensors(), profile, t_end)
+    else:
+        raise ValueError("Invalid engine")
+
+
+def stream_simulation(motor_type, recorder, Ts=1e-4, t_end=1.0, motor_params=None,
+                      controller_params=None, profile=None, engine='auto', block=8192):
+    # Like run_simulation but every sample goes to a Recorder.StreamRecorder
+    # (channels Recorder.HISTORY_CHANNELS) instead of in-memory arrays, so
+    # memory does not grow with t_end. The recorder is closed at the end.
+    profile = default_profile if profile is None else profile
+
+    motor = make_motor(motor_type, Ts, motor_params)
+    controller = make_controller(Ts, controller_params)
+    num_steps = int(t_end / Ts)
+
+    if engine == 'auto':
+        engine = 'fast' if FastKernel.HAVE_NUMBA else 'objects'
+    if engine not in ('fast', 'objects'):
+        raise ValueError("Invalid engine")
+    inverter = Inverter()
+    sensors = Sensors()
+
+    # Both engines carry their state in the objects, so the run goes block
+    # by block, profile sampling included
+    for start in range(0, num_steps, block):
+        stop = min(start + block, num_steps)
+        if engine == 'fast':
+            history = FastKernel.run(motor, controller, t_end, profile, start, stop=stop)
+        else:
+            history = run_loop(motor, controller, inverter, sensors, profile, t_end, start, stop=stop)
+        recorder.extend(history.to_dict())
+
+    recorder.close()
+    return recorder
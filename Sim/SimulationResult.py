@@ -0,0 +1,196 @@
+import json
+import math
+import os
+import numpy as np
+from . import Transforms
+
+# Compact simulation history. The per-step motor outputs live in one
+# contiguous structured array (float64 or float32); the profile inputs,
+# which only change at a few breakpoints, are run-length encoded; and
+# everything else is derived on access:
+#   time     start..start+n times Ts
+#   rpm_act  Wr * 60 / (2*pi)
+#   theta_e  Npp * theta mod 2*pi
+#   Ia/Ib/Ic Transforms.dq_to_abc(Id, Iq, theta_e)
+# It reads like the old history dict (result['Iq'], keys(), items()), and
+# stored fields come back as zero-copy views of the structured array.
+#
+# A BatchSimulator run (members=N) is stored time-major, shape (n, N), so
+# each step writes one row; channels read back as (N, n) transposed views,
+# channel[i] being member i, and member(i) extracts one run.
+
+HISTORY_CHANNELS = ('time', 'rpm_ref', 'rpm_act', 'Iq', 'Id', 'Te', 'Tload', 'Vbus')
+STATE_FIELDS = ('Wr', 'Iq', 'Id', 'Te', 'theta')
+STEP_CHANNELS = ('rpm_ref', 'Tload', 'Vbus')
+DERIVED_CHANNELS = ('time', 'rpm_act', 'theta_e', 'Ia', 'Ib', 'Ic')
+
+
+class StepChannel:
+    # values[i] holds from sample starts[i] up to the next start; x may be
+    # (n,) or (n, N), a run then ends wherever any column changes
+
+    def __init__(self, starts, values, length):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.length = length
+
+    @classmethod
+    def encode(cls, x):
+        x = np.asarray(x, dtype=np.float64)
+        if len(x) == 0:
+            return cls([], x, 0)
+        changed = x[1:] != x[:-1]
+        if changed.ndim > 1:
+            changed = changed.any(axis=1)
+        starts = np.flatnonzero(np.r_[True, changed])
+        return cls(starts, x[starts], len(x))
+
+    def decode(self):
+        lengths = np.diff(np.r_[self.starts, self.length])
+        return np.repeat(self.values, lengths, axis=0)
+
+    def column(self, i):
+        # Column i of a 2-D channel as a 1-D one
+        column = StepChannel.encode(self.values[:, i])
+        return StepChannel(self.starts[column.starts], column.values, self.length)
+
+    def concatenate(self, other):
+        return StepChannel.encode(np.concatenate((self.decode(), other.decode())))
+
+    @property
+    def nbytes(self):
+        return self.starts.nbytes + self.values.nbytes
+
+
+class SimulationResult:
+    def __init__(self, Ts, n, start=0, Npp=1.0, dtype=np.float64, members=None):
+        self.Ts = Ts
+        self.start = start
+        self.Npp = Npp
+        self.members = members
+        shape = (n,) if members is None else (n, members)
+        self.data = np.zeros(shape, dtype=[(name, dtype) for name in STATE_FIELDS])
+        zero = np.zeros((1 if n else 0,) + shape[1:])
+        self.inputs = {name: StepChannel([0] if n else [], zero, n) for name in STEP_CHANNELS}
+
+    @classmethod
+    def from_arrays(cls, Ts, start, Npp, Wr, Iq, Id, Te, theta, rpm_ref, Tload, Vbus, dtype=np.float64):
+        result = cls(Ts, len(Wr), start, Npp, dtype)
+        for name, values in zip(STATE_FIELDS, (Wr, Iq, Id, Te, theta)):
+            result.data[name] = values
+        result.set_inputs(rpm_ref, Tload, Vbus)
+        return result
+
+    def set_inputs(self, rpm_ref, Tload, Vbus):
+        for name, values in zip(STEP_CHANNELS, (rpm_ref, Tload, Vbus)):
+            self.inputs[name] = StepChannel.encode(values)
+
+    def record(self, k, Wr, Iq, Id, Te, theta):
+        self.data[k] = (Wr, Iq, Id, Te, theta)
+
+    def record_members(self, k, Wr, Iq, Id, Te, theta):
+        # record() for a batch, one array of N values per field
+        row = self.data[k]
+        for name, values in zip(STATE_FIELDS, (Wr, Iq, Id, Te, theta)):
+            row[name] = values
+
+    def __len__(self):
+        # Like the dict it replaces: the number of history channels
+        return len(HISTORY_CHANNELS)
+
+    @property
+    def num_steps(self):
+        return len(self.data)
+
+    def __getitem__(self, name):
+        # .T is a no-op for a single run and gives (N, n) for a batch
+        if name in STATE_FIELDS:
+            return self.data[name].T
+        if name in self.inputs:
+            return self.inputs[name].decode().T
+        if name == 'time':
+            return np.arange(self.start, self.start + len(self.data)) * self.Ts
+        if name == 'rpm_act':
+            return self.data['Wr'].T * 60 / (2*math.pi)
+        if name == 'theta_e':
+            Npp = self.Npp if self.members is None else np.reshape(self.Npp, (-1, 1))
+            return (Npp * self.data['theta'].T) % (2 * math.pi)
+        if name in ('Ia', 'Ib', 'Ic'):
+            abc = Transforms.dq_to_abc(self.data['Id'].T, self.data['Iq'].T, self['theta_e'])
+            return abc[('Ia', 'Ib', 'Ic').index(name)]
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        return name in HISTORY_CHANNELS or name in STATE_FIELDS or name in DERIVED_CHANNELS
+
+    def __iter__(self):
+        return iter(HISTORY_CHANNELS)
+
+    def keys(self):
+        return list(HISTORY_CHANNELS)
+
+    def values(self):
+        return [self[name] for name in HISTORY_CHANNELS]
+
+    def items(self):
+        return [(name, self[name]) for name in HISTORY_CHANNELS]
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def to_dict(self):
+        return dict(self.items())
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + sum(channel.nbytes for channel in self.inputs.values())
+
+    def member(self, i):
+        # Member i of a batch result as a single-run result
+        Npp = float(np.broadcast_to(self.Npp, (self.members,))[i])
+        result = SimulationResult(self.Ts, 0, self.start, Npp)
+        result.data = self.data[:, i]
+        result.inputs = {name: channel.column(i) for name, channel in self.inputs.items()}
+        return result
+
+    def astype(self, dtype):
+        result = SimulationResult(self.Ts, len(self.data), self.start, self.Npp, dtype, self.members)
+        for name in STATE_FIELDS:
+            result.data[name] = self.data[name]
+        result.inputs = dict(self.inputs)
+        return result
+
+    @classmethod
+    def concatenate(cls, first, second):
+        # second must continue first (e.g. a Checkpoint branch after its prefix)
+        if first.start + len(first.data) != second.start:
+            raise ValueError("Results are not consecutive")
+        result = cls(first.Ts, 0, first.start, first.Npp, first.data.dtype[0], first.members)
+        result.data = np.concatenate((first.data, second.data))
+        result.inputs = {name: first.inputs[name].concatenate(second.inputs[name]) for name in STEP_CHANNELS}
+        return result
+
+    def save(self, path):
+        # data.npy (memory-mappable) plus the encodings in result.json
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'data.npy'), self.data)
+        meta = {
+            'Ts': self.Ts, 'start': self.start, 'Npp': np.asarray(self.Npp).tolist(),
+            'members': self.members,
+            'inputs': {name: {'starts': c.starts.tolist(), 'values': c.values.tolist(), 'length': c.length}
+                       for name, c in self.inputs.items()},
+        }
+        with open(os.path.join(path, 'result.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        with open(os.path.join(path, 'result.json')) as f:
+            meta = json.load(f)
+        data = np.load(os.path.join(path, 'data.npy'), mmap_mode=mmap_mode)
+        Npp = np.asarray(meta['Npp']) if isinstance(meta['Npp'], list) else meta['Npp']
+        result = cls(meta['Ts'], 0, meta['start'], Npp, members=meta.get('members'))
+        result.data = data
+        result.inputs = {name: StepChannel(c['starts'], c['values'], c['length'])
+                         for name, c in meta['inputs'].items()}
+        return result
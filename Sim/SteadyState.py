@@ -0,0 +1,135 @@
+import copy
+import math
+import numpy as np
+from .BLDCMotor import BLDCMotor
+from .FOCController import FOCController
+from . import FastKernel
+
+# Periodic steady state of the closed loop (motor + FOCController +
+# inverter) at a constant speed reference and load, found by shooting over
+# one electrical period instead of time-marching through the transient.
+#
+# The period is sampled with N = round(T / Ts) steps of h = T / N, so the
+# discrete loop is exactly periodic; h differs from Ts by at most
+# Ts / (2N). The speed loop makes the mean speed equal the reference only
+# on average, so h is an unknown too: the rotor must advance 2*pi/Npp
+# mechanical radians in N steps. Unknowns are
+#   z = (Id, Iq, Wr, Ui_s, Ui_Id, Ui_Iq, h)
+# at theta = 0, solved with Newton's method on a finite-difference
+# Jacobian. Each period is one FastKernel.simulate call.
+
+STATES = ('Id', 'Iq', 'Wr', 'Ui_s', 'Ui_Id', 'Ui_Iq')
+
+
+class SteadyStateSolver:
+    def __init__(self, Ts, motor=None, controller=None, tol=1e-10, max_iter=30):
+        self.Ts = Ts
+        self.motor = motor if motor is not None else BLDCMotor(Ts)
+        self.controller = controller if controller is not None else FOCController(Ts)
+        if self.motor.integrator != 'euler':
+            raise ValueError("SteadyStateSolver only implements the 'euler' integrator")
+        self.tol = tol
+        self.max_iter = max_iter
+        # (RPMref, Tload, Vbus) -> solved z, for warm starts
+        self.solved = {}
+
+    def _period(self, z, RPMref, Tload, Vbus, N):
+        # Runs one period from z; returns the end state and the per-step outputs
+        Id, Iq, Wr, Ui_s, Ui_Id, Ui_Iq, h = z
+        motor = copy.copy(self.motor)
+        controller = copy.copy(self.controller)
+        motor.Ts = controller.Ts = controller.Ts_speed = h
+
+        motor.Id, motor.Iq, motor.Wr = Id, Iq, Wr
+        motor.theta = 0.0
+        # physics_step sets theta_e from the angle at the start of the previous step
+        motor.theta_e = (motor.Npp * (0.0 - Wr * h)) % (2 * math.pi)
+        controller.Ui_s, controller.Ui_Id, controller.Ui_Iq = Ui_s, Ui_Id, Ui_Iq
+
+        out = FastKernel.simulate(motor, controller, np.full(N, float(RPMref)),
+                                  np.full(N, float(Tload)), np.full(N, float(Vbus)))
+        end = (motor.Id, motor.Iq, motor.Wr, controller.Ui_s, controller.Ui_Id, controller.Ui_Iq)
+        return end, motor.theta, out
+
+    def _residual(self, z, RPMref, Tload, Vbus, N):
+        end, theta, _ = self._period(z, RPMref, Tload, Vbus, N)
+        # theta is wrapped to [0, 2*pi); one electrical period is far less than a turn
+        return np.array([e - s for e, s in zip(end, z[:6])] + [theta - 2 * math.pi / self.motor.Npp])
+
+    def initial_guess(self, RPMref, Tload, Vbus, N):
+        # Nearest solved point if any, else the torque balance of a sinusoidal motor
+        motor = self.motor
+        Wr = RPMref * 2 * math.pi / 60.0
+        h = 2 * math.pi / (motor.Npp * Wr) / N
+        if self.solved:
+            nearest = min(self.solved, key=lambda p: ((p[0] - RPMref) / max(abs(RPMref), 1.0)) ** 2
+                          + ((p[1] - Tload) / max(abs(Tload), 1.0)) ** 2 + ((p[2] - Vbus) / Vbus) ** 2)
+            z = self.solved[nearest].copy()
+            z[2] = Wr
+            z[6] = h
+            return z
+
+        Tc_dir = motor.Tc if Wr > 0 else (-motor.Tc if Wr < 0 else 0.0)
+        Iq = (Tload + motor.Bn * Wr + Tc_dir) / (1.5 * motor.Npp * motor.Lambda_m)
+        We = motor.Npp * Wr
+        Vd = -We * motor.Lq * Iq
+        Vq = motor.Rs * Iq + We * motor.Lambda_m
+        return np.array([0.0, Iq, Wr, Iq, Vd, Vq, h])
+
+    def solve(self, RPMref, Tload, Vbus=311.0, z0=None):
+        # Returns a dict with the per-step waveforms of one period (time, Id,
+        # Iq, Te, rpm_act), the steady state z, the mean torque,
+        # the peak-to-peak torque ripple, h, N and the Newton iterations.
+        if RPMref <= 0:
+            raise ValueError("RPMref must be positive")
+        motor = self.motor
+        T = 2 * math.pi / (motor.Npp * RPMref * 2 * math.pi / 60.0)
+        N = max(1, round(T / self.Ts))
+
+        z = np.array(z0, dtype=float) if z0 is not None else self.initial_guess(RPMref, Tload, Vbus, N)
+        # Finite-difference steps relative to the size of each unknown
+        scale = np.maximum(np.abs(z), [1e-3, 1e-3, 1e-3, 1e-3, 1e-1, 1e-1, 0.0])
+        scale[6] = z[6]
+
+        F = self._residual(z, RPMref, Tload, Vbus, N)
+        iterations = 0
+        while np.max(np.abs(F / np.append(scale[:6], 1.0))) > self.tol:
+            if iterations == self.max_iter:
+                raise RuntimeError(f"Steady state did not converge at RPMref={RPMref}, Tload={Tload}")
+            iterations += 1
+
+            jac = np.empty((7, 7))
+            for j in range(7):
+                dz = np.zeros(7)
+                dz[j] = 1e-7 * scale[j]
+                jac[:, j] = (self._residual(z + dz, RPMref, Tload, Vbus, N) - F) / dz[j]
+            step = np.linalg.solve(jac, -F)
+
+            # Damped update: halve the step until the residual decreases
+            norm = np.linalg.norm(F)
+            for _ in range(20):
+                F_new = self._residual(z + step, RPMref, Tload, Vbus, N)
+                if np.linalg.norm(F_new) < norm:
+                    break
+                step *= 0.5
+            z = z + step
+            F = F_new
+
+        self.solved[(float(RPMref), float(Tload), float(Vbus))] = z.copy()
+
+        _, _, out = self._period(z, RPMref, Tload, Vbus, N)
+        h = z[6]
+        Te = out['Te']
+        return {
+            'time': np.arange(1, N + 1) * h,
+            'Id': out['Id'],
+            'Iq': out['Iq'],
+            'Te': Te,
+            'rpm_act': out['rpm_act'],
+            'z': dict(zip(STATES + ('h',), z.tolist())),
+            'Te_mean': float(np.mean(Te)),
+            'torque_ripple': float(np.ptp(Te)),
+            'h': h,
+            'N': N,
+            'iterations': iterations,
+        }
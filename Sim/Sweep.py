@@ -0,0 +1,197 @@
+import itertools
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from . import Simulation
+from . import FastKernel
+from .BatchSimulator import BatchSimulator, MOTOR_PARAMS, CONTROLLER_PARAMS
+
+METRICS = ('overshoot', 'settling_time', 'torque_ripple', 'peak_Iq')
+
+SWEEP_PARAMS = ('Rs', 'Ld', 'Lq', 'Lambda_m', 'J', 'Bn', 'Tc',
+                'Kps', 'Kis', 'KpId', 'KiId', 'KpIq', 'KiIq')
+
+
+def grid(**axes):
+    # grid(Rs=[4.0, 4.5], J=[0.1, 0.2]) -> every combination as a dict
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+
+def monte_carlo(n, seed=None, **distributions):
+    # Each distribution is one of
+    #   ('normal', mean, std)
+    #   ('uniform', low, high)
+    #   ('tolerance', nominal, rel)   uniform in nominal * (1 +/- rel)
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name, spec in distributions.items():
+        kind = spec[0]
+        if kind == 'normal':
+            columns[name] = rng.normal(spec[1], spec[2], n)
+        elif kind == 'uniform':
+            columns[name] = rng.uniform(spec[1], spec[2], n)
+        elif kind == 'tolerance':
+            columns[name] = spec[1] * (1.0 + rng.uniform(-spec[2], spec[2], n))
+        else:
+            raise ValueError(f"Unknown distribution '{kind}'")
+    return [{name: float(columns[name][i]) for name in columns} for i in range(n)]
+
+
+def compute_metrics(history, settle_band=0.02, ripple_window=None):
+    # Overshoot (%) and settling time (s) of the first speed reference up to
+    # the first reference or load change, torque ripple as the peak-to-peak
+    # Te inside ripple_window and the peak |Iq| over the run.
+    # ripple_window=None takes the second half of the first stretch of
+    # constant inputs under load (the last stretch if there is no load), so
+    # it follows the profile and the run length: (0.3, 0.4) for the default
+    # profile, the second half of the run for a constant one.
+    time = history['time']
+    rpm_ref = history['rpm_ref']
+    rpm_act = history['rpm_act']
+    Tload = history['Tload']
+
+    changes = np.flatnonzero((np.diff(rpm_ref) != 0) | (np.diff(Tload) != 0))
+    end = changes[0] + 1 if len(changes) else len(time)
+    ref = rpm_ref[0]
+
+    overshoot = 100.0 * (np.max(rpm_act[:end]) - ref) / abs(ref) if ref != 0 else np.nan
+    outside = np.flatnonzero(np.abs(rpm_act[:end] - ref) > settle_band * abs(ref))
+    if len(outside) == 0:
+        settling_time = 0.0
+    elif outside[-1] + 1 < end:
+        settling_time = time[outside[-1] + 1] - time[0]
+    else:
+        settling_time = np.nan
+
+    if ripple_window is None:
+        bounds = np.r_[0, changes + 1, len(time)]
+        loaded = [i for i in range(len(bounds) - 1) if Tload[bounds[i]] != 0]
+        i = loaded[0] if loaded else len(bounds) - 2
+        window = slice((bounds[i] + bounds[i + 1]) // 2, bounds[i + 1])
+    else:
+        window = (time >= ripple_window[0]) & (time < ripple_window[1])
+    Te = history['Te'][window]
+    torque_ripple = np.ptp(Te) if len(Te) else np.nan
+
+    peak_Iq = np.max(np.abs(history['Iq']))
+
+    return np.array([overshoot, settling_time, torque_ripple, peak_Iq])
+
+
+# Per-worker state, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(params_name, metrics_name, shape, names, config):
+    params_shm = shared_memory.SharedMemory(name=params_name)
+    metrics_shm = shared_memory.SharedMemory(name=metrics_name)
+    _worker['shm'] = (params_shm, metrics_shm)
+    _worker['params'] = np.ndarray(shape, dtype=float, buffer=params_shm.buf)
+    _worker['metrics'] = np.ndarray((shape[0], len(METRICS)), dtype=float, buffer=metrics_shm.buf)
+    _worker['names'] = names
+    _worker['config'] = config
+
+
+def _close_worker():
+    shms = _worker.pop('shm', ())
+    _worker.clear()
+    for shm in shms:
+        shm.close()
+
+
+def _run_chunk(bounds):
+    start, stop = bounds
+    params = _worker['params']
+    metrics = _worker['metrics']
+    names = _worker['names']
+    config = _worker['config']
+    motor_type = config['motor_type']
+
+    if config['engine'] == 'batch':
+        # The whole chunk as one vectorized batch
+        motor_params = {n: params[start:stop, j] for j, n in enumerate(names) if n in MOTOR_PARAMS}
+        controller_params = {n: params[start:stop, j] for j, n in enumerate(names) if n in CONTROLLER_PARAMS}
+        batch = BatchSimulator(config['Ts'], stop - start, motor_type, motor_params,
+                               controller_params, config['profile'])
+        for i, history in enumerate(batch.split(batch.run(config['t_end']))):
+            metrics[start + i] = compute_metrics(history, **config['metric_kwargs'])
+    else:
+        for i in range(start, stop):
+            motor_params, controller_params = Simulation.split_params(dict(zip(names, params[i])))
+            history = Simulation.run_simulation(
+                motor_type, config['Ts'], config['t_end'], motor_params, controller_params,
+                config['profile'], config['engine']
+            )
+            metrics[i] = compute_metrics(history, **config['metric_kwargs'])
+
+    return stop - start
+
+
+def run_sweep(motor_type, variants, Ts=1e-4, t_end=1.0, profile=None, processes=None,
+              chunksize=None, engine='auto', **metric_kwargs):
+    # Runs one simulation per variant dict (see grid/monte_carlo) over a
+    # process pool and returns an (n_variants, len(METRICS)) array.
+    # Parameters and results travel through shared memory; workers only
+    # receive (start, stop) index ranges.
+    # engine: 'fast' (FastKernel per run), 'batch' (one BatchSimulator per
+    # chunk), 'objects', or 'auto' = 'fast' with Numba else 'batch'.
+    n = len(variants)
+    names = sorted({name for variant in variants for name in variant})
+    for name in names:
+        if name not in SWEEP_PARAMS:
+            raise ValueError(f"Unknown sweep parameter '{name}'")
+    if engine == 'auto':
+        engine = 'fast' if FastKernel.HAVE_NUMBA else 'batch'
+
+    processes = processes or os.cpu_count() or 1
+    if chunksize is None:
+        if engine == 'batch':
+            # Batches pay a fixed per-step cost, so fewer and larger chunks
+            chunksize = max(1, min(512, -(-n // processes)))
+        else:
+            chunksize = max(1, min(64, -(-n // (4 * processes))))
+
+    # Defaults fill in parameters a variant leaves out
+    motor = Simulation.make_motor(motor_type, Ts)
+    controller = Simulation.make_controller(Ts)
+    defaults = [getattr(motor if name in MOTOR_PARAMS else controller, name) for name in names]
+
+    shape = (n, len(names))
+    params = metrics = None
+    params_shm = shared_memory.SharedMemory(create=True, size=max(1, n * len(names) * 8))
+    metrics_shm = shared_memory.SharedMemory(create=True, size=max(1, n * len(METRICS) * 8))
+    try:
+        params = np.ndarray(shape, dtype=float, buffer=params_shm.buf)
+        for i, variant in enumerate(variants):
+            params[i] = [variant.get(name, default) for name, default in zip(names, defaults)]
+        metrics = np.ndarray((n, len(METRICS)), dtype=float, buffer=metrics_shm.buf)
+        metrics[:] = np.nan
+
+        config = {
+            'motor_type': motor_type, 'Ts': Ts, 't_end': t_end, 'profile': profile,
+            'engine': engine, 'metric_kwargs': metric_kwargs,
+        }
+        initargs = (params_shm.name, metrics_shm.name, shape, names, config)
+        chunks = [(start, min(start + chunksize, n)) for start in range(0, n, chunksize)]
+
+        if processes == 1:
+            _init_worker(*initargs)
+            try:
+                for chunk in chunks:
+                    _run_chunk(chunk)
+            finally:
+                _close_worker()
+        else:
+            with multiprocessing.Pool(processes, _init_worker, initargs) as pool:
+                for _ in pool.imap_unordered(_run_chunk, chunks):
+                    pass
+
+        return metrics.copy()
+    finally:
+        del params, metrics
+        params_shm.close()
+        params_shm.unlink()
+        metrics_shm.close()
+        metrics_shm.unlink()
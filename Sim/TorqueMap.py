@@ -0,0 +1,151 @@
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import numpy as np
+from . import Simulation
+from . import FastKernel
+
+# Torque-speed / efficiency maps. Every (motor, speed, load, Vbus) point is
+# simulated from rest with a constant reference until steady state, then
+# averaged over the last window:
+#   Te_mean, torque_ripple (peak-to-peak Te), copper_loss = 1.5*Rs*<Id^2 + Iq^2>,
+#   rpm_mean, efficiency = Tload*Wr / (Te*Wr + copper_loss), saturated
+#   (Inverter.step clamped a phase in any window of the run, the start-up
+#   included), settled and t_end.
+# Finished points are appended to a JSON-lines file as they arrive, so an
+# interrupted map resumes where it stopped.
+
+MAP_METRICS = ('Te_mean', 'torque_ripple', 'copper_loss', 'rpm_mean', 'efficiency',
+               'saturated', 'settled', 't_end')
+
+
+def operating_points(motor_types=('BLAC', 'BLDC'), speeds=(20.0, 40.0, 60.0, 80.0),
+                     loads=(0.0, 5.0, 10.0, 15.0, 20.0), vbus=(311.0,)):
+    return [{'motor_type': m, 'rpm': float(s), 'Tload': float(l), 'Vbus': float(v)}
+            for m, s, l, v in itertools.product(motor_types, speeds, loads, vbus)]
+
+
+def point_key(point):
+    return f"{point['motor_type']}/{point['rpm']!r}/{point['Tload']!r}/{point['Vbus']!r}"
+
+
+def simulate_point(point, Ts=1e-4, window=0.05, t_max=3.0, tol=1e-3,
+                   motor_params=None, controller_params=None):
+    # Marches window by window (rounded up to whole electrical periods) and
+    # stops once mean speed and mean torque change by less than tol
+    # (relative) between consecutive windows, or at t_max.
+    motor = Simulation.make_motor(point['motor_type'], Ts, motor_params)
+    controller = Simulation.make_controller(Ts, controller_params)
+    rpm, Tload, Vbus = point['rpm'], point['Tload'], point['Vbus']
+
+    We = abs(rpm) * 2 * math.pi / 60.0 * motor.Npp
+    period = 2 * math.pi / We if We > 0 else window
+    n = max(1, round(math.ceil(window / period) * period / Ts))
+    rpm_ref = np.full(n, rpm)
+    tload = np.full(n, Tload)
+    vbus = np.full(n, Vbus)
+
+    previous = None
+    steps = 0
+    clamped = 0
+    settled = False
+    while steps * Ts < t_max:
+        out = FastKernel.simulate(motor, controller, rpm_ref, tload, vbus)
+        steps += n
+        clamped += out['clamped']
+        current = (np.mean(out['rpm_act']), np.mean(out['Te']))
+        if previous is not None:
+            if (abs(current[0] - previous[0]) <= tol * max(abs(rpm), 1.0)
+                    and abs(current[1] - previous[1]) <= tol * max(abs(Tload), 1.0)):
+                settled = True
+                break
+        previous = current
+
+    Wr = current[0] * 2 * math.pi / 60.0
+    copper_loss = 1.5 * motor.Rs * float(np.mean(out['Id']**2 + out['Iq']**2))
+    p_in = current[1] * Wr + copper_loss
+    return {
+        'Te_mean': float(current[1]),
+        'torque_ripple': float(np.ptp(out['Te'])),
+        'copper_loss': copper_loss,
+        'rpm_mean': float(current[0]),
+        'efficiency': float(Tload * Wr / p_in) if p_in > 0 else math.nan,
+        'saturated': bool(clamped > 0),
+        'settled': settled,
+        't_end': steps * Ts,
+    }
+
+
+def _run_point(args):
+    point, kwargs = args
+    return point, simulate_point(point, **kwargs)
+
+
+def load_results(path):
+    # Completed points of a (possibly interrupted) map file, by point_key
+    results = {}
+    if path is not None and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # Partial last line of an interrupted run
+                    continue
+                results[point_key(row)] = row
+    return results
+
+
+def torque_map(points=None, path=None, processes=None, verbose=False, **kwargs):
+    # Runs every operating point (see operating_points) over a process pool
+    # and returns one dict per point with its inputs and MAP_METRICS.
+    # kwargs go to simulate_point. With path, points already in the file are
+    # not simulated again.
+    points = operating_points() if points is None else points
+    results = load_results(path)
+    todo = [point for point in points if point_key(point) not in results]
+    processes = processes or os.cpu_count() or 1
+
+    def record(finished, out):
+        for i, (point, metrics) in enumerate(finished):
+            row = dict(point, **metrics)
+            results[point_key(point)] = row
+            if out is not None:
+                out.write(json.dumps(row) + '\n')
+                out.flush()
+            if verbose:
+                print(f"[{i + 1}/{len(todo)}] {point_key(point)}: Te={row['Te_mean']:.3f} "
+                      f"ripple={row['torque_ripple']:.3f} saturated={row['saturated']}")
+
+    if todo:
+        tasks = [(point, kwargs) for point in todo]
+        out = open(path, 'a+') if path is not None else None
+        try:
+            if out is not None and out.tell() > 0:
+                # Terminate a partial line left by an interrupted run
+                out.seek(out.tell() - 1)
+                if out.read(1) != '\n':
+                    out.write('\n')
+            if processes == 1:
+                record(map(_run_point, tasks), out)
+            else:
+                with multiprocessing.Pool(processes) as pool:
+                    record(pool.imap_unordered(_run_point, tasks), out)
+        finally:
+            if out is not None:
+                out.close()
+
+    return [results[point_key(point)] for point in points]
+
+
+def to_grid(rows, metric, motor_type, Vbus=311.0):
+    # (speeds, loads, values) with values[i, j] at speeds[i], loads[j]
+    rows = [r for r in rows if r['motor_type'] == motor_type and r['Vbus'] == Vbus]
+    speeds = sorted({r['rpm'] for r in rows})
+    loads = sorted({r['Tload'] for r in rows})
+    values = np.full((len(speeds), len(loads)), np.nan)
+    for r in rows:
+        values[speeds.index(r['rpm']), loads.index(r['Tload'])] = r[metric]
+    return np.array(speeds), np.array(loads), values
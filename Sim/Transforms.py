@@ -1,33 +1,130 @@
 import math
+import numpy as np
+
+SQRT3 = math.sqrt(3)
+SQRT3_2 = math.sqrt(3)/2
 
 def abc_to_dq(Xa, Xb, Xc, theta):
-    # Clarke transform
-    X_alpha = (2/3) * (Xa - 0.5 * Xb - 0.5 * Xc)
-    X_beta = (2/3) * (math.sqrt(3)/2 * (Xb - Xc))
-    
-    # Park transform
-    Xd = X_alpha * math.cos(theta) + X_beta * math.sin(theta)
-    Xq = -X_alpha * math.sin(theta) + X_beta * math.cos(theta)
-    
-    # Direct Park Transform (abc -> dq)
-    # Xd = 2/3 * (Xa * math.cos(theta) + Xb * math.cos(theta - 2*math.pi/3) + Xc * math.cos(theta + 2*math.pi/3))
-    # Xq = 2/3 * (-Xa * math.sin(theta) - Xb * math.sin(theta - 2*math.pi/3) - Xc * math.sin(theta + 2*math.pi/3))
-    
-    return Xd, Xq
+    try:
+        cos_t = math.cos(theta)
+        sin_t = math.sin(theta)
+    except TypeError:
+        # Array input: broadcast over theta
+        cos_t, sin_t = cos_sin(theta)
+
+    return abc_to_dq_cs(Xa, Xb, Xc, cos_t, sin_t)
 
 def dq_to_abc(Xd, Xq, theta):
-    # Inverse Park transform
-    X_alpha = Xd * math.cos(theta) - Xq * math.sin(theta)
-    X_beta = Xd * math.sin(theta) + Xq * math.cos(theta)
-    
-    # Inverse Clarke transform
-    Xa = X_alpha
-    Xb = (-X_alpha + math.sqrt(3) * X_beta) / 2
-    Xc = (-X_alpha - math.sqrt(3) * X_beta) / 2
-    
-    # Direct Inverse Park Transform (dq -> abc)
-    # Xa = math.cos(theta) * Xd - math.sin(theta) * Xq
-    # Xb = math.cos(theta - 2*math.pi/3) * Xd - math.sin(theta - 2*math.pi/3) * Xq
-    # Xc = math.cos(theta + 2*math.pi/3) * Xd - math.sin(theta + 2*math.pi/3) * Xq
-    
+    try:
+        cos_t = math.cos(theta)
+        sin_t = math.sin(theta)
+    except TypeError:
+        cos_t, sin_t = cos_sin(theta)
+
+    return dq_to_abc_cs(Xd, Xq, cos_t, sin_t)
+
+def cos_sin(theta, out=None):
+    if out is None:
+        return np.cos(theta), np.sin(theta)
+
+    np.cos(theta, out=out[0])
+    np.sin(theta, out=out[1])
+    return out
+
+def abc_to_dq_cs(Xa, Xb, Xc, cos_t, sin_t, out=None, work=None):
+    # Same as abc_to_dq with cos(theta) and sin(theta) already evaluated.
+    # Scalars and arrays of any broadcastable shape are accepted; with
+    # out=(Xd, Xq) and work=(tmp1, tmp2) nothing is allocated.
+    if out is None:
+        # Clarke transform
+        X_alpha = (2/3) * (Xa - 0.5 * Xb - 0.5 * Xc)
+        X_beta = (2/3) * (SQRT3_2 * (Xb - Xc))
+
+        # Park transform
+        Xd = X_alpha * cos_t + X_beta * sin_t
+        Xq = -X_alpha * sin_t + X_beta * cos_t
+
+        # Direct Park Transform (abc -> dq)
+        # Xd = 2/3 * (Xa * math.cos(theta) + Xb * math.cos(theta - 2*math.pi/3) + Xc * math.cos(theta + 2*math.pi/3))
+        # Xq = 2/3 * (-Xa * math.sin(theta) - Xb * math.sin(theta - 2*math.pi/3) - Xc * math.sin(theta + 2*math.pi/3))
+
+        return Xd, Xq
+
+    Xd, Xq = out
+    if work is None:
+        work = (np.empty_like(Xd), np.empty_like(Xd))
+    X_alpha, X_beta = work
+
+    # Same operation order as above, so results match bit for bit
+    np.multiply(Xb, 0.5, out=X_alpha)
+    np.subtract(Xa, X_alpha, out=X_alpha)
+    np.multiply(Xc, 0.5, out=X_beta)
+    np.subtract(X_alpha, X_beta, out=X_alpha)
+    np.multiply(X_alpha, 2/3, out=X_alpha)
+
+    np.subtract(Xb, Xc, out=X_beta)
+    np.multiply(X_beta, SQRT3_2, out=X_beta)
+    np.multiply(X_beta, 2/3, out=X_beta)
+
+    np.multiply(X_alpha, cos_t, out=Xd)
+    np.multiply(X_alpha, sin_t, out=Xq)
+    np.multiply(X_beta, sin_t, out=X_alpha)
+    np.add(Xd, X_alpha, out=Xd)
+    np.multiply(X_beta, cos_t, out=X_beta)
+    np.subtract(X_beta, Xq, out=Xq)
+
+    return Xd, Xq
+
+def dq_to_abc_cs(Xd, Xq, cos_t, sin_t, out=None, work=None):
+    # Same as dq_to_abc with cos(theta) and sin(theta) already evaluated.
+    # With out=(Xa, Xb, Xc) and a work tuple holding at least one scratch
+    # array nothing is allocated.
+    if out is None:
+        # Inverse Park transform
+        X_alpha = Xd * cos_t - Xq * sin_t
+        X_beta = Xd * sin_t + Xq * cos_t
+
+        # Inverse Clarke transform
+        Xa = X_alpha
+        Xb = (-X_alpha + SQRT3 * X_beta) / 2
+        Xc = (-X_alpha - SQRT3 * X_beta) / 2
+
+        # Direct Inverse Park Transform (dq -> abc)
+        # Xa = math.cos(theta) * Xd - math.sin(theta) * Xq
+        # Xb = math.cos(theta - 2*math.pi/3) * Xd - math.sin(theta - 2*math.pi/3) * Xq
+        # Xc = math.cos(theta + 2*math.pi/3) * Xd - math.sin(theta + 2*math.pi/3) * Xq
+
+        return Xa, Xb, Xc
+
+    Xa, Xb, Xc = out
+    if work is None:
+        work = (np.empty_like(Xa),)
+    X_beta = work[0]
+
+    np.multiply(Xd, cos_t, out=Xa)
+    np.multiply(Xq, sin_t, out=Xb)
+    np.subtract(Xa, Xb, out=Xa)
+
+    np.multiply(Xd, sin_t, out=X_beta)
+    np.multiply(Xq, cos_t, out=Xb)
+    np.add(X_beta, Xb, out=X_beta)
+    np.multiply(X_beta, SQRT3, out=X_beta)
+
+    # Xb = (-X_alpha + SQRT3 * X_beta) / 2, Xc = (-X_alpha - SQRT3 * X_beta) / 2
+    np.negative(Xa, out=Xc)
+    np.add(Xc, X_beta, out=Xb)
+    np.divide(Xb, 2, out=Xb)
+    np.subtract(Xc, X_beta, out=Xc)
+    np.divide(Xc, 2, out=Xc)
+
     return Xa, Xb, Xc
+
+def rotate_dq(Xd, Xq, cos_d, sin_d):
+    # dq quantities of one frame seen from a frame delta ahead of it; with
+    # the angle-difference identity this is abc_to_dq(dq_to_abc(X, theta), theta + delta)
+    # without going through the phases
+    return Xd * cos_d + Xq * sin_d, -Xd * sin_d + Xq * cos_d
+
+def angle_difference_cs(cos_new, sin_new, cos_old, sin_old):
+    # cos and sin of (new - old) from the cos and sin of both angles
+    return cos_new * cos_old + sin_new * sin_old, sin_new * cos_old - cos_new * sin_old
@@ -0,0 +1,45 @@
+import importlib
+
+# FOC simulator of the BLAC and BLDC motors. Submodules load on first use
+# (Sim.Simulation, Sim.Sweep, ...), so `import Sim` stays cheap and Numba or
+# Matplotlib are only imported by the code that needs them.
+#
+#   import Sim
+#   history = Sim.run_simulation('BLDC', t_end=0.5)
+#
+#   python -m Sim scenarios.json --output-dir results   (see Scenarios.py)
+#   python -m Sim.Simulate                               (plots one run)
+
+_SUBMODULES = (
+    'Autotune', 'BLACMotor', 'BLDCMotor', 'BackEMF', 'BatchSimulator', 'Benchmark',
+    'Checkpoint', 'DQPipeline', 'FOCController', 'FastKernel', 'FrequencyResponse',
+    'Instrumentation', 'Integrators', 'Inverter', 'MultiRateSimulator', 'Profile',
+    'RealTime', 'Recorder', 'ResultCache', 'SVPWMInverter', 'Scenarios', 'SensorModel',
+    'Sensors', 'Simulation', 'SimulationResult', 'SteadyState', 'Sweep', 'TorqueMap',
+    'Transforms',
+)
+
+# Functions re-exported at package level, by defining module; classes stay
+# in their module (Sim.Profile is the module, not the class)
+_EXPORTS = {
+    'run_simulation': 'Simulation',
+    'stream_simulation': 'Simulation',
+    'make_motor': 'Simulation',
+    'make_controller': 'Simulation',
+    'run_scenarios': 'Scenarios',
+    'load_scenarios': 'Scenarios',
+}
+
+__all__ = list(_SUBMODULES) + list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name in _EXPORTS:
+        return getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
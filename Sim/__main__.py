@@ -0,0 +1,4 @@
+import sys
+from .Scenarios import main
+
+sys.exit(main())
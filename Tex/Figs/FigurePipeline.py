@@ -0,0 +1,197 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import numpy as np
+
+# Figures described as plain data (FigureSpec) and rendered by render_all:
+#   - long series are downsampled to about two points per pixel column
+#     (min/max per column, or LTTB) before matplotlib sees them,
+#   - independent figures render in parallel worker processes,
+#   - a PNG whose data and style hash is unchanged is not rendered again,
+#   - matplotlib is only imported by the process that renders.
+
+CACHE_FILE = '.figure_cache.json'
+
+# Same look as the paper figures: LaTeX with Times (matches IEEEtran)
+PAPER_STYLE = {
+    "text.usetex": True,
+    "font.family": "serif",
+    "font.serif": ["Times New Roman"],
+    "text.latex.preamble": r"\usepackage{mathptmx}",
+}
+
+
+def minmax_downsample(x, y, columns):
+    # Keeps the min and the max of every one of `columns` equal-width x
+    # buckets, in their original order, so peaks and envelopes survive
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(x)
+    if n <= 2 * columns:
+        return x, y
+
+    edges = np.linspace(x[0], x[-1], columns + 1)
+    bucket = np.clip(np.searchsorted(edges, x, side='right') - 1, 0, columns - 1)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], n]
+
+    # argmin/argmax per bucket through reduceat on the sorted buckets
+    order_min = np.zeros(len(starts), dtype=int)
+    order_max = np.zeros(len(starts), dtype=int)
+    lo = np.minimum.reduceat(y, starts)
+    hi = np.maximum.reduceat(y, starts)
+    for j, (s, e) in enumerate(zip(starts, ends)):
+        segment = y[s:e]
+        order_min[j] = s + np.flatnonzero(segment == lo[j])[0]
+        order_max[j] = s + np.flatnonzero(segment == hi[j])[0]
+
+    keep = np.unique(np.concatenate((order_min, order_max, [0, n - 1])))
+    return x[keep], y[keep]
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: n_out points that keep the visual shape
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.zeros(n_out, dtype=int)
+    keep[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        s, e = edges[i], edges[i + 1]
+        # Average of the next bucket is the third triangle vertex
+        ns, ne = e, edges[i + 2] if i + 2 < len(edges) else n
+        cx = x[ns:ne].mean()
+        cy = y[ns:ne].mean()
+        area = np.abs((x[a] - cx) * (y[s:e] - y[a]) - (x[a] - x[s:e]) * (cy - y[a]))
+        a = s + int(np.argmax(area))
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def downsample(x, y, columns, method='minmax'):
+    if method == 'minmax':
+        return minmax_downsample(x, y, columns)
+    elif method == 'lttb':
+        return lttb(x, y, 2 * columns)
+    elif method is None:
+        return np.asarray(x), np.asarray(y)
+    raise ValueError("method must be 'minmax', 'lttb' or None")
+
+
+class FigureSpec:
+    # One PNG: a column of axes, each a list of lines plus labels. Line
+    # entries are (x, y, fmt, kwargs) as for Axes.plot.
+
+    def __init__(self, output, figsize=(8, 6), dpi=300, style=None, sharex=True,
+                 downsample='minmax'):
+        self.output = output
+        self.figsize = tuple(figsize)
+        self.dpi = dpi
+        self.style = dict(PAPER_STYLE if style is None else style)
+        self.sharex = sharex
+        self.downsample = downsample
+        self.axes = []
+
+    def add_axes(self, title=None, xlabel=None, ylabel=None, legend=None, grid=None,
+                 tick_size=None, title_size=None, label_size=None):
+        ax = {'lines': [], 'title': title, 'xlabel': xlabel, 'ylabel': ylabel,
+              'legend': legend, 'grid': grid, 'tick_size': tick_size,
+              'title_size': title_size, 'label_size': label_size}
+        self.axes.append(ax)
+        return ax
+
+    def plot(self, ax, x, y, fmt=None, **kwargs):
+        # Downsampled here, in the caller, so workers only receive what they draw
+        columns = int(self.figsize[0] * self.dpi)
+        x, y = downsample(x, y, columns, self.downsample)
+        ax['lines'].append((np.ascontiguousarray(x), np.ascontiguousarray(y), fmt, kwargs))
+
+    def digest(self):
+        # Hash of everything that affects the image
+        h = hashlib.sha256()
+        layout = {'figsize': self.figsize, 'dpi': self.dpi, 'style': self.style, 'sharex': self.sharex,
+                  'axes': [{k: v for k, v in ax.items() if k != 'lines'} for ax in self.axes]}
+        h.update(json.dumps(layout, sort_keys=True, default=str).encode())
+        for ax in self.axes:
+            for x, y, fmt, kwargs in ax['lines']:
+                h.update(np.asarray(x, dtype=float).tobytes())
+                h.update(np.asarray(y, dtype=float).tobytes())
+                h.update(json.dumps([fmt, kwargs], sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+
+def render(spec):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    plt.style.use('default')
+    plt.rcParams.update(spec.style)
+    fig, axes = plt.subplots(len(spec.axes), 1, figsize=spec.figsize, sharex=spec.sharex, squeeze=False)
+
+    for ax, desc in zip(axes[:, 0], spec.axes):
+        for x, y, fmt, kwargs in desc['lines']:
+            ax.plot(x, y, *(() if fmt is None else (fmt,)), **kwargs)
+        if desc['title']:
+            ax.set_title(desc['title'], fontsize=desc['title_size'])
+        if desc['xlabel']:
+            ax.set_xlabel(desc['xlabel'], fontsize=desc['label_size'])
+        if desc['ylabel']:
+            ax.set_ylabel(desc['ylabel'], fontsize=desc['label_size'])
+        if desc['legend']:
+            ax.legend(**desc['legend'])
+        if desc['grid']:
+            ax.grid(True, **desc['grid'])
+        if desc['tick_size']:
+            ax.tick_params(axis='both', which='major', labelsize=desc['tick_size'])
+
+    fig.tight_layout()
+    fig.savefig(spec.output, dpi=spec.dpi)
+    plt.close(fig)
+    return spec.output
+
+
+def _cache_path(spec):
+    return os.path.join(os.path.dirname(os.path.abspath(spec.output)), CACHE_FILE)
+
+
+def _load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def render_all(specs, processes=None, force=False):
+    # Renders every spec whose PNG is missing or out of date, in parallel;
+    # returns the list of outputs actually rendered
+    digests = [spec.digest() for spec in specs]
+    todo = []
+    for spec, digest in zip(specs, digests):
+        cache = _load_cache(_cache_path(spec))
+        if force or not os.path.exists(spec.output) or cache.get(os.path.basename(spec.output)) != digest:
+            todo.append((spec, digest))
+
+    processes = min(len(todo), processes or os.cpu_count() or 1)
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            pool.map(render, [spec for spec, _ in todo])
+    else:
+        for spec, _ in todo:
+            render(spec)
+
+    for spec, digest in todo:
+        path = _cache_path(spec)
+        cache = _load_cache(path)
+        cache[os.path.basename(spec.output)] = digest
+        with open(path, 'w') as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+
+    return [spec.output for spec, _ in todo]
@@ -0,0 +1,13 @@
+import pytest
+from Sim import Autotune
+
+
+@pytest.mark.parametrize('engine', ['objects', 'fast'])
+@pytest.mark.parametrize('motor_type', ['BLAC', 'BLDC'])
+def test_chunked_cost_matches_unchunked(motor_type, engine):
+    # Chunks end on step indices and the ripple mean is carried across
+    # them, so splitting the run changes nothing
+    chunked = Autotune.evaluate(motor_type, {}, t_end=0.5, chunk=0.02, engine=engine)
+    whole = Autotune.evaluate(motor_type, {}, t_end=0.5, chunk=1.0, engine=engine)
+    assert chunked['status'] == whole['status'] == 'done'
+    assert chunked['cost'] == whole['cost']
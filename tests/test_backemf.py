@@ -0,0 +1,8 @@
+import pytest
+from Sim.BackEMF import BackEMFTable
+
+
+def test_trapezoidal_size_must_be_multiple_of_12():
+    assert BackEMFTable.trapezoidal(1200).size == 1200
+    with pytest.raises(ValueError):
+        BackEMFTable.trapezoidal(1000)
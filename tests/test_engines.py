@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from Sim import Simulation, Checkpoint, SensorModel
+from Sim.BatchSimulator import BatchSimulator
+from Sim.Inverter import Inverter
+from Sim.Profile import default_profile
+
+# Equivalences the engines promise, on a short run that crosses the first
+# load step (t = 0.2 s) of the default profile
+
+Ts = 1e-4
+T_END = 0.25
+CHANNELS = ('time', 'rpm_ref', 'rpm_act', 'Iq', 'Id', 'Te', 'Tload', 'Vbus')
+
+
+def objects_run(motor_type, t_end=T_END):
+    return Simulation.run_simulation(motor_type, Ts, t_end, engine='objects')
+
+
+def assert_same(history, reference):
+    for name in CHANNELS:
+        np.testing.assert_array_equal(history[name], reference[name], err_msg=name)
+
+
+@pytest.mark.parametrize('motor_type', ['BLAC', 'BLDC'])
+def test_fast_matches_objects(motor_type):
+    assert_same(Simulation.run_simulation(motor_type, Ts, T_END, engine='fast'), objects_run(motor_type))
+
+
+def test_batch_matches_objects():
+    batch = BatchSimulator(Ts, 2, ['BLAC', 'BLDC'])
+    history = batch.run(T_END)
+    for motor_type, member in zip(['BLAC', 'BLDC'], batch.split(history)):
+        assert_same(member, objects_run(motor_type))
+
+
+@pytest.mark.parametrize('engine', ['objects', 'fast'])
+def test_checkpoint_branch_matches_full_run(engine):
+    snapshot, prefix = Checkpoint.run_prefix('BLDC', 0.1, Ts, engine=engine)
+    history = Checkpoint.branch(snapshot, default_profile, T_END, engine, prefix)
+    assert_same(history, objects_run('BLDC'))
+
+
+@pytest.mark.parametrize('motor_type', ['BLAC', 'BLDC'])
+def test_dq_matches_objects_to_rounding(motor_type):
+    history = Simulation.run_simulation(motor_type, Ts, T_END, engine='dq')
+    reference = objects_run(motor_type)
+    for name in CHANNELS:
+        np.testing.assert_allclose(history[name], reference[name], rtol=0, atol=1e-9, err_msg=name)
+
+
+def test_batch_sensors_match_scalar_sensors():
+    kwargs = {'seed': 7, 'dither': True}
+    batch = BatchSimulator(Ts, 2, 'BLAC', sensors=SensorModel.BatchSensorModel(Ts, 2, **kwargs))
+    history = batch.run(T_END)
+    for i, member in enumerate(batch.split(history)):
+        motor = Simulation.make_motor('BLAC', Ts)
+        controller = Simulation.make_controller(Ts)
+        sensors = SensorModel.SensorModel(Ts, member=i, **kwargs)
+        reference = SensorModel.run_loop(motor, controller, Inverter(), sensors, default_profile, T_END)
+        assert_same(member, reference)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from Sim import Simulation, Integrators
+from Sim.Inverter import Inverter
+from Sim.Profile import Profile, Signal
+from Sim.Sensors import Sensors
+
+# Fixed phase voltages with a q component, so the rotor moves and the
+# back-EMF and mechanics take part
+V = (0.0, -30.0, 30.0)
+T = 0.01
+
+
+def fixed_voltage_run(motor_type, integrator, h):
+    motor = Simulation.make_motor(motor_type, h, integrator=integrator)
+    for _ in range(int(round(T / h))):
+        Integrators.advance(motor, *V, 0.0, h)
+    return np.array([motor.Id, motor.Iq, motor.Wr])
+
+
+@pytest.mark.parametrize('motor_type', ['BLAC', 'BLDC'])
+def test_rk4_and_exp_converge_to_fine_euler(motor_type):
+    reference = fixed_voltage_run(motor_type, 'euler', 1e-7)
+
+    # rk4 is down to the error of the Euler reference itself
+    for h in (1e-4, 1e-5):
+        np.testing.assert_allclose(fixed_voltage_run(motor_type, 'rk4', h), reference, atol=2e-4)
+
+    # exp keeps the Euler mechanics: first order, the error drops with h
+    coarse = np.max(np.abs(fixed_voltage_run(motor_type, 'exp', 1e-4) - reference))
+    fine = np.max(np.abs(fixed_voltage_run(motor_type, 'exp', 1e-5) - reference))
+    assert fine < 2e-3
+    assert fine < coarse / 5
+
+
+class FixedVoltageController:
+    Ts = 1e-4
+
+    def control_step(self, RPMref, Wr, Ia, Ib, Ic, theta_e, Vbus):
+        return V
+
+
+def test_run_with_events_applies_load_at_breakpoint():
+    Ts = FixedVoltageController.Ts
+    t_step = 23.4 * Ts  # inside step 23
+    profile = Profile(Tload=Signal(0.0).hold(t_step, 0.5), Vbus=100.0)
+
+    history = Integrators.run_with_events(Simulation.make_motor('BLAC', Ts, integrator='exp'),
+                                          FixedVoltageController(), Inverter(), Sensors(), profile, 0.005)
+    late = Integrators.run_with_events(Simulation.make_motor('BLAC', Ts, integrator='exp'),
+                                       FixedVoltageController(), Inverter(), Sensors(), profile, 0.005,
+                                       breakpoints=())
+
+    # Same plant integrated by hand, split at the load step
+    motor = Simulation.make_motor('BLAC', Ts, integrator='exp')
+    Wr = []
+    for k in range(history.num_steps):
+        t = k * Ts
+        t_next = t + Ts
+        if t < t_step < t_next:
+            motor.advance(*V, 0.0, t_step - t)
+            motor.advance(*V, 0.5, t_next - t_step)
+        else:
+            motor.advance(*V, profile.Tload(0.5 * (t + t_next)), t_next - t)
+        Wr.append(motor.Wr)
+    np.testing.assert_array_equal(history['Wr'], Wr)
+
+    # Without the breakpoint the load covers all of step 23
+    np.testing.assert_array_equal(late['Wr'][:23], history['Wr'][:23])
+    assert late['Wr'][23] < history['Wr'][23]
+
+
+def test_zoh_table_rebuilt_on_parameter_change():
+    motor = Simulation.make_motor('BLAC', 1e-4, integrator='zoh_table')
+    table = Integrators.zoh_table(motor)
+    assert Integrators.zoh_table(motor) is table
+
+    for name, value in (('Rs', 5.0), ('Ld', 0.02), ('Lq', 0.02), ('Ts', 5e-5)):
+        setattr(motor, name, value)
+        rebuilt = Integrators.zoh_table(motor)
+        assert rebuilt is not table
+        assert rebuilt.key() == (motor.Rs, motor.Ld, motor.Lq, motor.Ts, motor.We_step)
+        # Same parameters again: cache hit
+        assert Integrators.zoh_table(motor) is rebuilt
+        table = rebuilt
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from Sim.Profile import Profile, Signal
+
+
+def values(signal, times):
+    # Scalar and vectorized evaluation must agree
+    scalar = [signal(t) for t in times]
+    np.testing.assert_array_equal(signal.evaluate(times), scalar)
+    return scalar
+
+
+def test_step_applies_after_its_time():
+    signal = Signal(1.0).hold(0.2, 3.0)
+    assert values(signal, [0.0, 0.2, np.nextafter(0.2, 1.0), 0.3]) == [1.0, 1.0, 3.0, 3.0]
+
+
+def test_ramp_reaches_its_end_value():
+    signal = Signal(2.0).ramp(0.1, 0.3, 6.0)
+    out = values(signal, [0.1, 0.2, 0.3, 0.4])
+    assert out[0] == 2.0
+    assert out[1] == pytest.approx(4.0)
+    assert out[2] == pytest.approx(6.0)
+    assert out[3] == 6.0
+
+
+def test_last_segment_is_held():
+    signal = Signal(0.0).hold(0.1, 5.0).hold(0.2, -1.0)
+    assert values(signal, [0.25, 1.0, 100.0]) == [-1.0, -1.0, -1.0]
+
+
+def test_from_dict_matches_builder():
+    spec = {
+        'RPMref': {'initial': 40.0, 'segments': [['hold', 0.4, 80.0], ['ramp', 0.6, 0.7, 20.0]]},
+        'Tload': {'times': [0.0, 0.2, 0.5], 'values': [0.0, 20.0, 5.0]},
+        'Vbus': 300.0,
+    }
+    profile = Profile.from_dict(spec)
+    expected = Profile(RPMref=Signal(40.0).hold(0.4, 80.0).ramp(0.6, 0.7, 20.0),
+                       Tload=Signal.from_series([0.0, 0.2, 0.5], [0.0, 20.0, 5.0]),
+                       Vbus=300.0)
+
+    t = np.array([0.0, 0.2, 0.2001, 0.4, 0.4001, 0.65, 0.7, 0.5, 0.9])
+    for a, b in zip(profile.evaluate(t), expected.evaluate(t)):
+        np.testing.assert_array_equal(a, b)
+    assert profile.cache_key() == expected.cache_key()
+    # Series samples follow the same t > t0 convention as the segments
+    np.testing.assert_array_equal(profile.Tload.evaluate([0.2, 0.2001, 0.5, 0.5001]), [0.0, 20.0, 20.0, 5.0])
+
+    assert Profile.from_dict('default').cache_key() == Profile.default().cache_key()
+    with pytest.raises(ValueError):
+        Profile.from_dict({'Iref': 1.0})
+    with pytest.raises(ValueError):
+        Profile.from_dict({'RPMref': {'segments': [['step', 0.1, 1.0]]}})
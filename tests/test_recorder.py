@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from Sim.Recorder import StreamRecorder, StreamReader
+
+
+def test_decimation_and_envelope_round_trip(tmp_path):
+    n = 103  # not a whole number of decimation blocks
+    time = np.arange(n) * 1e-4
+    x = np.sin(2 * np.pi * 50 * time)
+    x[41] = 5.0  # short peak between two kept samples
+    y = np.cos(2 * np.pi * 50 * time)
+
+    recorder = StreamRecorder(str(tmp_path), channels=('time', 'x', 'y'), chunk_size=10,
+                              decimation={'x': 4})
+    assert recorder.chunk_size == 12  # rounded up to whole blocks
+    for k in range(30):
+        recorder.append(time[k], x[k], y[k])
+    recorder.extend({'time': time[30:], 'x': x[30:], 'y': y[30:]})
+
+    # A live reader only sees the flushed chunks
+    reader = StreamReader(str(tmp_path))
+    assert not reader.complete
+    assert reader.index['samples'] == 96
+    recorder.close()
+    reader.refresh()
+    assert reader.complete
+
+    np.testing.assert_array_equal(reader['time'], time)
+    np.testing.assert_array_equal(reader['y'], y)
+    assert reader.decimation('x') == 4
+    np.testing.assert_array_equal(reader['x'], x[::4])
+
+    # The envelope bounds every block of 4, the last one partial
+    low, high = reader.envelope('x')
+    blocks = [x[i:i + 4] for i in range(0, n, 4)]
+    np.testing.assert_array_equal(low, [b.min() for b in blocks])
+    np.testing.assert_array_equal(high, [b.max() for b in blocks])
+    assert high[41 // 4] == 5.0
+    assert np.all(low <= reader['x']) and np.all(reader['x'] <= high)
+
+    with pytest.raises(KeyError):
+        reader.envelope('y')
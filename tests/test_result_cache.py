@@ -0,0 +1,62 @@
+import os
+import time
+import numpy as np
+from Sim import Simulation
+from Sim.Profile import Profile, Signal
+from Sim.ResultCache import ResultCache
+
+Ts = 1e-4
+T_END = 0.02
+CHANNELS = ('time', 'rpm_ref', 'rpm_act', 'Iq', 'Id', 'Te', 'Tload', 'Vbus')
+
+
+def entries(directory):
+    return sorted(name for name in os.listdir(directory) if not name.startswith('.'))
+
+
+def run(cache, **kwargs):
+    return Simulation.run_simulation('BLAC', Ts, T_END, engine='objects', cache=cache, **kwargs)
+
+
+def test_hit_returns_identical_data(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    reference = run(None)
+    stored = run(cache)
+    hit = run(cache)
+    assert len(entries(tmp_path)) == 1
+    for name in CHANNELS:
+        np.testing.assert_array_equal(stored[name], reference[name], err_msg=name)
+        np.testing.assert_array_equal(hit[name], reference[name], err_msg=name)
+
+
+def test_key_follows_motor_controller_and_profile(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    run(cache)
+    run(cache, motor_params={'Rs': 5.0})
+    run(cache, controller_params={'Kps': 0.5})
+    run(cache, profile=Profile(RPMref=Signal(40.0).hold(0.01, 60.0), Tload=0.0))
+    assert len(entries(tmp_path)) == 4
+
+    # Same inputs again, and the engines with identical histories: all hits
+    run(cache, motor_params={'Rs': 5.0})
+    Simulation.run_simulation('BLAC', Ts, T_END, engine='fast', cache=cache)
+    assert len(entries(tmp_path)) == 4
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    history = run(None)
+    cache.put('a', history)
+    size = cache.size()
+
+    cache.max_bytes = 2 * size
+    cache.put('b', history)
+    now = time.time()
+    os.utime(tmp_path / 'a', (now - 100, now - 100))
+    os.utime(tmp_path / 'b', (now - 50, now - 50))
+
+    # Reading 'a' makes 'b' the least recently used entry
+    assert cache.get('a') is not None
+    cache.put('c', history)
+    assert entries(tmp_path) == ['a', 'c']
+    assert cache.size() <= cache.max_bytes
@@ -0,0 +1,30 @@
+import json
+from Sim import Scenarios
+
+
+def test_cli_records_failures_and_continues(tmp_path):
+    spec = {
+        'defaults': {'Ts': 1e-4, 't_end': 0.05, 'engine': 'objects'},
+        'scenarios': [
+            {'name': 'blac', 'motor_type': 'BLAC'},
+            {'name': 'broken', 'motor_type': 'PMSM'},
+            {'name': 'bldc', 'motor_type': 'BLDC', 'outputs': ['npz', 'result', 'metrics']},
+        ],
+    }
+    path = tmp_path / 'scenarios.json'
+    path.write_text(json.dumps(spec))
+    output_dir = tmp_path / 'results'
+
+    assert Scenarios.main([str(path), '--output-dir', str(output_dir), '--quiet']) == 1
+
+    with open(output_dir / 'summary.jsonl') as f:
+        rows = [json.loads(line) for line in f]
+    assert [(row['name'], row['status']) for row in rows] == [
+        ('blac', 'ok'), ('broken', 'error'), ('bldc', 'ok')]
+    assert 'Invalid motor type' in rows[1]['error']
+    assert rows[0]['steps'] == 500
+    assert set(rows[2]['metrics']) == set(Scenarios.METRICS)
+    # Shorter than the default profile's load step: the ripple window follows the run
+    assert rows[2]['metrics']['torque_ripple'] is not None
+    assert (output_dir / 'blac.npz').exists()
+    assert (output_dir / 'bldc' / 'data.npy').exists()
@@ -0,0 +1,36 @@
+import numpy as np
+from Sim import Simulation
+from Sim.SimulationResult import SimulationResult, STATE_FIELDS
+
+CHANNELS = ('time', 'rpm_ref', 'rpm_act', 'Iq', 'Id', 'Te', 'Tload', 'Vbus')
+
+
+def short_run():
+    # Crosses the first load step of the default profile
+    return Simulation.run_simulation('BLDC', 1e-4, 0.25, engine='objects')
+
+
+def test_save_load_mmap_round_trip(tmp_path):
+    history = short_run()
+    history.save(str(tmp_path))
+    loaded = SimulationResult.load(str(tmp_path), mmap_mode='r')
+
+    assert isinstance(loaded.data, np.memmap)
+    assert (loaded.Ts, loaded.start, loaded.Npp) == (history.Ts, history.start, history.Npp)
+    for name in CHANNELS + ('theta_e', 'Ia'):
+        np.testing.assert_array_equal(loaded[name], history[name], err_msg=name)
+
+
+def test_astype_float32():
+    history = short_run()
+    single = history.astype(np.float32)
+
+    for name in STATE_FIELDS:
+        assert single[name].dtype == np.float32
+        np.testing.assert_array_equal(single[name], history[name].astype(np.float32))
+    # The run-length encoded inputs are kept exactly
+    for name in ('rpm_ref', 'Tload', 'Vbus'):
+        assert single.inputs[name] is history.inputs[name]
+        np.testing.assert_array_equal(single[name], history[name])
+    assert single.inputs['Tload'].starts.tolist() == [0, 2001]
+    assert single.nbytes < history.nbytes
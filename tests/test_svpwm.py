@@ -0,0 +1,58 @@
+import math
+import pytest
+from Sim.Inverter import Inverter
+from Sim.SVPWMInverter import SVPWMInverter
+
+Vbus = 24.0
+T = 1e-4
+
+
+def balanced(amplitude, angle):
+    return tuple(amplitude * math.cos(angle - k * 2 * math.pi / 3) for k in range(3))
+
+
+@pytest.mark.parametrize('zero_split', [0.0, 0.3, 0.5, 1.0])
+def test_switching_times_duties(zero_split):
+    refs = balanced(9.0, 0.7)
+    edges = SVPWMInverter(zero_split=zero_split).switching_times(*refs, Vbus, T)
+    duties = [(off - on) / T for on, off in edges]
+
+    # Line-to-line duties follow the references, the zero vector takes the rest
+    span = max(refs) - min(refs)
+    zero = 1.0 - span / Vbus
+    for duty, v in zip(duties, refs):
+        assert duty == pytest.approx((v - min(refs)) / Vbus + zero_split * zero)
+    assert sum(duties) == pytest.approx(sum((v - min(refs)) / Vbus for v in refs) + 3 * zero_split * zero)
+    # Center-aligned; a leg with no on-time stays low from T
+    for (on, off), duty in zip(edges, duties):
+        assert on + off == pytest.approx(T if duty > 0 else 2 * T)
+
+
+def test_switching_times_zero_split_clamps_a_leg():
+    refs = balanced(9.0, 0.7)
+    low = min(range(3), key=lambda i: refs[i])
+    high = max(range(3), key=lambda i: refs[i])
+    assert SVPWMInverter(zero_split=0.0).switching_times(*refs, Vbus, T)[low] == (T, T)
+    assert SVPWMInverter(zero_split=1.0).switching_times(*refs, Vbus, T)[high] == (0.0, T)
+
+
+def test_switching_times_dead_time():
+    refs = balanced(9.0, 0.7)
+    dead_time = 1e-6
+    ideal = SVPWMInverter().switching_times(*refs, Vbus, T)
+    edges = SVPWMInverter(dead_time).switching_times(*refs, Vbus, T, currents=(2.0, -2.0, 0.0))
+
+    # Positive current delays the rising edge, negative the falling one
+    assert edges[0] == pytest.approx((ideal[0][0] + dead_time, ideal[0][1]))
+    assert edges[1] == pytest.approx((ideal[1][0], ideal[1][1] + dead_time))
+    assert edges[2] == ideal[2]
+
+
+@pytest.mark.parametrize('angle', [0.0, 0.4, 1.3, 2.9, 4.1, 5.5])
+def test_step_average_matches_inverter(angle):
+    # Inside the voltage hexagon and the clamp of Inverter, the period
+    # average of the switched voltages is the averaged inverter output
+    refs = balanced(11.0, angle)
+    svpwm = SVPWMInverter()
+    assert svpwm.step(*refs, Vbus) == pytest.approx(Inverter().step(*refs, Vbus), abs=1e-12)
+    assert svpwm.saturated == 0